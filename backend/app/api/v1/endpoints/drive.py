@@ -9,11 +9,16 @@ from fastapi.responses import Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.core.config import RESULTS_DIR
+from app.core.config import JOB_INPROCESS_WORKERS, RESULTS_DIR
 from app.db.session import get_db
 from app.integrations.gdrive.client import get_credentials_status
 from app.integrations.gdrive.service import upload_file_to_drive
-from app.modules.jobs.service import sync_drive_links, upload_drive_link_for_job
+from app.modules.jobs.service import (
+    prepare_drive_backfill,
+    queue_drive_backfill,
+    sync_drive_links,
+    upload_drive_link_for_job,
+)
 
 router = APIRouter(prefix="/drive", tags=["drive"])
 logger = logging.getLogger(__name__)
@@ -43,8 +48,17 @@ class DriveJobUploadOut(BaseModel):
 def sync_drive(
     limit: int | None = None,
     force: bool = False,
+    background: bool = False,
     db: Session = Depends(get_db),
 ):
+    if background:
+        # Low-priority lane on the job workers' upload stage.
+        if force or not JOB_INPROCESS_WORKERS:
+            raise HTTPException(400, "Background sync needs in-process workers and no force")
+        job_ids = prepare_drive_backfill(db, limit=limit)
+        queue_drive_backfill(job_ids)
+        return {"queued": len(job_ids), "job_ids": job_ids}
+
     try:
         return sync_drive_links(db, limit=limit, force=force)
     except RuntimeError as e:
@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session
 from app.core.config import APP_DIR, RESULTS_DIR, COMPRESSED_DIR
 from app.db.session import get_db
 from app.modules.jobs.model import Job
+from app.modules.jobs.result_cache import RESULT_CACHE
 from app.modules.sessions.model import PhotoSession
 from app.modules.users.model import User
 
@@ -112,7 +113,7 @@ def _build_delete_plan(db: Session, *, start_utc: datetime, end_utc: datetime) -
     missing_files_count = 0
 
     for job in jobs:
-        for image_path in (job.result_image_path, job.compressed_image_path):
+        for image_path in (job.result_image_path, job.compressed_image_path, job.raw_result_path):
             if not image_path:
                 continue
             resolved = _resolve_result_file(image_path)
@@ -233,6 +234,12 @@ def execute_delete(payload: EventDeleteIn, db: Session = Depends(get_db)):
         except Exception as e:
             file_delete_warnings.append(f"{path.name}: {e}")
 
+    # Cached generations are guest photos too.
+    try:
+        RESULT_CACHE.clear()
+    except Exception as e:
+        file_delete_warnings.append(f"result cache: {e}")
+
     return EventDeleteExecuteOut(
         jobs_deleted_count=jobs_deleted_count,
         result_files_target_count=len(plan.result_files),
@@ -1,25 +1,91 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.core.config import JOB_INPROCESS_WORKERS
 from app.db.session import get_db
-from app.modules.jobs.schema import JobCreateIn, JobOut
-from app.modules.jobs.service import create_job, process_job_seeddream_safe
+from app.modules.jobs.executor import dispatch_job, get_job_executor, job_queue_is_full
+from app.modules.jobs.overlay_cache import OVERLAY_CACHE
+from app.modules.jobs.queue_store import count_queued_jobs
+from app.modules.jobs.schema import (
+    JobBatchCreateIn,
+    JobBatchOut,
+    JobCreateIn,
+    JobOut,
+    JobQueueStatsOut,
+    JobTimingsOut,
+)
+from app.modules.jobs.service import (
+    cancel_job,
+    create_job,
+    create_job_batch,
+    find_job_by_idempotency_key,
+    job_phase_stats,
+    retry_job,
+)
 from app.modules.jobs.model import Job
+from app.utils.single_flight import KeyedLock
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+# Requests sharing an Idempotency-Key wait for the first one, then replay its job.
+_creating = KeyedLock()
+
+
+def _created_job_out(job: Job) -> JobOut:
+    return JobOut(
+        job_id=job.id,
+        session_id=job.session_id,
+        status=job.status,
+        mode=job.mode or "event",
+        overlay_url=job.overlay_image_path,
+        priority=job.priority,
+    )
+
+
+def _replay_job(db: Session, idempotency_key: str, session_id: int) -> Job | None:
+    try:
+        return find_job_by_idempotency_key(db, idempotency_key, session_id)
+    except ValueError:
+        raise HTTPException(409, "Idempotency-Key was used for another session")
+
+
 @router.post("", response_model=JobOut)
 def create_job_endpoint(
     payload: JobCreateIn,
-    background: BackgroundTasks,
     db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(None, max_length=128),
 ):
+    if not idempotency_key:
+        return _create_job(db, payload, None)
+
+    with _creating.hold(idempotency_key):
+        job = _replay_job(db, idempotency_key, payload.session_id)
+        if job:
+            return _created_job_out(job)
+        try:
+            return _create_job(db, payload, idempotency_key)
+        except IntegrityError:
+            # Same key created by another process in the meantime.
+            db.rollback()
+            job = _replay_job(db, idempotency_key, payload.session_id)
+            if not job:
+                raise
+            return _created_job_out(job)
+
+
+def _create_job(db: Session, payload: JobCreateIn, idempotency_key: str | None) -> JobOut:
+    if job_queue_is_full(db):
+        raise HTTPException(503, "Job queue is full, please retry shortly")
+
     try:
         job = create_job(
             db,
             payload.session_id,
             mode=payload.mode,
             overlay_url=payload.overlay_url,
+            priority=payload.priority,
+            idempotency_key=idempotency_key,
         )
     except ValueError as e:
         msg = str(e)
@@ -35,16 +101,77 @@ def create_job_endpoint(
             raise HTTPException(404, "Overlay not found")
         raise
 
-    background.add_task(process_job_seeddream_safe, job.id, payload.mode)
+    dispatch_job(job.id, payload.mode)
+    return _created_job_out(job)
 
-    return JobOut(
-        job_id=job.id,
-        session_id=job.session_id,
-        status=job.status,
-        mode=job.mode or "event",
-        overlay_url=job.overlay_image_path,
+@router.post("/batch", response_model=JobBatchOut)
+def create_job_batch_endpoint(
+    payload: JobBatchCreateIn,
+    db: Session = Depends(get_db),
+):
+    if job_queue_is_full(db):
+        raise HTTPException(503, "Job queue is full, please retry shortly")
+
+    try:
+        jobs = create_job_batch(
+            db,
+            payload.session_id,
+            payload.theme_ids,
+            mode=payload.mode,
+            overlay_url=payload.overlay_url,
+            priority=payload.priority,
+        )
+    except ValueError as e:
+        msg = str(e)
+        if msg == "SESSION_NOT_FOUND":
+            raise HTTPException(404, "Session not found")
+        if msg == "PHOTO_NOT_UPLOADED":
+            raise HTTPException(400, "Photo not uploaded")
+        if msg == "THEME_NOT_FOUND":
+            raise HTTPException(404, "Theme not found")
+        if msg == "OVERLAY_INVALID":
+            raise HTTPException(400, "Overlay path is invalid")
+        if msg == "OVERLAY_NOT_FOUND":
+            raise HTTPException(404, "Overlay not found")
+        raise
+
+    # Each job gets its own worker, so the styles generate side by side and
+    # share one encoded copy of the photo.
+    for job in jobs:
+        dispatch_job(job.id, payload.mode)
+
+    return JobBatchOut(
+        session_id=payload.session_id,
+        jobs=[
+            JobOut(
+                job_id=job.id,
+                session_id=job.session_id,
+                status=job.status,
+                mode=job.mode or "event",
+                theme_id=job.theme_id,
+                overlay_url=job.overlay_image_path,
+                priority=job.priority,
+            )
+            for job in jobs
+        ],
     )
 
+@router.get("/queue", response_model=JobQueueStatsOut)
+def get_job_queue_stats(db: Session = Depends(get_db)):
+    stats = get_job_executor().stats()
+    stats["queued_in_db"] = count_queued_jobs(db)
+    stats["inprocess"] = JOB_INPROCESS_WORKERS
+    stats["overlay_cache"] = OVERLAY_CACHE.stats()
+    return stats
+
+@router.get("/timings", response_model=JobTimingsOut)
+def get_job_timings(
+    limit: int = Query(default=500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    # Where a generation's seconds go: encode, connect, upload, ttfb, generate, download.
+    return job_phase_stats(db, limit=limit)
+
 @router.get("/{job_id}", response_model=JobOut)
 def get_job(job_id: int, db: Session = Depends(get_db)):
     job = db.query(Job).filter(Job.id == job_id).first()
@@ -56,6 +183,7 @@ def get_job(job_id: int, db: Session = Depends(get_db)):
         session_id=job.session_id,
         status=job.status,
         mode=job.mode or "event",
+        theme_id=job.theme_id,
         overlay_url=job.overlay_image_path,
         result_url=job.result_image_path,
         drive_link=job.drive_link,
@@ -63,4 +191,62 @@ def get_job(job_id: int, db: Session = Depends(get_db)):
         qr_url=job.qr_url,
         error_message=job.error_message,
         log_text=job.log_text,
+        checkpoint_stage=job.checkpoint_stage,
+        priority=job.priority,
+        phase_timings=job.phase_timings,
+    )
+
+@router.post("/{job_id}/retry", response_model=JobOut)
+def retry_job_endpoint(
+    job_id: int,
+    priority: int | None = Query(default=None, ge=0, le=100),
+    db: Session = Depends(get_db),
+):
+    # Admin re-renders pass priority=50 (bulk lane) to stay behind live guests.
+    try:
+        job = retry_job(db, job_id, priority=priority)
+    except ValueError as e:
+        msg = str(e)
+        if msg == "JOB_NOT_FOUND":
+            raise HTTPException(404, "Job not found")
+        if msg == "JOB_NOT_RETRYABLE":
+            raise HTTPException(
+                409, "Only failed or cancelled jobs whose last run has stopped can be retried"
+            )
+        raise
+
+    dispatch_job(job.id)
+
+    return JobOut(
+        job_id=job.id,
+        session_id=job.session_id,
+        status=job.status,
+        mode=job.mode or "event",
+        overlay_url=job.overlay_image_path,
+        checkpoint_stage=job.checkpoint_stage,
+        priority=job.priority,
+    )
+
+@router.delete("/{job_id}", response_model=JobOut)
+@router.post("/{job_id}/cancel", response_model=JobOut)
+def cancel_job_endpoint(job_id: int, db: Session = Depends(get_db)):
+    try:
+        job = cancel_job(db, job_id)
+    except ValueError as e:
+        msg = str(e)
+        if msg == "JOB_NOT_FOUND":
+            raise HTTPException(404, "Job not found")
+        if msg == "JOB_NOT_CANCELLABLE":
+            raise HTTPException(409, "Job already finished")
+        raise
+
+    return JobOut(
+        job_id=job.id,
+        session_id=job.session_id,
+        status=job.status,
+        mode=job.mode or "event",
+        overlay_url=job.overlay_image_path,
+        error_message=job.error_message,
+        checkpoint_stage=job.checkpoint_stage,
+        priority=job.priority,
     )
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db
+from app.integrations.seeddream_breaker import SHARED_BREAKER_STATE
+from app.modules.jobs.queue_store import count_queued_jobs
+from app.modules.jobs.result_cache import RESULT_CACHE
+from app.utils.encode import encode_cache_stats
+
+router = APIRouter(prefix="/seeddream", tags=["seeddream"])
+
+
+class SeedDreamPoolOut(BaseModel):
+    http2: bool
+    max_connections: int
+    max_keepalive: int
+    keepalive_seconds: float
+    clients: int
+    in_flight: int
+    peak_in_flight: int
+    requests: int
+    errors: int
+    connections: int
+    connections_idle: int
+    connections_active: int
+    limiter: dict = {}
+    breaker: dict = {}
+    input_cache: dict = {}
+    result_cache: dict = {}
+
+
+class SeedDreamHealthOut(BaseModel):
+    available: bool
+    state: str
+    retry_after_seconds: float
+    consecutive_failures: int
+    queued_jobs: int
+
+
+def _client():
+    try:
+        from app.integrations.seeddream_client import get_seeddream_client
+    except RuntimeError as e:
+        raise HTTPException(503, str(e))
+    return get_seeddream_client()
+
+
+@router.get("/pool", response_model=SeedDreamPoolOut)
+def seeddream_pool():
+    # Compare peak_in_flight / connections_active with max_connections when
+    # sizing SEEDDREAM_MAX_CONNECTIONS for the event's peak.
+    return {
+        **_client().pool_stats(),
+        "input_cache": encode_cache_stats(),
+        "result_cache": RESULT_CACHE.stats(),
+    }
+
+
+@router.get("/health", response_model=SeedDreamHealthOut)
+def seeddream_health(db: Session = Depends(get_db)):
+    # Polled by the kiosk: while `available` is false, queued jobs are held
+    # (not failed) and resume on their own once a probe call succeeds. Read
+    # from the shared state: the calls may run in separate worker processes.
+    breaker = SHARED_BREAKER_STATE.snapshot()
+    return {
+        "available": breaker["state"] != "open",
+        "state": breaker["state"],
+        "retry_after_seconds": breaker["retry_after_seconds"],
+        "consecutive_failures": breaker["consecutive_failures"],
+        "queued_jobs": count_queued_jobs(db),
+    }
+
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, Header, UploadFile
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
@@ -10,7 +11,11 @@ from app.modules.sessions.schema import (
     SessionOut,
     UserOut,
 )
-from app.modules.sessions.service import start_session, set_session_theme
+from app.modules.sessions.service import (
+    find_session_by_idempotency_key,
+    set_session_theme,
+    start_session,
+)
 from app.modules.sessions.model import PhotoSession
 
 from app.modules.users.model import User
@@ -18,9 +23,13 @@ from app.modules.jobs.model import Job
 from app.modules.jobs.schema import JobOut
 
 from app.utils.files import save_upload_file
+from app.utils.single_flight import KeyedLock
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
+# Requests sharing an Idempotency-Key wait for the first one, then replay its session.
+_starting = KeyedLock()
+
 
 def build_session_out(db: Session, s: PhotoSession) -> SessionOut:
     user = db.query(User).filter(User.id == s.user_id).first()
@@ -56,11 +65,37 @@ def build_session_out(db: Session, s: PhotoSession) -> SessionOut:
     )
 
 
+def _replay_session(db: Session, idempotency_key: str, email: str) -> PhotoSession | None:
+    try:
+        return find_session_by_idempotency_key(db, idempotency_key, email)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was used for another guest")
+
+
 @router.post("/start", response_model=SessionOut)
-def start(payload: SessionStartIn, db: Session = Depends(get_db)):
-    s = start_session(db, payload)
-    db.refresh(s)
-    return build_session_out(db, s)
+def start(
+    payload: SessionStartIn,
+    db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(None, max_length=128),
+):
+    if not idempotency_key:
+        s = start_session(db, payload)
+        db.refresh(s)
+        return build_session_out(db, s)
+
+    with _starting.hold(idempotency_key):
+        s = _replay_session(db, idempotency_key, payload.email)
+        if s is None:
+            try:
+                s = start_session(db, payload, idempotency_key=idempotency_key)
+            except IntegrityError:
+                # Same key created by another process in the meantime.
+                db.rollback()
+                s = _replay_session(db, idempotency_key, payload.email)
+                if s is None:
+                    raise
+        db.refresh(s)
+        return build_session_out(db, s)
 
 
 @router.get("/{session_id}", response_model=SessionOut)
@@ -10,6 +10,7 @@ from app.api.v1.endpoints.printer import router as printer_router
 from app.api.v1.endpoints.settings import router as settings_router
 from app.api.v1.endpoints.token_estimator import router as token_estimator_router
 from app.api.v1.endpoints.event_maintenance import router as event_maintenance_router
+from app.api.v1.endpoints.seeddream import router as seeddream_router
 
 
 api_router = APIRouter(prefix="/api/v1")
@@ -24,3 +25,4 @@ api_router.include_router(printer_router)
 api_router.include_router(settings_router)
 api_router.include_router(token_estimator_router)
 api_router.include_router(event_maintenance_router)
+api_router.include_router(seeddream_router)
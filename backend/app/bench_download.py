@@ -0,0 +1,116 @@
+# Segmented vs single-stream download benchmark: python -m app.bench_download [--segments 4]
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from app.utils.files import save_image_from_url
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Download a stand-in result from a local HTTP server that caps each "
+            "connection's throughput (like a window-limited, high-latency link)."
+        ),
+    )
+    parser.add_argument("--size-mb", type=float, default=10, help="result size")
+    parser.add_argument("--per-connection-mbps", type=float, default=40, help="cap per connection, Mbit/s")
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 4], help="segment counts to compare")
+    parser.add_argument("--runs", type=int, default=3, help="downloads per segment count")
+    return parser.parse_args(argv)
+
+
+def serve_payload(
+    payload: bytes, *, bytes_per_second: float | None = None, ranges: bool = True
+) -> ThreadingHTTPServer:
+    """Local stand-in for the result CDN, serving `payload` on a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _headers(self, status: int, length: int, content_range: str | None = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(length))
+            if ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            if content_range:
+                self.send_header("Content-Range", content_range)
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._headers(200, len(payload))
+
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            range_header = self.headers.get("Range")
+            if ranges and range_header and range_header.startswith("bytes="):
+                first, _, last = range_header[6:].partition("-")
+                start = int(first)
+                end = min(int(last), end) if last else end
+                self._headers(206, end + 1 - start, f"bytes {start}-{end}/{len(payload)}")
+            else:
+                self._headers(200, len(payload))
+
+            step = 64 * 1024
+            for offset in range(start, end + 1, step):
+                chunk = payload[offset : min(offset + step, end + 1)]
+                self.wfile.write(chunk)
+                if bytes_per_second:
+                    time.sleep(len(chunk) / bytes_per_second)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    payload = bytes(range(256)) * int(args.size_mb * 1024 * 1024 / 256)
+    server = serve_payload(payload, bytes_per_second=args.per_connection_mbps * 1_000_000 / 8)
+    url = f"http://127.0.0.1:{server.server_address[1]}/result.jpg"
+    print(
+        f"[BENCH] {len(payload) // 1024} KB result, "
+        f"{args.per_connection_mbps:g} Mbit/s per connection"
+    )
+
+    medians = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for segments in args.segments:
+                times = []
+                for _ in range(args.runs):
+                    started = time.perf_counter()
+                    out = save_image_from_url(
+                        url,
+                        Path(tmp),
+                        attempts=1,
+                        progress_step=100,
+                        logger=lambda _line: None,
+                        segments=segments,
+                        segment_min_bytes=1,
+                    )
+                    times.append(time.perf_counter() - started)
+                    assert out.stat().st_size == len(payload)
+                    out.unlink()
+                medians[segments] = statistics.median(times)
+                print(f"[BENCH] segments={segments}: median={medians[segments]:.2f}s")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    baseline = medians.get(1) or medians[args.segments[0]]
+    for segments, seconds in medians.items():
+        print(f"[BENCH] segments={segments}: {baseline / seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
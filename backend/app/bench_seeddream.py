@@ -0,0 +1,86 @@
+# URL vs inline result benchmark: python -m app.bench_seeddream --photo in.jpg [--runs N]
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.core.config import SEEDDREAM_SIZE, SEEDDREAM_WATERMARK
+from app.utils.encode import file_to_data_url
+from app.utils.files import save_image_from_url
+from app.utils.input_image import prepare_input_image
+from app.utils.timings import percentile
+
+FORMATS = ("url", "b64_json")
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Time SeedDream generations with url and b64_json responses.",
+    )
+    parser.add_argument("--photo", type=Path, required=True, help="input photo")
+    parser.add_argument("--prompt", default="studio portrait, soft light", help="generation prompt")
+    parser.add_argument("--runs", type=int, default=3, help="generations per format")
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=FORMATS,
+        default=list(FORMATS),
+        help="response formats to compare",
+    )
+    parser.add_argument("--size", default=SEEDDREAM_SIZE, help="output size")
+    return parser.parse_args(argv)
+
+
+def _run_once(fmt: str, *, prompt: str, image_data_url: str, size: str, out_dir: Path) -> dict:
+    from app.integrations.seeddream_client import generate_i2i_bytes, generate_i2i_url
+
+    kwargs = dict(prompt=prompt, image_data_url=image_data_url, size=size, watermark=SEEDDREAM_WATERMARK)
+    t0 = time.perf_counter()
+    if fmt == "url":
+        url = generate_i2i_url(**kwargs)
+        t1 = time.perf_counter()
+        saved = save_image_from_url(url, out_dir, attempts=1, progress_step=100)
+        size_bytes = saved.stat().st_size
+    else:
+        data = generate_i2i_bytes(**kwargs)
+        t1 = time.perf_counter()
+        size_bytes = len(data)
+    t2 = time.perf_counter()
+    return {"generate": t1 - t0, "download": t2 - t1, "total": t2 - t0, "bytes": size_bytes}
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    prepared = prepare_input_image(args.photo, size=args.size)
+    image_data_url = file_to_data_url(prepared)
+    print(f"[BENCH] input {prepared.name}: {prepared.stat().st_size // 1024} KB, size={args.size}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats:
+            runs = []
+            for i in range(args.runs):
+                run = _run_once(
+                    fmt,
+                    prompt=args.prompt,
+                    image_data_url=image_data_url,
+                    size=args.size,
+                    out_dir=Path(tmp),
+                )
+                runs.append(run)
+                print(
+                    f"[BENCH] {fmt} #{i + 1}: generate={run['generate']:.2f}s "
+                    f"download={run['download']:.2f}s total={run['total']:.2f}s "
+                    f"{run['bytes'] // 1024} KB"
+                )
+
+            for phase in ("generate", "download", "total"):
+                values = [run[phase] for run in runs]
+                print(
+                    f"[BENCH] {fmt} {phase}: median={statistics.median(values):.2f}s "
+                    f"p95={percentile(values, 95):.2f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
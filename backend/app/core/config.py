@@ -58,6 +58,16 @@ def _env_bool(key: str, default: bool = False) -> bool:
     return val.strip().lower() in ("1", "true", "yes", "y", "on")
 
 
+def _env_int(key: str, default: int) -> int:
+    val = os.getenv(key)
+    if val is None or not val.strip():
+        return default
+    try:
+        return int(val.strip())
+    except ValueError:
+        return default
+
+
 def _normalize_drive_upload_source(value: str | None) -> str:
     source = (value or "").strip().lower()
     if source in {"results", "compressed"}:
@@ -67,8 +77,88 @@ def _normalize_drive_upload_source(value: str | None) -> str:
 
 SEEDDREAM_SIZE = os.getenv("SEEDDREAM_SIZE", "2400x3600")
 SEEDDREAM_WATERMARK = _env_bool("SEEDDREAM_WATERMARK", True)
+# How the result comes back: "url" (fetched in a second request) or
+# "b64_json" (inline in the API response). Compare with `python -m app.bench_seeddream`.
+SEEDDREAM_RESPONSE_FORMAT = (
+    "b64_json"
+    if os.getenv("SEEDDREAM_RESPONSE_FORMAT", "url").strip().lower() in ("b64_json", "b64", "inline")
+    else "url"
+)
+# Input photos are EXIF-rotated, downscaled to fit SEEDDREAM_SIZE (or
+# SEEDDREAM_INPUT_MAX_EDGE, if set) and re-encoded as JPEG before upload.
+SEEDDREAM_INPUT_MAX_EDGE = max(0, _env_int("SEEDDREAM_INPUT_MAX_EDGE", 0))
+SEEDDREAM_INPUT_QUALITY = min(95, max(50, _env_int("SEEDDREAM_INPUT_QUALITY", 85)))
+# Memory budget for base64 payloads of input photos, shared by every job
+# generating from the same photo (keyed by content hash).
+SEEDDREAM_ENCODE_CACHE_MB = max(0, _env_int("SEEDDREAM_ENCODE_CACHE_MB", 64))
+# Opt-in reuse of raw results for the same photo + prompt + size + watermark
+# (theme testing, kiosk resubmits). Stored under static/results/cache.
+SEEDDREAM_RESULT_CACHE = _env_bool("SEEDDREAM_RESULT_CACHE", False)
+SEEDDREAM_RESULT_CACHE_TTL_SECONDS = max(1, _env_int("SEEDDREAM_RESULT_CACHE_TTL_SECONDS", 86400))
+SEEDDREAM_RESULT_CACHE_MB = max(1, _env_int("SEEDDREAM_RESULT_CACHE_MB", 512))
+# Shared SeedDream HTTP pool: size it for peak concurrent generations
+# (JOB_WORKERS, or JOB_ASYNC_CONCURRENCY in async mode); see /api/v1/seeddream/pool.
+SEEDDREAM_MAX_CONNECTIONS = max(1, _env_int("SEEDDREAM_MAX_CONNECTIONS", 64))
+SEEDDREAM_MAX_KEEPALIVE = max(0, _env_int("SEEDDREAM_MAX_KEEPALIVE", 32))
+SEEDDREAM_KEEPALIVE_SECONDS = max(1, _env_int("SEEDDREAM_KEEPALIVE_SECONDS", 60))
+# HTTP/2 multiplexes many generations over one TLS connection (needs `h2`).
+SEEDDREAM_HTTP2 = _env_bool("SEEDDREAM_HTTP2", True)
+# Client-side limits for SeedDream calls (per process): request rate/burst and
+# the most concurrent calls. Both shrink on 429/503 and grow back (AIMD).
+SEEDDREAM_RATE_PER_SECOND = max(1, _env_int("SEEDDREAM_RATE_PER_SECOND", 10))
+SEEDDREAM_RATE_BURST = max(1, _env_int("SEEDDREAM_RATE_BURST", 10))
+SEEDDREAM_MAX_CONCURRENCY = max(1, _env_int("SEEDDREAM_MAX_CONCURRENCY", 32))
+# Circuit breaker: after this many consecutive outages (connection errors,
+# timeouts, 5xx) calls fail fast and queued jobs are held; one probe call is
+# let through every SEEDDREAM_BREAKER_RESET_SECONDS until SeedDream answers.
+SEEDDREAM_BREAKER_FAILURES = max(1, _env_int("SEEDDREAM_BREAKER_FAILURES", 5))
+SEEDDREAM_BREAKER_RESET_SECONDS = max(1, _env_int("SEEDDREAM_BREAKER_RESET_SECONDS", 30))
+# Breaker state shared by the API and every worker process (see /seeddream/health).
+SEEDDREAM_BREAKER_STATE_PATH = DATA_DIR / "seeddream_breaker.json"
+# Keep-alive pool for result downloads (one requests.Session / httpx client per process).
+DOWNLOAD_MAX_CONNECTIONS = max(1, _env_int("DOWNLOAD_MAX_CONNECTIONS", 16))
+# Fetch results of at least DOWNLOAD_SEGMENT_MIN_MB as this many parallel byte
+# ranges (1 = single stream). Compare with `python -m app.bench_download`.
+DOWNLOAD_SEGMENTS = min(16, max(1, _env_int("DOWNLOAD_SEGMENTS", 1)))
+DOWNLOAD_SEGMENT_MIN_MB = max(1, _env_int("DOWNLOAD_SEGMENT_MIN_MB", 4))
 DRIVE_UPLOAD_SOURCE = _normalize_drive_upload_source(os.getenv("DRIVE_UPLOAD_SOURCE", "compressed"))
 
+# Memory for overlays decoded and fitted to the result size, shared by every
+# job using the same frame (least recently used evicted first).
+OVERLAY_CACHE_MB = max(0, _env_int("OVERLAY_CACHE_MB", 256))
+
+# Job executor: dedicated generation threads + bounded pending queue
+JOB_WORKERS = max(1, _env_int("JOB_WORKERS", 8))
+JOB_QUEUE_MAX = max(1, _env_int("JOB_QUEUE_MAX", 50))
+# Downstream stages get their own threads so CPU work and Drive uploads never
+# hold a generation slot.
+JOB_POSTPROCESS_WORKERS = max(1, _env_int("JOB_POSTPROCESS_WORKERS", 2))
+JOB_UPLOAD_WORKERS = max(1, _env_int("JOB_UPLOAD_WORKERS", 4))
+JOB_STAGE_QUEUE_MAX = max(1, _env_int("JOB_STAGE_QUEUE_MAX", 32))
+# Priority lanes: each priority point delays a job by this many seconds relative
+# to guest jobs (priority 0) queued at the same time.
+JOB_PRIORITY_AGING_SECONDS = max(0.0, float(_env_int("JOB_PRIORITY_AGING_SECONDS", 6)))
+# Run the generate stage on one asyncio event loop (async Ark + httpx) instead
+# of one thread per job; JOB_ASYNC_CONCURRENCY caps generations in flight.
+JOB_ASYNC_GENERATE = _env_bool("JOB_ASYNC_GENERATE", False)
+JOB_ASYNC_CONCURRENCY = max(1, _env_int("JOB_ASYNC_CONCURRENCY", 64))
+# Set to false when jobs are processed by separate `python -m app.worker` processes.
+JOB_INPROCESS_WORKERS = _env_bool("JOB_INPROCESS_WORKERS", True)
+# Durable queue: a claimed job is re-queued when its lease is not renewed in time
+JOB_LEASE_SECONDS = max(10, _env_int("JOB_LEASE_SECONDS", 120))
+JOB_HEARTBEAT_SECONDS = max(1, _env_int("JOB_HEARTBEAT_SECONDS", JOB_LEASE_SECONDS // 4))
+JOB_MAX_ATTEMPTS = max(1, _env_int("JOB_MAX_ATTEMPTS", 3))
+# End-to-end budget for one job run (generate -> upload); 0 disables it.
+JOB_DEADLINE_SECONDS = max(0, _env_int("JOB_DEADLINE_SECONDS", 300))
+# The Drive upload (the guest's QR link) always gets at least this long, even
+# when generation used up the job's budget.
+JOB_UPLOAD_MIN_SECONDS = max(1, _env_int("JOB_UPLOAD_MIN_SECONDS", 60))
+# SeedDream call retries on transient errors (5xx, 429, timeouts): exponential
+# backoff with full jitter, capped by the job deadline.
+JOB_GENERATE_ATTEMPTS = max(1, _env_int("JOB_GENERATE_ATTEMPTS", 3))
+JOB_GENERATE_BACKOFF_SECONDS = max(0, _env_int("JOB_GENERATE_BACKOFF_SECONDS", 2))
+JOB_GENERATE_BACKOFF_MAX_SECONDS = max(0, _env_int("JOB_GENERATE_BACKOFF_MAX_SECONDS", 20))
+
 class Settings:
     DATABASE_URL: str = DATABASE_URL
 
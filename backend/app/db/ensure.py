@@ -10,6 +10,7 @@ def ensure_job_drive_columns(engine: Engine) -> None:
         existing = {row[1] for row in rows}
         additions = {
             "mode": "VARCHAR(20) DEFAULT 'event'",
+            "theme_id": "VARCHAR(64)",
             "overlay_image_path": "VARCHAR(255)",
             "compressed_image_path": "VARCHAR(255)",
             "drive_file_id": "VARCHAR(128)",
@@ -19,6 +20,18 @@ def ensure_job_drive_columns(engine: Engine) -> None:
             "drive_uploaded_at": "DATETIME",
             "log_text": "TEXT",
             "created_at": "DATETIME",
+            "lease_owner": "VARCHAR(128)",
+            "lease_expires_at": "DATETIME",
+            "heartbeat_at": "DATETIME",
+            "attempts": "INTEGER NOT NULL DEFAULT 0",
+            "priority": "INTEGER NOT NULL DEFAULT 0",
+            "checkpoint_stage": "VARCHAR(20)",
+            "source_url": "TEXT",
+            "raw_result_path": "VARCHAR(255)",
+            "deadline_at": "DATETIME",
+            "idempotency_key": "VARCHAR(128)",
+            "phase_timings": "JSON",
+            "queued_at": "DATETIME",
         }
 
         for name, col_type in additions.items():
@@ -33,6 +46,7 @@ def ensure_job_drive_columns(engine: Engine) -> None:
             WHERE created_at IS NULL
             """
         )
+        conn.exec_driver_sql("UPDATE jobs SET queued_at = created_at WHERE queued_at IS NULL")
 
         index_rows = conn.exec_driver_sql("PRAGMA index_list(jobs)").fetchall()
         index_existing = {row[1] for row in index_rows}
@@ -43,6 +57,14 @@ def ensure_job_drive_columns(engine: Engine) -> None:
                 ON jobs(mode, status, error_message, created_at)
                 """
             )
+        if "ix_jobs_queue" not in index_existing:
+            conn.exec_driver_sql(
+                "CREATE INDEX ix_jobs_queue ON jobs(status, lease_expires_at, id)"
+            )
+        if "ix_jobs_idempotency_key" not in index_existing:
+            conn.exec_driver_sql(
+                "CREATE UNIQUE INDEX ix_jobs_idempotency_key ON jobs(idempotency_key)"
+            )
 
 
 def ensure_photo_sessions_theme_index(engine: Engine) -> None:
@@ -53,12 +75,19 @@ def ensure_photo_sessions_theme_index(engine: Engine) -> None:
         if not table:
             return
 
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(photo_sessions)")}
+        if "idempotency_key" not in columns:
+            conn.exec_driver_sql("ALTER TABLE photo_sessions ADD COLUMN idempotency_key VARCHAR(128)")
+
         rows = conn.exec_driver_sql("PRAGMA index_list(photo_sessions)").fetchall()
         existing = {row[1] for row in rows}
-        if "ix_photo_sessions_theme_id" in existing:
-            return
-
-        conn.exec_driver_sql("CREATE INDEX ix_photo_sessions_theme_id ON photo_sessions(theme_id)")
+        if "ix_photo_sessions_theme_id" not in existing:
+            conn.exec_driver_sql("CREATE INDEX ix_photo_sessions_theme_id ON photo_sessions(theme_id)")
+        if "ix_photo_sessions_idempotency_key" not in existing:
+            conn.exec_driver_sql(
+                "CREATE UNIQUE INDEX ix_photo_sessions_idempotency_key"
+                " ON photo_sessions(idempotency_key)"
+            )
 
 
 def ensure_themes_serial_id(engine: Engine) -> None:
@@ -96,3 +125,10 @@ def ensure_themes_serial_id(engine: Engine) -> None:
             conn.exec_driver_sql(
                 "CREATE UNIQUE INDEX ix_themes_serial_id ON themes(serial_id)"
             )
+
+
+def ensure_schema(engine: Engine) -> None:
+    """Column and index upgrades for an existing database; run by the API and every worker."""
+    ensure_job_drive_columns(engine)
+    ensure_photo_sessions_theme_index(engine)
+    ensure_themes_serial_id(engine)
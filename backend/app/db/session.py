@@ -1,5 +1,5 @@
 # app/db/session.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
@@ -8,7 +8,9 @@ DATABASE_URL = settings.DATABASE_URL
 
 connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
+    # timeout: wait for the write lock instead of failing when API and
+    # worker processes write at the same time
+    connect_args = {"check_same_thread": False, "timeout": 30}
 
 engine = create_engine(
     DATABASE_URL,
@@ -16,6 +18,15 @@ engine = create_engine(
     pool_pre_ping=True,   # koneksi lebih stabil
 )
 
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # WAL lets readers (API polling) run while a worker holds the write lock.
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
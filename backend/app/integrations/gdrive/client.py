@@ -2,7 +2,9 @@ import json
 from datetime import datetime, timezone
 from pathlib import Path
 
+import httplib2
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
@@ -53,9 +55,13 @@ def get_credentials() -> Credentials:
     return creds
 
 
-def get_drive_service():
+def get_drive_service(timeout: float | None = None):
     creds = get_credentials()
-    return build("drive", "v3", credentials=creds)
+    if timeout is None:
+        return build("drive", "v3", credentials=creds)
+    # Socket timeout for every request made through this service.
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout))
+    return build("drive", "v3", http=http)
 
 
 def get_credentials_status() -> dict:
@@ -79,13 +79,14 @@ def upload_file_to_drive(
     *,
     folder_id: str | None = None,
     service=None,
+    timeout: float | None = None,
 ) -> dict:
     path = Path(file_path)
     if not path.exists() or not path.is_file():
         raise FileNotFoundError(f"File not found: {path}")
 
     folder_id = folder_id or TARGET_FOLDER_ID
-    service = service or get_drive_service()
+    service = service or get_drive_service(timeout=timeout)
 
     mime_type, _ = mimetypes.guess_type(path.name)
     media = MediaFileUpload(str(path), mimetype=mime_type, resumable=True)
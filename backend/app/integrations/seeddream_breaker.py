@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from app.core.config import SEEDDREAM_BREAKER_STATE_PATH
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(RuntimeError):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"SEEDDREAM_UNAVAILABLE: circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails SeedDream calls fast while the upstream is down.
+
+    `failure_threshold` consecutive outages open the circuit. After
+    `reset_seconds` it goes half-open and lets `half_open_probes` calls
+    through; a probe that succeeds closes it, a probe that fails opens it
+    again for another `reset_seconds`.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int,
+        reset_seconds: float,
+        half_open_probes: int = 1,
+        clock=time.monotonic,
+        shared: "SharedBreakerState | None" = None,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._clock = clock
+        self._shared = shared
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._opened = 0
+        self._rejected = 0
+
+    def _refresh(self) -> None:
+        # Caller holds the lock.
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._opened += 1
+        self._probes = 0
+
+    def _retry_after(self) -> float:
+        # Caller holds the lock and has refreshed the state.
+        if self._state == CLOSED:
+            return 0.0
+        if self._state == HALF_OPEN:
+            # A probe is already out: check back after a short while.
+            return 0.0 if self._probes < self.half_open_probes else 1.0
+        return max(0.0, self.reset_seconds - (self._clock() - self._opened_at))
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until a call would be let through (0 = now)."""
+        with self._lock:
+            self._refresh()
+            return self._retry_after()
+
+    def before_call(self) -> None:
+        with self._lock:
+            self._refresh()
+            probing = False
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                probing = True
+            elif self._state != CLOSED:
+                self._rejected += 1
+                raise CircuitOpen(self._retry_after())
+        # A circuit another process opened: wait for it, or be its one probe.
+        if self._shared and not self._shared.allow_call():
+            with self._lock:
+                if probing and self._probes:
+                    self._probes -= 1
+                self._rejected += 1
+            raise CircuitOpen(max(1.0, self._shared.retry_after()))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = CLOSED
+            self._probes = 0
+        if self._shared:
+            self._shared.publish(CLOSED, 0)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._open()
+            state, failures, retry_after = self._state, self._failures, self._retry_after()
+        if self._shared:
+            if self._shared.probing and state != OPEN:
+                # Our probe of a circuit another process opened failed: open it again.
+                state, retry_after = OPEN, self.reset_seconds
+            self._shared.publish(state, failures, retry_after)
+
+    def record_abandoned(self) -> None:
+        # The call ended without telling us anything (e.g. cancelled).
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+        if self._shared:
+            self._shared.release_probe()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "retry_after_seconds": round(self._retry_after(), 1),
+                "opened": self._opened,
+                "rejected": self._rejected,
+            }
+
+
+class SharedBreakerState:
+    """
+    The last breaker transition of any process, kept in a small JSON file, so
+    the API's `/seeddream/health` and `generation_hold_seconds` see the
+    circuit a separate worker process opened. Best effort: a write that fails
+    is only logged.
+
+    Once an open circuit's reset window is over, one caller across all
+    processes claims the probe (an exclusively created `.probe` file); the
+    others keep waiting until the probe's outcome is published. A probe
+    file older than `probe_timeout` (its process died) is taken over.
+    """
+
+    def __init__(self, path: Path, *, clock=time.time, probe_timeout: float = 120.0) -> None:
+        self.path = path
+        self.probe_path = path.with_name(f"{path.name}.probe")
+        self.probe_timeout = probe_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._probing = False
+
+    @property
+    def probing(self) -> bool:
+        """Whether this process holds the shared probe."""
+        return self._probing
+
+    def _read(self) -> dict | None:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def publish(self, state: str, failures: int, retry_after: float = 0.0) -> None:
+        now = self._clock()
+        current = self._read()
+        if current and state == CLOSED:
+            if current["state"] == CLOSED and current["failures"] == failures:
+                return  # nothing new: skip the write on every success
+            if failures and current["state"] == OPEN:
+                return  # open elsewhere: only its probe's outcome changes that
+        record = {"state": state, "failures": failures, "until": now + retry_after, "pid": os.getpid()}
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(record), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[SEEDDREAM] breaker state not shared: {e}")
+        # The outcome is out: whoever was probing is done.
+        self._remove_probe()
+
+    def _probe_started_at(self) -> float | None:
+        try:
+            return float(self.probe_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _probe_out(self) -> bool:
+        started = self._probe_started_at()
+        return started is not None and self._clock() - started < self.probe_timeout
+
+    def _remove_probe(self) -> None:
+        with self._lock:
+            self._probing = False
+        try:
+            self.probe_path.unlink()
+        except OSError:
+            pass
+
+    def _claim_probe(self) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(self.probe_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._probe_out():
+                    return False
+                try:
+                    self.probe_path.unlink()  # stale: its process died mid-probe
+                except OSError:
+                    pass
+                continue
+            except OSError:
+                return True  # cannot coordinate: fall back to per-process probing
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(str(self._clock()))
+            with self._lock:
+                self._probing = True
+            return True
+        return False
+
+    def allow_call(self) -> bool:
+        """False while another process's open circuit (or its probe) says wait."""
+        current = self._read()
+        if not current or current["state"] != OPEN:
+            return True
+        if current["until"] > self._clock():
+            return False
+        with self._lock:
+            if self._probing:
+                return False  # our probe is already out
+        return self._claim_probe()
+
+    def release_probe(self) -> None:
+        """Give the probe up without an outcome (e.g. the call was cancelled)."""
+        if self._probing:
+            self._remove_probe()
+
+    def snapshot(self) -> dict:
+        """`state`, `retry_after_seconds` and `consecutive_failures`, as `CircuitBreaker.stats()`."""
+        current = self._read() or {"state": CLOSED, "failures": 0, "until": 0.0}
+        retry_after = max(0.0, current["until"] - self._clock())
+        state = current["state"]
+        if state == OPEN and retry_after == 0:
+            state = HALF_OPEN  # reset window is over: the next call is a probe
+            if self._probe_out():
+                retry_after = 1.0  # a probe is already out: check back shortly
+        return {
+            "state": state,
+            "retry_after_seconds": round(retry_after, 1),
+            "consecutive_failures": current["failures"],
+        }
+
+    def retry_after(self) -> float:
+        return self.snapshot()["retry_after_seconds"]
+
+
+SHARED_BREAKER_STATE = SharedBreakerState(SEEDDREAM_BREAKER_STATE_PATH)
@@ -1,8 +1,13 @@
+import asyncio
+import base64
 import os
 from dotenv import load_dotenv
-from byteplussdkarkruntime import Ark
 import httpx
 
+from app.core.config import SEEDDREAM_BREAKER_FAILURES, SEEDDREAM_BREAKER_RESET_SECONDS
+from app.integrations.seeddream_breaker import SHARED_BREAKER_STATE, CircuitBreaker
+from app.integrations.seeddream_pool import DEFAULT_TIMEOUT, SeedDreamClient
+
 load_dotenv()
 
 ARK_BASE_URL = os.getenv("ARK_BASE_URL", "https://ark.ap-southeast.bytepluses.com/api/v3")
@@ -13,31 +18,156 @@ if not ARK_API_KEY:
     raise RuntimeError("ARK_API_KEY is not set")
 
 # Timeout total 90 detik (ubah kalau mau)
-_httpx_timeout = httpx.Timeout(90.0, connect=30.0, read=90.0, write=30.0)
+_httpx_timeout = DEFAULT_TIMEOUT
 
-_client = Ark(
+# Shared by every worker thread and event loop in this process; the breaker
+# also publishes its state for the other processes.
+_client = SeedDreamClient(
     base_url=ARK_BASE_URL,
     api_key=ARK_API_KEY,
     timeout=_httpx_timeout,
+    breaker=CircuitBreaker(
+        failure_threshold=SEEDDREAM_BREAKER_FAILURES,
+        reset_seconds=SEEDDREAM_BREAKER_RESET_SECONDS,
+        shared=SHARED_BREAKER_STATE,
+    ),
 )
 
-def generate_i2i_url(*, prompt: str, image_data_url: str, size: str = "4k", watermark: bool = False) -> str:
+
+def get_seeddream_client() -> SeedDreamClient:
+    return _client
+
+
+def _call_timeout(timeout: float | None) -> httpx.Timeout:
+    # Per-call budget (the job deadline) capped by the client defaults.
+    if timeout is None:
+        return _httpx_timeout
+    return httpx.Timeout(
+        min(90.0, timeout),
+        connect=min(30.0, timeout),
+        read=min(90.0, timeout),
+        write=min(30.0, timeout),
+    )
+
+
+def _request_kwargs(
+    *,
+    prompt: str,
+    image_data_url: str,
+    size: str,
+    watermark: bool,
+    timeout: float | None,
+    response_format: str,
+) -> dict:
+    return {
+        "model": SEEDDREAM_MODEL,
+        "prompt": prompt,
+        "image": image_data_url,
+        "size": size,
+        "response_format": response_format,
+        "watermark": watermark,
+        "timeout": _call_timeout(timeout),
+    }
+
+
+def _log_request(label: str, size: str, watermark: bool, response_format: str) -> None:
     print(
-        "[SEEDDREAM REQUEST] model=",
+        f"[SEEDDREAM REQUEST{label}] model=",
         SEEDDREAM_MODEL,
         "size=",
         size,
         "watermark=",
         watermark,
+        "format=",
+        response_format,
     )
 
-    resp = _client.images.generate(
-        model=SEEDDREAM_MODEL,
-        prompt=prompt,
-        image=image_data_url,
-        size=size,
-        response_format="url",
-        watermark=watermark,
+
+def generate_i2i_url(
+    *,
+    prompt: str,
+    image_data_url: str,
+    size: str = "4k",
+    watermark: bool = False,
+    timeout: float | None = None,
+) -> str:
+    _log_request("", size, watermark, "url")
+    resp = _client.generate(
+        **_request_kwargs(
+            prompt=prompt,
+            image_data_url=image_data_url,
+            size=size,
+            watermark=watermark,
+            timeout=timeout,
+            response_format="url",
+        )
     )
     return resp.data[0].url
 
+
+async def generate_i2i_url_async(
+    *,
+    prompt: str,
+    image_data_url: str,
+    size: str = "4k",
+    watermark: bool = False,
+    timeout: float | None = None,
+) -> str:
+    _log_request(" async", size, watermark, "url")
+    resp = await _client.generate_async(
+        **_request_kwargs(
+            prompt=prompt,
+            image_data_url=image_data_url,
+            size=size,
+            watermark=watermark,
+            timeout=timeout,
+            response_format="url",
+        )
+    )
+    return resp.data[0].url
+
+
+def generate_i2i_bytes(
+    *,
+    prompt: str,
+    image_data_url: str,
+    size: str = "4k",
+    watermark: bool = False,
+    timeout: float | None = None,
+) -> bytes:
+    """Result image inline (`b64_json`): no second round trip to fetch it."""
+    _log_request("", size, watermark, "b64_json")
+    resp = _client.generate(
+        **_request_kwargs(
+            prompt=prompt,
+            image_data_url=image_data_url,
+            size=size,
+            watermark=watermark,
+            timeout=timeout,
+            response_format="b64_json",
+        )
+    )
+    return base64.b64decode(resp.data[0].b64_json)
+
+
+async def generate_i2i_bytes_async(
+    *,
+    prompt: str,
+    image_data_url: str,
+    size: str = "4k",
+    watermark: bool = False,
+    timeout: float | None = None,
+) -> bytes:
+    _log_request(" async", size, watermark, "b64_json")
+    resp = await _client.generate_async(
+        **_request_kwargs(
+            prompt=prompt,
+            image_data_url=image_data_url,
+            size=size,
+            watermark=watermark,
+            timeout=timeout,
+            response_format="b64_json",
+        )
+    )
+    # Decoding a multi-MB payload is CPU work; keep it off the event loop.
+    return await asyncio.to_thread(base64.b64decode, resp.data[0].b64_json)
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+
+
+class LimiterTimeout(TimeoutError):
+    pass
+
+
+class TokenBucket:
+    """Request-rate limit: `rate` tokens per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = max(0.01, rate)
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> float:
+        """Take a token; returns 0 on success, otherwise seconds until one is due."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(0.01, rate)
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket plus an AIMD concurrency limit for calls to one upstream.
+
+    A throttled response (429/503) halves both the concurrency limit and the
+    request rate, at most once per `cooldown` so a burst of 429s counts as one
+    signal. Every fast success (latency within `latency_tolerance` of the
+    recent baseline) adds back about one slot per limit's worth of calls and a
+    little rate, up to the configured maximums.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float,
+        burst: float,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        decrease_factor: float = 0.5,
+        rate_step: float = 0.1,
+        latency_tolerance: float = 1.5,
+        cooldown: float = 2.0,
+    ) -> None:
+        self.max_rate = max(0.01, rate)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.bucket = TokenBucket(rate, burst)
+        self._decrease_factor = decrease_factor
+        self._rate_step = rate_step
+        self._latency_tolerance = latency_tolerance
+        self._cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._latency_ewma: float | None = None
+        self._last_decrease = 0.0
+        self._throttled = 0
+        self._decreases = 0
+
+    def _try_slot(self) -> bool:
+        # Caller holds the lock.
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+
+    def acquire(self, max_wait: float | None = None) -> None:
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+
+        def left() -> float | None:
+            return None if deadline is None else deadline - time.monotonic()
+
+        while True:
+            wait = self.bucket.try_take()
+            if not wait:
+                break
+            remaining = left()
+            if remaining is not None and wait > remaining:
+                raise LimiterTimeout("SEEDDREAM_RATE_LIMITED: no token in time")
+            time.sleep(wait)
+
+        with self._slot_freed:
+            while not self._try_slot():
+                remaining = left()
+                if remaining is not None and remaining <= 0:
+                    raise LimiterTimeout("SEEDDREAM_RATE_LIMITED: no free slot in time")
+                self._slot_freed.wait(remaining)
+
+    async def acquire_async(self, max_wait: float | None = None, poll: float = 0.05) -> None:
+        # Poll instead of parking a thread per waiter; slots are shared with
+        # sync callers, so an asyncio primitive alone would not do.
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+
+        while True:
+            wait = self.bucket.try_take()
+            if not wait:
+                break
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise LimiterTimeout("SEEDDREAM_RATE_LIMITED: no token in time")
+            await asyncio.sleep(wait)
+
+        while True:
+            with self._lock:
+                if self._try_slot():
+                    return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LimiterTimeout("SEEDDREAM_RATE_LIMITED: no free slot in time")
+            await asyncio.sleep(poll)
+
+    def release(self, *, latency: float | None, throttled: bool) -> None:
+        with self._slot_freed:
+            self._in_flight -= 1
+            if throttled:
+                self._throttled += 1
+                self._decrease()
+            elif latency is not None:
+                self._increase(latency)
+            self._slot_freed.notify_all()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._cooldown:
+            return
+        self._last_decrease = now
+        self._decreases += 1
+        self._limit = max(float(self.min_concurrency), self._limit * self._decrease_factor)
+        self.bucket.set_rate(max(0.01, self.bucket.rate * self._decrease_factor))
+
+    def _increase(self, latency: float) -> None:
+        baseline = self._latency_ewma
+        if baseline is None:
+            self._latency_ewma = latency
+        elif latency > baseline * self._latency_tolerance:
+            # Upstream is slowing down: hold steady, and let the baseline
+            # drift up only slowly so a lasting change is eventually accepted.
+            self._latency_ewma = 0.95 * baseline + 0.05 * latency
+            return
+        else:
+            self._latency_ewma = 0.8 * baseline + 0.2 * latency
+        self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(1.0, self._limit))
+        if self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self._rate_step))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency_limit": int(self._limit),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "rate_per_second": round(self.bucket.rate, 3),
+                "max_rate_per_second": self.max_rate,
+                "tokens": round(self.bucket.tokens, 3),
+                "latency_ewma_seconds": round(self._latency_ewma, 3) if self._latency_ewma else None,
+                "throttled": self._throttled,
+                "decreases": self._decreases,
+            }
@@ -0,0 +1,264 @@
+import asyncio
+import importlib.util
+import threading
+import time
+from typing import Any
+
+import httpx
+from byteplussdkarkruntime import Ark, AsyncArk
+from byteplussdkarkruntime._exceptions import ArkAPIConnectionError, ArkAPIStatusError
+
+from app.core.config import (
+    SEEDDREAM_BREAKER_FAILURES,
+    SEEDDREAM_BREAKER_RESET_SECONDS,
+    SEEDDREAM_HTTP2,
+    SEEDDREAM_KEEPALIVE_SECONDS,
+    SEEDDREAM_MAX_CONCURRENCY,
+    SEEDDREAM_MAX_CONNECTIONS,
+    SEEDDREAM_MAX_KEEPALIVE,
+    SEEDDREAM_RATE_BURST,
+    SEEDDREAM_RATE_PER_SECOND,
+)
+from app.integrations.seeddream_breaker import CircuitBreaker
+from app.integrations.seeddream_limiter import AdaptiveLimiter
+from app.utils.timings import record_phase, trace_request, trace_request_async
+
+# Timeout total 90 detik (ubah kalau mau)
+DEFAULT_TIMEOUT = httpx.Timeout(90.0, connect=30.0, read=90.0, write=30.0)
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+# Upstream is telling us to slow down.
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+def _is_throttled(err: BaseException | None) -> bool:
+    return isinstance(err, ArkAPIStatusError) and err.status_code in THROTTLE_STATUS_CODES
+
+
+def _is_outage(err: BaseException) -> bool:
+    # Only "SeedDream is not answering" opens the circuit; a 4xx is an answer.
+    if isinstance(err, ArkAPIStatusError):
+        return err.status_code >= 500
+    return isinstance(err, (ArkAPIConnectionError, httpx.TransportError))
+
+
+def _limiter_wait(kwargs: dict) -> float | None:
+    # Do not queue behind the limiter longer than the call itself may take.
+    timeout = kwargs.get("timeout")
+    if isinstance(timeout, httpx.Timeout):
+        return timeout.read
+    return timeout
+
+
+def _pool_connections(http_client: httpx.Client | httpx.AsyncClient) -> list:
+    # httpx keeps its httpcore pool on the transport; absent for custom transports.
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+
+class SeedDreamClient:
+    """
+    One Ark client per process for sync callers and one per event loop for
+    async callers, all over tuned, pooled httpx clients (keep-alive and
+    optional HTTP/2), so concurrent jobs reuse TLS connections instead of
+    opening their own. Thread-safe; share a single instance.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        api_key: str,
+        max_connections: int = SEEDDREAM_MAX_CONNECTIONS,
+        max_keepalive: int = SEEDDREAM_MAX_KEEPALIVE,
+        keepalive_seconds: float = SEEDDREAM_KEEPALIVE_SECONDS,
+        http2: bool = SEEDDREAM_HTTP2,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        transport: httpx.BaseTransport | None = None,
+        async_transport: httpx.AsyncBaseTransport | None = None,
+        limiter: AdaptiveLimiter | None = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self._base_url = base_url
+        self._api_key = api_key
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive, max_connections),
+            keepalive_expiry=keepalive_seconds,
+        )
+        if http2 and not http2_available():
+            print("[SEEDDREAM] HTTP/2 requested but `h2` is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._timeout = timeout
+        self._transport = transport
+        self._async_transport = async_transport
+        self.limiter = limiter or AdaptiveLimiter(
+            rate=SEEDDREAM_RATE_PER_SECOND,
+            burst=SEEDDREAM_RATE_BURST,
+            max_concurrency=SEEDDREAM_MAX_CONCURRENCY,
+        )
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=SEEDDREAM_BREAKER_FAILURES,
+            reset_seconds=SEEDDREAM_BREAKER_RESET_SECONDS,
+        )
+
+        self._lock = threading.Lock()
+        self._http: httpx.Client | None = None
+        self._ark: Ark | None = None
+        # httpx.AsyncClient is bound to the loop that created it.
+        self._async: dict[asyncio.AbstractEventLoop, tuple[httpx.AsyncClient, AsyncArk]] = {}
+
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._errors = 0
+
+    def _client_kwargs(self) -> dict[str, Any]:
+        return {"limits": self._limits, "http2": self.http2, "timeout": self._timeout}
+
+    def ark(self) -> Ark:
+        with self._lock:
+            if self._ark is None:
+                self._http = httpx.Client(
+                    transport=self._transport,
+                    event_hooks={"request": [trace_request]},
+                    **self._client_kwargs(),
+                )
+                # Retries are done by the job's RetryPolicy (logged, deadline-aware), not the SDK.
+                self._ark = Ark(
+                    base_url=self._base_url,
+                    api_key=self._api_key,
+                    timeout=self._timeout,
+                    max_retries=0,
+                    http_client=self._http,
+                )
+            return self._ark
+
+    def async_ark(self) -> AsyncArk:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Drop clients of loops that are gone (e.g. asyncio.run in tests).
+            for old in [other for other in self._async if other.is_closed()]:
+                del self._async[old]
+            if loop not in self._async:
+                http = httpx.AsyncClient(
+                    transport=self._async_transport,
+                    event_hooks={"request": [trace_request_async]},
+                    **self._client_kwargs(),
+                )
+                ark = AsyncArk(
+                    base_url=self._base_url,
+                    api_key=self._api_key,
+                    timeout=self._timeout,
+                    max_retries=0,
+                    http_client=http,
+                )
+                self._async[loop] = (http, ark)
+            return self._async[loop][1]
+
+    def _begin(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            self._requests += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _end(self, err: BaseException | None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if err is not None:
+                self._errors += 1
+        if err is None:
+            self.breaker.record_success()
+        elif _is_outage(err):
+            self.breaker.record_failure()
+        elif isinstance(err, Exception):
+            self.breaker.record_success()  # upstream answered, just not with an image
+        else:
+            self.breaker.record_abandoned()  # cancelled mid-call
+
+    def generate(self, **kwargs) -> Any:
+        ark = self.ark()
+        # Fail fast while SeedDream is down, before queueing on the limiter.
+        self.breaker.before_call()
+        try:
+            self.limiter.acquire(_limiter_wait(kwargs))
+        except BaseException:
+            self.breaker.record_abandoned()
+            raise
+        self._begin()
+        started = time.monotonic()
+        err: BaseException | None = None
+        try:
+            return ark.images.generate(**kwargs)
+        except BaseException as e:
+            err = e
+            raise
+        finally:
+            record_phase("generate", time.monotonic() - started)
+            self._end(err)
+            self.limiter.release(
+                latency=time.monotonic() - started if err is None else None,
+                throttled=_is_throttled(err),
+            )
+
+    async def generate_async(self, **kwargs) -> Any:
+        ark = self.async_ark()
+        self.breaker.before_call()
+        try:
+            await self.limiter.acquire_async(_limiter_wait(kwargs))
+        except BaseException:
+            self.breaker.record_abandoned()
+            raise
+        self._begin()
+        started = time.monotonic()
+        err: BaseException | None = None
+        try:
+            return await ark.images.generate(**kwargs)
+        except BaseException as e:
+            err = e
+            raise
+        finally:
+            record_phase("generate", time.monotonic() - started)
+            self._end(err)
+            self.limiter.release(
+                latency=time.monotonic() - started if err is None else None,
+                throttled=_is_throttled(err),
+            )
+
+    def pool_stats(self) -> dict:
+        with self._lock:
+            clients = ([self._http] if self._http else []) + [http for http, _ in self._async.values()]
+            stats = {
+                "http2": self.http2,
+                "max_connections": self._limits.max_connections,
+                "max_keepalive": self._limits.max_keepalive_connections,
+                "keepalive_seconds": self._limits.keepalive_expiry,
+                "clients": len(clients),
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "requests": self._requests,
+                "errors": self._errors,
+            }
+
+        connections = [conn for http in clients for conn in _pool_connections(http)]
+        idle = sum(1 for conn in connections if conn.is_idle())
+        stats["connections"] = len(connections)
+        stats["connections_idle"] = idle
+        stats["connections_active"] = len(connections) - idle
+        stats["limiter"] = self.limiter.stats()
+        stats["breaker"] = self.breaker.stats()
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._http is not None:
+                self._http.close()
+            self._http = None
+            self._ark = None
+            # Async clients close with their loop; just forget them.
+            self._async.clear()
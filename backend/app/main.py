@@ -6,11 +6,7 @@ from app.api.v1.router import api_router
 from app.api.v1.endpoints.camera import router as camera_router
 from app.db.session import engine, SessionLocal
 from app.db.base import Base
-from app.db.ensure import (
-    ensure_job_drive_columns,
-    ensure_photo_sessions_theme_index,
-    ensure_themes_serial_id,
-)
+from app.db.ensure import ensure_schema
 from app.core.config import (
     UPLOADS_DIR,
     RESULTS_DIR,
@@ -18,8 +14,10 @@ from app.core.config import (
     OVERLAYS_DIR,
     THUMBS_DIR,
     COMPRESSED_DIR,
+    JOB_INPROCESS_WORKERS,
 )
 from app.modules.themes.service import seed_themes_if_empty
+from app.modules.jobs.executor import get_job_executor
 
 from app.modules.users.model import User  # noqa: F401
 from app.modules.sessions.model import PhotoSession  # noqa: F401
@@ -39,9 +37,7 @@ def ensure_dirs():
 async def lifespan(app: FastAPI):
     ensure_dirs()
     Base.metadata.create_all(bind=engine)
-    ensure_job_drive_columns(engine)
-    ensure_photo_sessions_theme_index(engine)
-    ensure_themes_serial_id(engine)
+    ensure_schema(engine)
 
     db = SessionLocal()
     try:
@@ -49,7 +45,19 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
 
-    yield  
+    executor = get_job_executor()
+    recovered = executor.recover()
+    if recovered["requeued"] or recovered["failed"]:
+        print(
+            f"[JOBS] recovered orphaned jobs: requeued={recovered['requeued']} "
+            f"failed={recovered['failed']}"
+        )
+    if JOB_INPROCESS_WORKERS:
+        executor.start()
+
+    yield
+
+    executor.stop()
 
 app = FastAPI(lifespan=lifespan)
 
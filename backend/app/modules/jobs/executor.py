@@ -0,0 +1,510 @@
+import asyncio
+import inspect
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Sequence
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import (
+    JOB_ASYNC_CONCURRENCY,
+    JOB_ASYNC_GENERATE,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_INPROCESS_WORKERS,
+    JOB_LEASE_SECONDS,
+    JOB_POSTPROCESS_WORKERS,
+    JOB_PRIORITY_AGING_SECONDS,
+    JOB_QUEUE_MAX,
+    JOB_STAGE_QUEUE_MAX,
+    JOB_UPLOAD_WORKERS,
+    JOB_WORKERS,
+)
+from app.db.session import SessionLocal
+from app.modules.jobs.queue_store import (
+    claim_next_job,
+    count_queued_jobs,
+    heartbeat_jobs,
+    make_worker_id,
+    release_job,
+    requeue_expired_jobs,
+)
+
+
+StageHandler = Callable[[int], bool]
+
+
+class _StagePool:
+    """Worker threads + bounded queue for one downstream pipeline stage."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: StageHandler,
+        *,
+        workers: int,
+        queue_max: int,
+        on_finished: Callable[[int, bool, bool], None],
+        stop: threading.Event,
+        thread_prefix: str,
+        aging_seconds: float = JOB_PRIORITY_AGING_SECONDS,
+    ) -> None:
+        self.name = name
+        self._handler = handler
+        self._workers = max(1, workers)
+        # (deadline, seq, job_id): a lower lane gets a later deadline, but still
+        # goes ahead of anything that arrives after that deadline.
+        self._queue: queue.PriorityQueue[tuple[float, int, int]] = queue.PriorityQueue(
+            maxsize=max(1, queue_max)
+        )
+        self._seq = itertools.count()
+        self._aging_seconds = aging_seconds
+        self._on_finished = on_finished
+        self._stop = stop
+        self._thread_prefix = thread_prefix
+        self._lock = threading.Lock()
+        self._busy = 0
+
+    def threads(self) -> list[threading.Thread]:
+        return [
+            threading.Thread(
+                target=self._run,
+                name=f"{self._thread_prefix}-{self.name}-{i + 1}",
+                daemon=True,
+            )
+            for i in range(self._workers)
+        ]
+
+    def put(self, job_id: int, priority: int = 0) -> bool:
+        # Blocks the upstream worker while this stage is saturated (backpressure).
+        item = (time.monotonic() + priority * self._aging_seconds, next(self._seq), job_id)
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            busy = self._busy
+        return {"workers": self._workers, "queue_depth": self._queue.qsize(), "busy": busy}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                _, _, job_id = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                self._busy += 1
+            forward, ok = False, True
+            try:
+                forward = bool(self._handler(job_id))
+            except Exception as e:
+                ok = False
+                print(f"[JOB {job_id}] STAGE {self.name} ERROR: {e}")
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                self._queue.task_done()
+                self._on_finished(job_id, forward, ok)
+
+
+class JobExecutor:
+    """
+    Dedicated worker threads for generation jobs.
+
+    The `jobs` table is the durable queue; the in-memory queue only carries
+    wake-ups for freshly submitted jobs; which job runs next is decided by the
+    database (priority lanes, see `claim_next_job`). Every job is claimed with an atomic
+    lease before it runs, and leases are renewed by a heartbeat thread, so a
+    restart (or a dead worker) never leaves a row stuck in `processing`.
+
+    `handler` is the first stage and runs on the claiming threads. Optional
+    `stages` (name, handler, workers) run after it on their own thread pools;
+    a stage hands the job on by returning True.
+
+    `hold` (optional) returns how many seconds to leave queued jobs alone,
+    e.g. while the upstream API is down; jobs stay `queued` meanwhile.
+
+    If `handler` is a coroutine function, the first stage runs on a single
+    event-loop thread instead and `workers` caps how many jobs it keeps in
+    flight at once.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[int, str | None], bool | None],
+        *,
+        workers: int = JOB_WORKERS,
+        queue_max: int = JOB_QUEUE_MAX,
+        name: str = "job-worker",
+        stages: Sequence[tuple[str, StageHandler, int]] = (),
+        stage_queue_max: int = JOB_STAGE_QUEUE_MAX,
+        session_factory: sessionmaker | Callable[[], Session] = SessionLocal,
+        lease_seconds: int = JOB_LEASE_SECONDS,
+        heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+        poll_seconds: float = 1.0,
+        hold: Callable[[], float] | None = None,
+    ) -> None:
+        self._handler = handler
+        self._hold = hold
+        self._is_async = inspect.iscoroutinefunction(handler)
+        self._workers = max(1, workers)
+        self._queue_max = max(1, queue_max)
+        self._queue: queue.Queue[int] = queue.Queue(maxsize=self._queue_max)
+        self._name = name
+        self._session_factory = session_factory
+        self._lease_seconds = lease_seconds
+        self._heartbeat_seconds = heartbeat_seconds
+        self._poll_seconds = poll_seconds
+        self.worker_id = make_worker_id(name)
+
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._stop = threading.Event()
+        self._in_flight: set[int] = set()
+        self._priorities: dict[int, int] = {}
+        self._busy = 0
+        self._completed = 0
+        self._errors = 0
+
+        self._stages: list[_StagePool] = []
+        for index, (stage_name, stage_handler, stage_workers) in enumerate(stages):
+            self._stages.append(
+                _StagePool(
+                    stage_name,
+                    stage_handler,
+                    workers=stage_workers,
+                    queue_max=stage_queue_max,
+                    on_finished=self._make_stage_callback(index + 1),
+                    stop=self._stop,
+                    thread_prefix=name,
+                )
+            )
+
+    def _make_stage_callback(self, index: int) -> Callable[[int, bool, bool], None]:
+        def finished(job_id: int, forward: bool, ok: bool) -> None:
+            self._stage_finished(index, job_id, forward, ok)
+
+        return finished
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            if self._is_async:
+                self._threads = [
+                    threading.Thread(target=self._run_loop, name=f"{self._name}-loop", daemon=True)
+                ]
+            else:
+                self._threads = [
+                    threading.Thread(target=self._run, name=f"{self._name}-{i + 1}", daemon=True)
+                    for i in range(self._workers)
+                ]
+            for stage in self._stages:
+                self._threads.extend(stage.threads())
+            self._threads.append(
+                threading.Thread(target=self._heartbeat_loop, name=f"{self._name}-heartbeat", daemon=True)
+            )
+            for t in self._threads:
+                t.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def submit(self, job_id: int, mode: str | None = None) -> None:
+        # Best effort: the token only wakes a worker sooner. The job row
+        # (status, mode, priority) is what gets claimed, and idle workers poll
+        # the table, so a dropped token only costs up to `poll_seconds`.
+        if not self.running:
+            self.start()
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            pass
+
+    def recover(self) -> dict:
+        db = self._session_factory()
+        try:
+            return requeue_expired_jobs(db)
+        finally:
+            db.close()
+
+    def _queued_in_db(self) -> int:
+        db = self._session_factory()
+        try:
+            return count_queued_jobs(db)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._in_flight)
+            busy = self._busy
+            completed = self._completed
+            errors = self._errors
+        # The generate stage's queue is the `jobs` table, not the wake-up tokens.
+        queue_depth = self._queued_in_db()
+        stages = {"generate": {"workers": self._workers, "queue_depth": queue_depth, "busy": busy}}
+        for stage in self._stages:
+            stages[stage.name] = stage.stats()
+        return {
+            "workers": self._workers,
+            "running": self.running,
+            "queue_max": self._queue_max,
+            "queue_depth": queue_depth,
+            "in_flight": in_flight,
+            "completed": completed,
+            "errors": errors,
+            "stages": stages,
+        }
+
+    def _next_job(self) -> tuple[int, str | None] | None:
+        if self._hold is not None and self._hold() > 0:
+            # Rows (and their wake-up tokens) stay queued; re-checked every poll.
+            self._stop.wait(self._poll_seconds)
+            return None
+
+        try:
+            self._queue.get(timeout=self._poll_seconds)
+        except queue.Empty:
+            pass  # idle: still pick up durable rows (recovered jobs, other producers)
+        else:
+            self._queue.task_done()
+
+        db = self._session_factory()
+        try:
+            claimed = claim_next_job(db, self.worker_id, lease_seconds=self._lease_seconds)
+        finally:
+            db.close()
+        if claimed is None:
+            return None
+
+        job_id, priority = claimed
+        with self._lock:
+            self._priorities[job_id] = priority
+        # Mode is read from the row by the handler.
+        return job_id, None
+
+    def enqueue_stage(self, stage_name: str, job_id: int, priority: int = 0) -> bool:
+        """Hand an existing job straight to a downstream stage (e.g. Drive backfill)."""
+        for stage in self._stages:
+            if stage.name == stage_name:
+                if not self.running:
+                    self.start()
+                with self._lock:
+                    if job_id in self._in_flight:
+                        return False
+                    self._in_flight.add(job_id)
+                    self._priorities[job_id] = priority
+                if stage.put(job_id, priority):
+                    return True
+                with self._lock:
+                    self._in_flight.discard(job_id)
+                    self._priorities.pop(job_id, None)
+                return False
+        raise ValueError("STAGE_NOT_FOUND")
+
+    def feed_stage(self, stage_name: str, job_ids: list[int], priority: int = 0) -> threading.Thread:
+        """
+        `enqueue_stage` for many jobs from a dedicated thread that waits out a
+        full stage queue, so the caller (e.g. a request) returns at once.
+        """
+        if not any(stage.name == stage_name for stage in self._stages):
+            raise ValueError("STAGE_NOT_FOUND")
+
+        def feed() -> None:
+            queued = 0
+            for job_id in job_ids:
+                if self._stop.is_set():
+                    break
+                queued += bool(self.enqueue_stage(stage_name, job_id, priority))
+            print(f"[EXECUTOR] {stage_name}: queued {queued}/{len(job_ids)} jobs")
+
+        thread = threading.Thread(target=feed, name=f"{self._name}-{stage_name}-feed", daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = self._next_job()
+            except Exception as e:
+                print(f"[EXECUTOR] CLAIM FAILED: {e}")
+                self._stop.wait(self._poll_seconds)
+                continue
+            if claimed is None:
+                continue
+
+            job_id, mode = claimed
+            with self._lock:
+                self._in_flight.add(job_id)
+                self._busy += 1
+            forward, ok = False, True
+            try:
+                forward = bool(self._handler(job_id, mode))
+            except Exception as e:
+                ok = False
+                print(f"[JOB {job_id}] EXECUTOR ERROR: {e}")
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                self._stage_finished(0, job_id, forward, ok)
+
+    def _run_loop(self) -> None:
+        asyncio.run(self._run_async())
+
+    async def _run_async(self) -> None:
+        slots = asyncio.Semaphore(self._workers)
+        tasks: set[asyncio.Task] = set()
+        while not self._stop.is_set():
+            await slots.acquire()
+            try:
+                claimed = await asyncio.to_thread(self._next_job)
+            except Exception as e:
+                print(f"[EXECUTOR] CLAIM FAILED: {e}")
+                claimed = None
+                await asyncio.sleep(self._poll_seconds)
+            if claimed is None:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(self._run_async_job(*claimed, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Unfinished jobs keep their checkpoint; the lease expires and they resume.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_async_job(self, job_id: int, mode: str | None, slots: asyncio.Semaphore) -> None:
+        with self._lock:
+            self._in_flight.add(job_id)
+            self._busy += 1
+        forward, ok = False, True
+        try:
+            forward = bool(await self._handler(job_id, mode))
+        except asyncio.CancelledError:
+            with self._lock:
+                self._busy -= 1
+                self._in_flight.discard(job_id)
+            slots.release()
+            raise
+        except Exception as e:
+            ok = False
+            print(f"[JOB {job_id}] EXECUTOR ERROR: {e}")
+        with self._lock:
+            self._busy -= 1
+        slots.release()
+        # Hand-off may block on a full downstream queue; keep it off the loop.
+        await asyncio.to_thread(self._stage_finished, 0, job_id, forward, ok)
+
+    def _stage_finished(self, index: int, job_id: int, forward: bool, ok: bool) -> None:
+        if ok and forward and index < len(self._stages):
+            with self._lock:
+                priority = self._priorities.get(job_id, 0)
+            if self._stages[index].put(job_id, priority):
+                return
+        with self._lock:
+            self._in_flight.discard(job_id)
+            self._priorities.pop(job_id, None)
+            if ok:
+                self._completed += 1
+            else:
+                self._errors += 1
+        self._release(job_id)
+
+    def _release(self, job_id: int) -> None:
+        db = self._session_factory()
+        try:
+            release_job(db, job_id, self.worker_id)
+        except Exception as e:
+            print(f"[JOB {job_id}] LEASE RELEASE FAILED: {e}")
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self._heartbeat_seconds):
+            with self._lock:
+                job_ids = list(self._in_flight)
+            db = self._session_factory()
+            try:
+                heartbeat_jobs(db, job_ids, self.worker_id, lease_seconds=self._lease_seconds)
+                requeue_expired_jobs(db)
+            except Exception as e:
+                print(f"[EXECUTOR] HEARTBEAT FAILED: {e}")
+            finally:
+                db.close()
+
+
+def build_job_executor(
+    *,
+    name: str = "job-worker",
+    workers: int | None = None,
+    postprocess_workers: int = JOB_POSTPROCESS_WORKERS,
+    upload_workers: int = JOB_UPLOAD_WORKERS,
+    async_generate: bool = JOB_ASYNC_GENERATE,
+) -> JobExecutor:
+    from app.modules.jobs.service import (
+        generation_hold_seconds,
+        run_generate_stage,
+        run_generate_stage_async,
+        run_postprocess_stage,
+        run_upload_stage,
+    )
+
+    if async_generate:
+        handler = run_generate_stage_async
+        workers = workers or JOB_ASYNC_CONCURRENCY
+    else:
+        handler = run_generate_stage
+        workers = workers or JOB_WORKERS
+
+    return JobExecutor(
+        handler,
+        workers=workers,
+        name=name,
+        stages=(
+            ("postprocess", run_postprocess_stage, postprocess_workers),
+            ("upload", run_upload_stage, upload_workers),
+        ),
+        hold=generation_hold_seconds,
+    )
+
+
+_executor: JobExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor() -> JobExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = build_job_executor()
+        return _executor
+
+
+def dispatch_job(job_id: int, mode: str | None = None) -> None:
+    # With external workers (`python -m app.worker`) the queued row is the
+    # whole hand-off; they claim it from the database.
+    if JOB_INPROCESS_WORKERS:
+        get_job_executor().submit(job_id, mode)
+
+
+def job_queue_is_full(db: Session) -> bool:
+    # Checked before inserting: the `jobs` table is the queue for in-process
+    # and external workers alike.
+    return count_queued_jobs(db) >= JOB_QUEUE_MAX
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String, Text
+from sqlalchemy import JSON, DateTime, ForeignKey, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
 
@@ -11,8 +11,12 @@ class Job(Base):
     session_id: Mapped[int] = mapped_column(ForeignKey("photo_sessions.id"), index=True)
 
     mode: Mapped[str] = mapped_column(String(20), default="event")
+    theme_id: Mapped[str | None] = mapped_column(String(64), nullable=True)  # overrides the session theme (batch jobs)
     overlay_image_path: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued|processing|done|failed
+    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued|processing|done|failed|cancelled
+    priority: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # lower runs first
+    queued_at: Mapped[datetime | None] = mapped_column(DateTime, default=datetime.utcnow, nullable=True)  # last (re)queue; lanes age from here
+    idempotency_key: Mapped[str | None] = mapped_column(String(128), nullable=True, unique=True, index=True)
     result_image_path: Mapped[str | None] = mapped_column(String(255), nullable=True)
     compressed_image_path: Mapped[str | None] = mapped_column(String(255), nullable=True)
     error_message: Mapped[str | None] = mapped_column(String(500), nullable=True)
@@ -24,3 +28,16 @@ class Job(Base):
     download_link: Mapped[str | None] = mapped_column(String(500), nullable=True)
     qr_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
     drive_uploaded_at: Mapped[DateTime | None] = mapped_column(DateTime, nullable=True)
+
+    # Pipeline checkpoint: last completed stage plus the artifacts it produced.
+    checkpoint_stage: Mapped[str | None] = mapped_column(String(20), nullable=True)  # generate|download|overlay|compress|upload
+    source_url: Mapped[str | None] = mapped_column(Text, nullable=True)
+    raw_result_path: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    deadline_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)  # end of the current run's budget
+    phase_timings: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # seconds per SeedDream phase (encode, upload, ...)
+
+    # Durable queue lease: set when a worker claims the job, renewed by heartbeat.
+    lease_owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
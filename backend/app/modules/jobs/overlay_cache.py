@@ -0,0 +1,174 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from PIL import Image, ImageOps
+
+from app.core.config import OVERLAY_CACHE_MB
+from app.utils.single_flight import KeyedLock
+
+RESAMPLE_LANCZOS = Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.LANCZOS
+
+
+def fit_overlay(
+    overlay_rgba: Image.Image, size: tuple[int, int], *, logger: Callable[[str], None]
+) -> Image.Image:
+    """`overlay_rgba` scaled to `size`, letterboxed (never stretched) when the ratio differs."""
+    result_w, result_h = size
+    overlay_w, overlay_h = overlay_rgba.size
+    if (overlay_w, overlay_h) == (result_w, result_h):
+        logger("overlay: size matched")
+        return overlay_rgba
+
+    src_ratio = overlay_w / overlay_h
+    dst_ratio = result_w / result_h
+    if abs(src_ratio - dst_ratio) < 1e-6:
+        logger(f"overlay: resized to {result_w}x{result_h}")
+        return overlay_rgba.resize((result_w, result_h), RESAMPLE_LANCZOS)
+
+    # Fallback for unexpected ratio mismatch while avoiding stretch.
+    contained = ImageOps.contain(overlay_rgba, (result_w, result_h), method=RESAMPLE_LANCZOS)
+    fitted = Image.new("RGBA", (result_w, result_h), (0, 0, 0, 0))
+    offset_x = (result_w - contained.width) // 2
+    offset_y = (result_h - contained.height) // 2
+    fitted.paste(contained, (offset_x, offset_y), contained)
+    logger("overlay: ratio mismatch, fitted without stretch")
+    return fitted
+
+
+Box = tuple[int, int, int, int]
+
+
+def overlay_regions(image: Image.Image, tile: int = 256) -> list[tuple[Box, bool]]:
+    """
+    Boxes covering every non-transparent pixel of an RGBA overlay, one per
+    `tile`-sized cell at most (a frame's bars and corners, a logo), each
+    flagged when it is fully opaque there and can be pasted without blending.
+    """
+    alpha = image.getchannel("A")
+    regions: list[tuple[Box, bool]] = []
+    for top in range(0, image.height, tile):
+        for left in range(0, image.width, tile):
+            cell = (left, top, min(left + tile, image.width), min(top + tile, image.height))
+            bbox = alpha.crop(cell).getbbox()
+            if bbox is None:
+                continue
+            box = (left + bbox[0], top + bbox[1], left + bbox[2], top + bbox[3])
+            lowest, _ = alpha.crop(box).getextrema()
+            regions.append((box, lowest == 255))
+    return regions
+
+
+class FittedOverlay:
+    """An overlay fitted to one result size, analysed once for where it draws anything."""
+
+    def __init__(self, image: Image.Image) -> None:
+        self.image = image
+        self.regions = overlay_regions(image)
+
+    @property
+    def coverage(self) -> float:
+        """Share of the result's pixels inside the regions."""
+        area = sum((r - l) * (b - t) for (l, t, r, b), _ in self.regions)
+        return area / (self.image.width * self.image.height)
+
+    def composite_onto(self, base: Image.Image) -> Image.Image:
+        """
+        Alpha-composite onto an opaque `base` in place, region by region: the
+        transparent rest of the overlay is never touched, and `base` needs no
+        RGBA copy. Same pixels as `Image.alpha_composite` up to rounding.
+        """
+        for box, opaque in self.regions:
+            layer = self.image.crop(box)
+            if opaque:
+                base.paste(layer, box)
+            else:
+                base.paste(layer, box, layer)
+        return base
+
+
+class OverlayCache:
+    """
+    Fitted, analysed overlays keyed by (path, mtime, target size), least recently
+    used evicted first once over `max_bytes`. An event reuses one or two
+    frames for every job, so after the first job the overlay costs nothing
+    but the composite. Concurrent misses for the same key load once.
+    Cached images are shared: callers must not modify them.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._loading = KeyedLock()
+        self._entries: OrderedDict[tuple[str, int, tuple[int, int]], FittedOverlay] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size_of(fitted: FittedOverlay) -> int:
+        return fitted.image.width * fitted.image.height * 4
+
+    def _lookup(self, key) -> FittedOverlay | None:
+        with self._lock:
+            fitted = self._entries.get(key)
+            if fitted is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return fitted
+
+    def _store(self, key, fitted: FittedOverlay) -> None:
+        size = self._size_of(fitted)
+        with self._lock:
+            if size > self.max_bytes or key in self._entries:
+                return
+            self._entries[key] = fitted
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size_of(evicted)
+
+    def get(
+        self, overlay_abs: Path, size: tuple[int, int], *, logger: Callable[[str], None]
+    ) -> FittedOverlay:
+        # mtime in the key: replacing the file on disk is picked up on the next job.
+        key = (str(overlay_abs.resolve()), overlay_abs.stat().st_mtime_ns, tuple(size))
+        fitted = self._lookup(key)
+        if fitted is not None:
+            logger("overlay: cached")
+            return fitted
+
+        with self._loading.hold(f"{key}"):
+            fitted = self._lookup(key)
+            if fitted is not None:
+                logger("overlay: cached")
+                return fitted
+
+            with Image.open(overlay_abs) as overlay_img:
+                overlay_img.load()
+                logger(f"overlay: loaded {overlay_img.width}x{overlay_img.height}")
+                overlay_rgba = overlay_img.convert("RGBA")
+            fitted = FittedOverlay(fit_overlay(overlay_rgba, size, logger=logger))
+            with self._lock:
+                self.misses += 1
+            self._store(key, fitted)
+            return fitted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+OVERLAY_CACHE = OverlayCache(OVERLAY_CACHE_MB * 1024 * 1024)
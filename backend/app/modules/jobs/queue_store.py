@@ -0,0 +1,167 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_PRIORITY_AGING_SECONDS
+from app.modules.jobs.model import Job
+
+
+def make_worker_id(name: str = "worker") -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{name}:{uuid.uuid4().hex[:6]}"
+
+
+def _lease_until(now: datetime, lease_seconds: int) -> datetime:
+    return now + timedelta(seconds=lease_seconds)
+
+
+def claim_job(
+    db: Session,
+    job_id: int,
+    owner: str,
+    *,
+    lease_seconds: int = JOB_LEASE_SECONDS,
+) -> bool:
+    # Single UPDATE guarded by status so only one worker (thread or process) wins.
+    now = datetime.utcnow()
+    claimed = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.status == "queued")
+        .update(
+            {
+                Job.status: "processing",
+                Job.lease_owner: owner,
+                Job.lease_expires_at: _lease_until(now, lease_seconds),
+                Job.heartbeat_at: now,
+                Job.attempts: Job.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return claimed == 1
+
+
+def _lane_deadline(aging_seconds: float):
+    # queued_at pushed back by `priority * aging_seconds`: guests (priority 0)
+    # go first, but a low lane job still beats anything queued after its deadline.
+    # Aged from the last enqueue, not created_at: a retried old job waits its turn.
+    queued_at = func.coalesce(Job.queued_at, Job.created_at)
+    return func.julianday(queued_at) + Job.priority * (aging_seconds / 86400.0)
+
+
+def claim_next_job(
+    db: Session,
+    owner: str,
+    *,
+    lease_seconds: int = JOB_LEASE_SECONDS,
+    aging_seconds: float = JOB_PRIORITY_AGING_SECONDS,
+    max_tries: int = 5,
+) -> tuple[int, int] | None:
+    """Claim the most urgent queued job; returns `(job_id, priority)`."""
+    for _ in range(max_tries):
+        row = (
+            db.query(Job.id, Job.priority)
+            .filter(Job.status == "queued")
+            .order_by(_lane_deadline(aging_seconds).asc(), Job.id.asc())
+            .first()
+        )
+        if not row:
+            return None
+        if claim_job(db, row[0], owner, lease_seconds=lease_seconds):
+            return row[0], row[1]
+    return None
+
+
+def heartbeat_jobs(
+    db: Session,
+    job_ids: list[int],
+    owner: str,
+    *,
+    lease_seconds: int = JOB_LEASE_SECONDS,
+) -> int:
+    if not job_ids:
+        return 0
+    now = datetime.utcnow()
+    renewed = (
+        db.query(Job)
+        .filter(
+            Job.id.in_(job_ids),
+            Job.status == "processing",
+            Job.lease_owner == owner,
+        )
+        .update(
+            {
+                Job.lease_expires_at: _lease_until(now, lease_seconds),
+                Job.heartbeat_at: now,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return renewed
+
+
+def release_job(db: Session, job_id: int, owner: str) -> None:
+    (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.lease_owner == owner)
+        .update(
+            {Job.lease_owner: None, Job.lease_expires_at: None},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+
+
+def requeue_expired_jobs(
+    db: Session,
+    *,
+    now: datetime | None = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> dict:
+    """
+    Recover jobs whose worker died: `processing` rows with no live lease go back
+    to `queued`, unless they already used up `max_attempts`.
+    """
+    now = now or datetime.utcnow()
+    expired = (
+        Job.status == "processing",
+        (Job.lease_expires_at.is_(None)) | (Job.lease_expires_at < now),
+    )
+
+    failed = (
+        db.query(Job)
+        .filter(*expired, Job.attempts >= max_attempts)
+        .update(
+            {
+                Job.status: "failed",
+                Job.error_message: f"Worker lost {max_attempts} times, giving up",
+                Job.lease_owner: None,
+                Job.lease_expires_at: None,
+            },
+            synchronize_session=False,
+        )
+    )
+    requeued = (
+        db.query(Job)
+        .filter(*expired)
+        .update(
+            {
+                Job.status: "queued",
+                Job.queued_at: now,
+                Job.lease_owner: None,
+                Job.lease_expires_at: None,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return {"requeued": requeued, "failed": failed}
+
+
+def count_queued_jobs(db: Session) -> int:
+    return db.query(Job).filter(Job.status == "queued").count()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from app.core.config import (
+    RESULTS_DIR,
+    SEEDDREAM_RESULT_CACHE,
+    SEEDDREAM_RESULT_CACHE_MB,
+    SEEDDREAM_RESULT_CACHE_TTL_SECONDS,
+)
+
+
+def result_cache_key(input_hash: str, prompt: str, size: str, watermark: bool) -> str:
+    raw = "\0".join([input_hash, prompt, size, "1" if watermark else "0"])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Raw SeedDream results on disk, keyed by `result_cache_key`.
+
+    Entries live in one folder (shared by every worker process) as
+    `<key><ext>`; the file's mtime is its age. A hit hands the job its own
+    copy in RESULTS_DIR, so deleting one job's files never breaks another.
+    Expired entries are dropped on lookup; the oldest go first once the
+    folder is over `max_bytes`.
+    """
+
+    def __init__(self, folder: Path, *, enabled: bool, ttl_seconds: float, max_bytes: int) -> None:
+        self.folder = folder
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def _entry(self, key: str) -> Path | None:
+        matches = list(self.folder.glob(f"{key}.*")) if self.folder.exists() else []
+        return matches[0] if matches else None
+
+    def _expired(self, path: Path) -> bool:
+        return time.time() - path.stat().st_mtime > self.ttl_seconds
+
+    def get(self, key: str, out_dir: Path) -> Path | None:
+        """Copy of the cached result in `out_dir`, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            entry = self._entry(key)
+            if entry is not None and self._expired(entry):
+                entry.unlink(missing_ok=True)
+                entry = None
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out = out_dir / f"{uuid.uuid4().hex}{entry.suffix}"
+            shutil.copyfile(entry, out)
+        except FileNotFoundError:
+            # Evicted by another worker between glob and copy.
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return out
+
+    def put(self, key: str, result: Path) -> None:
+        if not self.enabled:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        tmp = self.folder / f".{key}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(result, tmp)
+        os.replace(tmp, self.folder / f"{key}{result.suffix}")
+        with self._lock:
+            self.stored += 1
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.folder.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes and now - mtime <= self.ttl_seconds:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> int:
+        if not self.folder.exists():
+            return 0
+        removed = 0
+        for path in self.folder.iterdir():
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        entries = [p for p in self.folder.iterdir() if not p.name.startswith(".")] if self.folder.exists() else []
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(entries),
+                "bytes": sum(p.stat().st_size for p in entries if p.exists()),
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stored": self.stored,
+            }
+
+
+RESULT_CACHE = ResultCache(
+    RESULTS_DIR / "cache",
+    enabled=SEEDDREAM_RESULT_CACHE,
+    ttl_seconds=SEEDDREAM_RESULT_CACHE_TTL_SECONDS,
+    max_bytes=SEEDDREAM_RESULT_CACHE_MB * 1024 * 1024,
+)
@@ -0,0 +1,151 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+import requests
+from byteplussdkarkruntime._exceptions import ArkAPIConnectionError, ArkAPIStatusError
+
+from app.core.config import (
+    JOB_GENERATE_ATTEMPTS,
+    JOB_GENERATE_BACKOFF_MAX_SECONDS,
+    JOB_GENERATE_BACKOFF_SECONDS,
+)
+from app.utils.deadline import Deadline, DeadlineExceeded
+
+T = TypeVar("T")
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# Upstream overload or gateway trouble; anything else 4xx is the request's fault.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def _status_code(err: Exception) -> int | None:
+    if isinstance(err, ArkAPIStatusError):
+        return err.status_code
+    response = getattr(err, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def classify_error(err: Exception) -> str:
+    if isinstance(err, DeadlineExceeded):
+        return PERMANENT
+    status = _status_code(err)
+    if status is not None:
+        return TRANSIENT if status in RETRYABLE_STATUS_CODES else PERMANENT
+    if isinstance(
+        err,
+        (
+            ArkAPIConnectionError,  # includes ArkAPITimeoutError
+            httpx.TransportError,
+            requests.ConnectionError,
+            requests.Timeout,
+            TimeoutError,
+            ConnectionError,
+        ),
+    ):
+        return TRANSIENT
+    return PERMANENT
+
+
+def _retry_after(err: Exception) -> float | None:
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RetryPolicy:
+    """
+    Retries a call on transient errors with exponential backoff and full
+    jitter. Every failed attempt is written to `logger`; the last error is
+    re-raised when attempts run out, the error is permanent, or the next
+    wait would not fit in the job deadline.
+    """
+
+    def __init__(
+        self,
+        *,
+        attempts: int = JOB_GENERATE_ATTEMPTS,
+        base_seconds: float = JOB_GENERATE_BACKOFF_SECONDS,
+        max_seconds: float = JOB_GENERATE_BACKOFF_MAX_SECONDS,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.attempts = max(1, attempts)
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self._rng = rng
+
+    def backoff(self, attempt: int, err: Exception) -> float:
+        ceiling = min(self.max_seconds, self.base_seconds * (2 ** (attempt - 1)))
+        delay = ceiling * self._rng()
+        retry_after = _retry_after(err)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_seconds))
+        return delay
+
+    def _next_delay(
+        self,
+        attempt: int,
+        err: Exception,
+        *,
+        what: str,
+        logger: Callable[[str], None],
+        deadline: Deadline | None,
+    ) -> float | None:
+        kind = classify_error(err)
+        if kind == PERMANENT or attempt >= self.attempts:
+            logger(f"{what}: attempt {attempt}/{self.attempts} failed ({kind}: {err})")
+            return None
+
+        delay = self.backoff(attempt, err)
+        remaining = deadline.remaining() if deadline else None
+        if remaining is not None and delay >= remaining:
+            logger(f"{what}: attempt {attempt}/{self.attempts} failed ({kind}: {err}), no time left to retry")
+            return None
+
+        logger(f"{what}: attempt {attempt}/{self.attempts} failed ({kind}: {err}), retrying in {delay:.1f}s")
+        return delay
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        *,
+        what: str,
+        logger: Callable[[str], None],
+        deadline: Deadline | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> T:
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, what=what, logger=logger, deadline=deadline)
+                if delay is None:
+                    raise
+            sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def call_async(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        *,
+        what: str,
+        logger: Callable[[str], None],
+        deadline: Deadline | None = None,
+    ) -> T:
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, what=what, logger=logger, deadline=deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
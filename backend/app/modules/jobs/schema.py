@@ -1,16 +1,26 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal
 
 class JobCreateIn(BaseModel):
     session_id: int
     mode: Literal["event", "debugging"] = "event"
     overlay_url: str | None = None
+    # Lower runs first; defaults to the lane of `mode` (event=0, debugging=90).
+    priority: int | None = Field(default=None, ge=0, le=100)
+
+class JobBatchCreateIn(BaseModel):
+    session_id: int
+    theme_ids: list[str] = Field(min_length=1, max_length=6)
+    mode: Literal["event", "debugging"] = "event"
+    overlay_url: str | None = None
+    priority: int | None = Field(default=None, ge=0, le=100)
 
 class JobOut(BaseModel):
     job_id: int
     session_id: int
     status: str
     mode: Literal["event", "debugging"] = "event"
+    theme_id: str | None = None
     overlay_url: str | None = None
     result_url: str | None = None
     drive_link: str | None = None
@@ -18,3 +28,40 @@ class JobOut(BaseModel):
     qr_url: str | None = None
     error_message: str | None = None
     log_text: str | None = None
+    checkpoint_stage: str | None = None
+    priority: int = 0
+    phase_timings: dict[str, float] | None = None
+
+class JobBatchOut(BaseModel):
+    session_id: int
+    jobs: list[JobOut]
+
+class JobStageStatsOut(BaseModel):
+    workers: int
+    queue_depth: int
+    busy: int
+
+class JobQueueStatsOut(BaseModel):
+    workers: int
+    running: bool
+    inprocess: bool = True
+    queue_max: int
+    queue_depth: int
+    queued_in_db: int = 0
+    in_flight: int
+    completed: int
+    errors: int
+    stages: dict[str, JobStageStatsOut] = {}
+    overlay_cache: dict = {}
+
+class JobPhaseStatsOut(BaseModel):
+    count: int
+    p50: float
+    p90: float
+    p95: float
+    p99: float
+    mean: float
+
+class JobTimingsOut(BaseModel):
+    jobs: int
+    phases: dict[str, JobPhaseStatsOut] = {}
@@ -1,13 +1,19 @@
+import asyncio
 import shutil
+import threading
 import time
 import uuid
 from datetime import datetime
 from pathlib import Path
 from sqlalchemy.orm import Session
-from PIL import Image, ImageOps
+from PIL import Image
 
 from app.db.session import SessionLocal
+from app.integrations.seeddream_breaker import SHARED_BREAKER_STATE, CircuitOpen
 from app.modules.jobs.model import Job
+from app.modules.jobs.overlay_cache import OVERLAY_CACHE
+from app.modules.jobs.result_cache import RESULT_CACHE, result_cache_key
+from app.modules.jobs.retry import RetryPolicy
 from app.modules.sessions.model import PhotoSession
 from app.modules.themes.service import get_theme_by_id
 
@@ -21,20 +27,76 @@ from app.core.config import (
     COMPRESSED_EXTENSION,
     COMPRESSED_QUALITY,
     COMPRESSED_DPI,
+    DOWNLOAD_SEGMENT_MIN_MB,
+    DOWNLOAD_SEGMENTS,
     DRIVE_UPLOAD_SOURCE,
+    JOB_DEADLINE_SECONDS,
+    JOB_UPLOAD_MIN_SECONDS,
+    SEEDDREAM_RESPONSE_FORMAT,
     SEEDDREAM_SIZE,
     SEEDDREAM_WATERMARK,
 )
-from app.utils.encode import file_to_data_url
-from app.utils.files import save_image_from_url
+from app.utils.deadline import Deadline
+from app.utils.encode import file_content_hash, file_to_data_url_cached
+from app.utils.files import (
+    DownloadCancelled,
+    DownloadRejected,
+    save_image_from_url,
+    save_image_from_url_async,
+)
+from app.utils.input_image import prepare_input_image
+from app.utils.timings import PhaseTimings, summarize_phases, timed_phase, track_phases
 
 RESAMPLE_LANCZOS = Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.LANCZOS
 
+# Pipeline stages in order; `Job.checkpoint_stage` holds the last completed one.
+JOB_STAGES = ("generate", "download", "overlay", "compress", "upload")
+
+# Scheduling lanes for `Job.priority` (lower runs first).
+PRIORITY_GUEST = 0
+PRIORITY_BULK = 50
+PRIORITY_DEBUG = 90
+
+# Statuses a job can still be cancelled from, and how often a running stage
+# re-reads the row to notice a cancel.
+CANCELLABLE_STATUSES = ("queued", "processing")
+CANCEL_POLL_SECONDS = 0.5
+
+# Upper bounds per network call; the job deadline shrinks them further.
+GENERATE_TIMEOUT_SECONDS = 90
+DRIVE_UPLOAD_TIMEOUT_SECONDS = 120
+
+# Retries for the SeedDream call only; downloads have their own retry loop.
+GENERATE_RETRY = RetryPolicy()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def generation_hold_seconds() -> float:
+    """
+    Seconds the generate stage should leave queued jobs alone because the
+    SeedDream circuit is open here or in another worker process (0 = claim
+    now). Passed to the executor as `hold`.
+    """
+    try:
+        from app.integrations.seeddream_client import get_seeddream_client
+    except (RuntimeError, ImportError):
+        # No API key (an ImportError while another thread's import is failing):
+        # jobs fail on their own with a clear error.
+        return 0.0
+    return max(get_seeddream_client().breaker.retry_after(), SHARED_BREAKER_STATE.retry_after())
+
 
 def _normalize_mode(mode: str | None) -> str:
     return "debugging" if mode == "debugging" else "event"
 
 
+def default_priority(mode: str | None) -> int:
+    return PRIORITY_DEBUG if _normalize_mode(mode) == "debugging" else PRIORITY_GUEST
+
+
 def _resolve_overlay_abs(overlay_url: str | None) -> Path | None:
     if not overlay_url:
         return None
@@ -57,6 +119,8 @@ def create_job(
     session_id: int,
     mode: str = "event",
     overlay_url: str | None = None,
+    priority: int | None = None,
+    idempotency_key: str | None = None,
 ) -> Job:
     s = db.query(PhotoSession).filter(PhotoSession.id == session_id).first()
     if not s:
@@ -73,6 +137,8 @@ def create_job(
         mode=_normalize_mode(mode),
         overlay_image_path=overlay_url,
         status="queued",
+        priority=default_priority(mode) if priority is None else priority,
+        idempotency_key=idempotency_key,
     )
     db.add(job)
     db.commit()
@@ -80,6 +146,66 @@ def create_job(
     return job
 
 
+def find_job_by_idempotency_key(db: Session, idempotency_key: str, session_id: int) -> Job | None:
+    job = db.query(Job).filter(Job.idempotency_key == idempotency_key).first()
+    if job and job.session_id != session_id:
+        raise ValueError("IDEMPOTENCY_KEY_REUSED")
+    return job
+
+
+def job_phase_stats(db: Session, *, limit: int = 500) -> dict:
+    """Percentiles of the SeedDream phase timings of the last `limit` timed jobs."""
+    rows = (
+        db.query(Job.phase_timings)
+        .filter(Job.phase_timings.isnot(None))
+        .order_by(Job.id.desc())
+        .limit(limit)
+        .all()
+    )
+    samples = [row.phase_timings for row in rows if row.phase_timings]
+    return {"jobs": len(samples), "phases": summarize_phases(samples)}
+
+
+def create_job_batch(
+    db: Session,
+    session_id: int,
+    theme_ids: list[str],
+    mode: str = "event",
+    overlay_url: str | None = None,
+    priority: int | None = None,
+) -> list[Job]:
+    """One queued job per theme for the same uploaded photo (session theme is left as is)."""
+    s = db.query(PhotoSession).filter(PhotoSession.id == session_id).first()
+    if not s:
+        raise ValueError("SESSION_NOT_FOUND")
+    if not s.input_image_path:
+        raise ValueError("PHOTO_NOT_UPLOADED")
+
+    _resolve_overlay_abs(overlay_url)
+
+    unique_theme_ids = list(dict.fromkeys(theme_ids))
+    for theme_id in unique_theme_ids:
+        if not get_theme_by_id(db, theme_id):
+            raise ValueError("THEME_NOT_FOUND")
+
+    jobs = [
+        Job(
+            session_id=session_id,
+            theme_id=theme_id,
+            mode=_normalize_mode(mode),
+            overlay_image_path=overlay_url,
+            status="queued",
+            priority=default_priority(mode) if priority is None else priority,
+        )
+        for theme_id in unique_theme_ids
+    ]
+    db.add_all(jobs)
+    db.commit()
+    for job in jobs:
+        db.refresh(job)
+    return jobs
+
+
 def _resolve_job_static_path(static_path: str | None) -> Path | None:
     if not static_path:
         return None
@@ -108,17 +234,18 @@ def _resolve_drive_upload_path(job: Job) -> tuple[Path, str]:
     raise ValueError("RESULT_FILE_NOT_FOUND")
 
 
-def _attach_drive_info(db: Session, job: Job) -> None:
+def _attach_drive_info(db: Session, job: Job, deadline: Deadline | None = None) -> bool:
     try:
         from app.integrations.gdrive.service import upload_file_to_drive
     except Exception as e:
         print(f"[JOB {job.id}] GDRIVE IMPORT FAILED: {e}")
-        return
+        return False
 
     try:
         file_path, source = _resolve_drive_upload_path(job)
         print(f"[JOB {job.id}] GDRIVE SOURCE: {source} path={file_path}")
-        uploaded = upload_file_to_drive(file_path)
+        timeout = deadline.timeout(DRIVE_UPLOAD_TIMEOUT_SECONDS, "upload") if deadline else None
+        uploaded = upload_file_to_drive(file_path, timeout=timeout)
         job.drive_file_id = uploaded.get("file_id")
         job.drive_link = uploaded.get("drive_link")
         job.download_link = uploaded.get("download_link")
@@ -127,10 +254,12 @@ def _attach_drive_info(db: Session, job: Job) -> None:
         db.commit()
         db.refresh(job)
         print(f"[JOB {job.id}] GDRIVE OK ({source}): {job.drive_link}")
+        return True
     except ValueError as e:
         print(f"[JOB {job.id}] GDRIVE SKIPPED: {e}")
     except Exception as e:
         print(f"[JOB {job.id}] GDRIVE FAILED: {e}")
+    return False
 
 
 def sync_drive_links(
@@ -184,6 +313,41 @@ def sync_drive_links(
     return results
 
 
+def prepare_drive_backfill(db: Session, *, limit: int | None = None) -> list[int]:
+    """Done jobs without a Drive link; their old run deadline is cleared so the upload stage takes them."""
+    query = (
+        db.query(Job.id)
+        .filter(
+            Job.status == "done",
+            Job.result_image_path.isnot(None),
+            Job.drive_link.is_(None),
+        )
+        .order_by(Job.id.desc())
+    )
+    if limit and limit > 0:
+        query = query.limit(limit)
+    job_ids = [job_id for (job_id,) in query.all()]
+    if job_ids:
+        (
+            db.query(Job)
+            .filter(Job.id.in_(job_ids))
+            .update({Job.deadline_at: None}, synchronize_session=False)
+        )
+        db.commit()
+    return job_ids
+
+
+def queue_drive_backfill(job_ids: list[int]) -> None:
+    """
+    Hand finished jobs to the upload stage in the bulk lane, so a backfill
+    never delays guests waiting for their own QR code. Returns at once: the
+    executor feeds them in from its own thread as the upload queue drains.
+    """
+    from app.modules.jobs.executor import get_job_executor
+
+    get_job_executor().feed_stage("upload", job_ids, PRIORITY_BULK)
+
+
 def upload_drive_link_for_job(
     db: Session,
     *,
@@ -246,10 +410,25 @@ def upload_drive_link_for_job(
         "message": "uploaded",
     }
 
-def _generate_event_result(input_abs: Path, prompt: str, *, logger, started_at: float) -> Path:
-    # Keep these steps isolated so overlay can be inserted later after this stage.
-    logger("encoding image")
-    image_data_url = file_to_data_url(input_abs)
+def _input_data_url(input_abs: Path, *, logger) -> str:
+    with timed_phase("encode"):
+        prepared = prepare_input_image(input_abs)
+        logger(f"input: {prepared.stat().st_size // 1024} KB")
+        logger("encoding image")
+        return file_to_data_url_cached(prepared)
+
+
+def _save_result_bytes(data: bytes) -> Path:
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = RESULTS_DIR / f"{uuid.uuid4().hex}.jpg"
+    tmp = out.with_suffix(".part")
+    tmp.write_bytes(data)
+    tmp.replace(out)
+    return out
+
+
+def _request_event_result(input_abs: Path, prompt: str, *, logger, deadline: Deadline) -> str:
+    image_data_url = _input_data_url(input_abs, logger=logger)
 
     logger("calling api")
     from app.integrations.seeddream_client import generate_i2i_url
@@ -259,13 +438,16 @@ def _generate_event_result(input_abs: Path, prompt: str, *, logger, started_at:
         image_data_url=image_data_url,
         size=SEEDDREAM_SIZE,
         watermark=SEEDDREAM_WATERMARK,
+        timeout=deadline.timeout(GENERATE_TIMEOUT_SECONDS, "generate"),
     )
 
     logger("api done")
+    return result_url
 
-    if time.time() - started_at > 180:
-        raise RuntimeError("Job timeout >180s (processing took too long)")
 
+def _download_event_result(
+    result_url: str, *, logger, should_cancel=None, deadline: Deadline | None = None
+) -> Path:
     return save_image_from_url(
         result_url,
         RESULTS_DIR,
@@ -276,7 +458,106 @@ def _generate_event_result(input_abs: Path, prompt: str, *, logger, started_at:
         logger=logger,
         label="downloading",
         progress_step=10,
+        should_cancel=should_cancel,
+        deadline=deadline,
+        segments=DOWNLOAD_SEGMENTS,
+        segment_min_bytes=DOWNLOAD_SEGMENT_MIN_MB * 1024 * 1024,
+    )
+
+
+def _request_event_inline(input_abs: Path, prompt: str, *, logger, deadline: Deadline) -> Path:
+    """`b64_json` mode: the image comes back in the API response, no download."""
+    image_data_url = _input_data_url(input_abs, logger=logger)
+
+    logger("calling api (inline result)")
+    from app.integrations.seeddream_client import generate_i2i_bytes
+
+    data = generate_i2i_bytes(
+        prompt=prompt,
+        image_data_url=image_data_url,
+        size=SEEDDREAM_SIZE,
+        watermark=SEEDDREAM_WATERMARK,
+        timeout=deadline.timeout(GENERATE_TIMEOUT_SECONDS, "generate"),
+    )
+    saved = _save_result_bytes(data)
+    logger(f"api done: {len(data) // 1024} KB inline")
+    return saved
+
+
+async def _request_event_result_async(
+    input_abs: Path, prompt: str, *, logger, deadline: Deadline
+) -> str:
+    image_data_url = await asyncio.to_thread(_input_data_url, input_abs, logger=logger)
+
+    logger("calling api")
+    from app.integrations.seeddream_client import generate_i2i_url_async
+
+    result_url = await generate_i2i_url_async(
+        prompt=prompt,
+        image_data_url=image_data_url,
+        size=SEEDDREAM_SIZE,
+        watermark=SEEDDREAM_WATERMARK,
+        timeout=deadline.timeout(GENERATE_TIMEOUT_SECONDS, "generate"),
+    )
+
+    logger("api done")
+    return result_url
+
+
+async def _download_event_result_async(
+    result_url: str, *, logger, deadline: Deadline | None = None
+) -> Path:
+    return await save_image_from_url_async(
+        result_url,
+        RESULTS_DIR,
+        ext=".jpg",
+        attempts=5,
+        connect_timeout=10,
+        read_timeout=180,
+        logger=logger,
+        label="downloading",
+        progress_step=10,
+        deadline=deadline,
+    )
+
+
+def _cached_result(input_abs: Path, prompt: str, *, logger) -> tuple[str | None, Path | None]:
+    """`(cache key, copy of a cached raw result)`; the key is None while the cache is off."""
+    if not RESULT_CACHE.enabled:
+        return None, None
+    key = result_cache_key(file_content_hash(input_abs), prompt, SEEDDREAM_SIZE, SEEDDREAM_WATERMARK)
+    saved = RESULT_CACHE.get(key, RESULTS_DIR)
+    logger("result cache: hit" if saved else "result cache: miss")
+    return key, saved
+
+
+def _remember_result(key: str | None, saved: Path, *, logger) -> None:
+    if key is None:
+        return
+    try:
+        RESULT_CACHE.put(key, saved)
+    except Exception as e:
+        logger(f"result cache: store failed ({e})")
+
+
+async def _request_event_inline_async(
+    input_abs: Path, prompt: str, *, logger, deadline: Deadline
+) -> Path:
+    image_data_url = await asyncio.to_thread(_input_data_url, input_abs, logger=logger)
+
+    logger("calling api (inline result)")
+    from app.integrations.seeddream_client import generate_i2i_bytes_async
+
+    data = await generate_i2i_bytes_async(
+        prompt=prompt,
+        image_data_url=image_data_url,
+        size=SEEDDREAM_SIZE,
+        watermark=SEEDDREAM_WATERMARK,
+        timeout=deadline.timeout(GENERATE_TIMEOUT_SECONDS, "generate"),
     )
+    saved = await asyncio.to_thread(_save_result_bytes, data)
+    logger(f"api done: {len(data) // 1024} KB inline")
+    return saved
 
 
 def _generate_debug_result(input_abs: Path, *, logger) -> Path:
@@ -288,53 +569,43 @@ def _generate_debug_result(input_abs: Path, *, logger) -> Path:
     return saved
 
 
-def _bake_overlay(result_abs: Path, overlay_abs: Path, *, logger) -> Path:
+def _bake_overlay(result_abs: Path, overlay_abs: Path, *, logger) -> tuple[Path, Image.Image]:
+    """Composite the overlay and save the PNG master; the composite is returned for compression."""
     logger("overlay: loading files")
     with Image.open(result_abs) as result_img:
         result_img.load()
         result_w, result_h = result_img.size
-        result_rgba = result_img.convert("RGBA")
-
-    with Image.open(overlay_abs) as overlay_img:
-        overlay_img.load()
-        overlay_w, overlay_h = overlay_img.size
-        overlay_rgba = overlay_img.convert("RGBA")
+        has_alpha = result_img.mode in ("RGBA", "LA", "PA") or "transparency" in result_img.info
+        if has_alpha:
+            base = result_img.convert("RGBA")
+        else:
+            base = result_img if result_img.mode == "RGB" else result_img.convert("RGB")
 
-    logger(f"overlay: result={result_w}x{result_h}, overlay={overlay_w}x{overlay_h}")
+    logger(f"overlay: result={result_w}x{result_h}")
+    fitted = OVERLAY_CACHE.get(overlay_abs, (result_w, result_h), logger=logger)
 
-    if (overlay_w, overlay_h) == (result_w, result_h):
-        fitted_overlay = overlay_rgba
-        logger("overlay: size matched")
+    if has_alpha:
+        logger("overlay: baking (full frame)")
+        composed = Image.alpha_composite(base, fitted.image)
     else:
-        src_ratio = overlay_w / overlay_h
-        dst_ratio = result_w / result_h
-        if abs(src_ratio - dst_ratio) < 1e-6:
-            fitted_overlay = overlay_rgba.resize((result_w, result_h), RESAMPLE_LANCZOS)
-            logger(f"overlay: resized to {result_w}x{result_h}")
-        else:
-            # Fallback for unexpected ratio mismatch while avoiding stretch.
-            contained = ImageOps.contain(
-                overlay_rgba,
-                (result_w, result_h),
-                method=RESAMPLE_LANCZOS,
-            )
-            fitted_overlay = Image.new("RGBA", (result_w, result_h), (0, 0, 0, 0))
-            offset_x = (result_w - contained.width) // 2
-            offset_y = (result_h - contained.height) // 2
-            fitted_overlay.paste(contained, (offset_x, offset_y), contained)
-            logger("overlay: ratio mismatch, fitted without stretch")
-
-    logger("overlay: baking")
-    composed = Image.alpha_composite(result_rgba, fitted_overlay)
+        # Frames and logos: only the overlay's non-transparent regions are blended.
+        logger(f"overlay: baking {len(fitted.regions)} regions ({fitted.coverage:.0%} of pixels)")
+        composed = fitted.composite_onto(base)
 
     out_path = RESULTS_DIR / f"{uuid.uuid4().hex}.png"
     # Save final composite as PNG so we do not add extra lossy JPEG compression.
     composed.save(out_path, format="PNG", optimize=False, compress_level=3)
     logger("overlay: done")
-    return out_path
+    return out_path, composed
 
 
-def _save_compressed_copy(final_result_abs: Path, *, logger) -> Path:
+def _save_compressed_copy(
+    final_result_abs: Path, *, logger, image: Image.Image | None = None
+) -> Path:
+    """
+    Resized copy of the final result. Pass the already decoded `image` (the
+    overlay composite) to skip decoding the master again.
+    """
     COMPRESSED_DIR.mkdir(parents=True, exist_ok=True)
     output = COMPRESSED_DIR / f"{final_result_abs.stem}{COMPRESSED_EXTENSION}"
 
@@ -342,146 +613,686 @@ def _save_compressed_copy(final_result_abs: Path, *, logger) -> Path:
         f"compression: target={COMPRESSED_TARGET_SIZE[0]}x{COMPRESSED_TARGET_SIZE[1]} "
         f"format={COMPRESSED_FORMAT} quality={COMPRESSED_QUALITY}"
     )
-    with Image.open(final_result_abs) as src:
-        src.load()
-        rgb = src.convert("RGB")
-        resized = rgb.resize(COMPRESSED_TARGET_SIZE, RESAMPLE_LANCZOS)
-        resized.save(
-            output,
-            format=COMPRESSED_FORMAT,
-            quality=COMPRESSED_QUALITY,
-            optimize=True,
-            dpi=COMPRESSED_DPI,
-        )
+    if image is None:
+        with Image.open(final_result_abs) as src:
+            # JPEG results decode straight at a reduced scale (never below the target).
+            src.draft("RGB", COMPRESSED_TARGET_SIZE)
+            src.load()
+            resized = src.convert("RGB").resize(COMPRESSED_TARGET_SIZE, RESAMPLE_LANCZOS)
+    else:
+        resized = image.convert("RGB").resize(COMPRESSED_TARGET_SIZE, RESAMPLE_LANCZOS)
+    resized.save(
+        output,
+        format=COMPRESSED_FORMAT,
+        quality=COMPRESSED_QUALITY,
+        optimize=True,
+        dpi=COMPRESSED_DPI,
+    )
 
     logger(f"compression: saved {output.name}")
     return output
 
 
-def process_job_seeddream_safe(job_id: int, requested_mode: str | None = None) -> None:
-    db: Session = SessionLocal()
-    started_at = time.time()
-    job: Job | None = None
-
-    def mark_failed(msg: str):
-        job2 = db.query(Job).filter(Job.id == job_id).first()
-        if job2:
-            job2.status = "failed"
-            job2.error_message = msg
-            db.commit()
-
-    def log_line(message: str) -> None:
-        nonlocal job
+def _inline_result(stage: str | None) -> bool:
+    # A job that already has a result URL (checkpointed in url mode) still downloads it.
+    return SEEDDREAM_RESPONSE_FORMAT == "b64_json" and _stage_index(stage) < _stage_index("generate")
+
+
+def _stage_index(stage: str | None) -> int:
+    return JOB_STAGES.index(stage) if stage in JOB_STAGES else -1
+
+
+def _static_file_exists(static_path: str | None) -> bool:
+    abs_path = _resolve_job_static_path(static_path)
+    return bool(abs_path and abs_path.exists())
+
+
+def resume_stage(job: Job) -> str | None:
+    """Last completed stage whose checkpoint artifact is still usable."""
+    stage = job.checkpoint_stage if job.checkpoint_stage in JOB_STAGES else None
+    while stage:
+        if stage in ("overlay", "compress", "upload"):
+            usable = _static_file_exists(job.result_image_path)
+        elif stage == "download":
+            usable = _static_file_exists(job.raw_result_path)
+        else:
+            usable = bool(job.source_url)
+        if usable:
+            return stage
+        idx = JOB_STAGES.index(stage)
+        stage = JOB_STAGES[idx - 1] if idx > 0 else None
+    return None
+
+
+def cancel_job(db: Session, job_id: int) -> Job:
+    """
+    Queued jobs are dropped at once (workers only claim `queued` rows).
+    Running jobs stop at the next stage boundary or download chunk.
+    """
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise ValueError("JOB_NOT_FOUND")
+    if job.status == "cancelled":
+        return job
+
+    updated = (
+        db.query(Job)
+        .filter(Job.id == job_id, Job.status.in_(CANCELLABLE_STATUSES))
+        .update(
+            {Job.status: "cancelled", Job.error_message: "Cancelled"},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    db.refresh(job)
+    if not updated:
+        raise ValueError("JOB_NOT_CANCELLABLE")
+    return job
+
+
+def retry_job(db: Session, job_id: int, priority: int | None = None) -> Job:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise ValueError("JOB_NOT_FOUND")
+    if job.status not in ("failed", "cancelled"):
+        raise ValueError("JOB_NOT_RETRYABLE")
+    # A cancel is cooperative: the cancelled run may still be inside a SeedDream
+    # call. Retrying before it releases its lease would run two generations on one row.
+    if job.lease_owner and job.lease_expires_at and job.lease_expires_at > datetime.utcnow():
+        raise ValueError("JOB_NOT_RETRYABLE")
+
+    job.status = "queued"
+    job.queued_at = datetime.utcnow()
+    job.error_message = None
+    if priority is not None:
+        job.priority = priority
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+class _JobRun:
+    """Per-stage DB session plus the log/fail/checkpoint helpers for one job."""
+
+    def __init__(self, job_id: int) -> None:
+        self.job_id = job_id
+        self.db: Session = SessionLocal()
+        self.job: Job | None = self.db.query(Job).filter(Job.id == job_id).first()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def log(self, message: str) -> None:
         print(message)
+        self.log_many([message])
+
+    def log_many(self, messages: list[str]) -> None:
         try:
-            job2 = job or db.query(Job).filter(Job.id == job_id).first()
-            if not job2:
+            job = self.job or self.db.query(Job).filter(Job.id == self.job_id).first()
+            if not job:
                 return
-            job = job2
-            if job2.log_text:
-                job2.log_text = f"{job2.log_text}\n{message}"
+            self.job = job
+            lines = "\n".join(messages)
+            if job.log_text:
+                job.log_text = f"{job.log_text}\n{lines}"
             else:
-                job2.log_text = message
-            db.commit()
+                job.log_text = lines
+            self.db.commit()
         except Exception:
             pass
 
+    def fail(self, msg: str) -> None:
+        # A cancel wins over a failure that raced with it.
+        (
+            self.db.query(Job)
+            .filter(Job.id == self.job_id, Job.status != "cancelled")
+            .update({Job.status: "failed", Job.error_message: msg})
+        )
+        self.db.commit()
+
+    def hold(self) -> None:
+        # Back to the queue for after SeedDream recovers; a hold is not an attempt.
+        (
+            self.db.query(Job)
+            .filter(Job.id == self.job_id, Job.status == "processing")
+            .update(
+                {Job.status: "queued", Job.attempts: Job.attempts - 1},
+                synchronize_session=False,
+            )
+        )
+        self.db.commit()
+
+    def drop_result_url(self) -> None:
+        # The SeedDream result URL expired or was refused: forget the generate
+        # checkpoint so the next run calls SeedDream again.
+        (
+            self.db.query(Job)
+            .filter(Job.id == self.job_id)
+            .update({Job.source_url: None, Job.checkpoint_stage: None}, synchronize_session=False)
+        )
+        self.db.commit()
+
+    @property
+    def deadline(self) -> Deadline:
+        return Deadline.from_datetime(self.job.deadline_at if self.job else None)
+
+    def cancelled(self) -> bool:
+        # Re-read the row: the cancel may come from another process.
+        status = self.db.query(Job.status).filter(Job.id == self.job_id).scalar()
+        return status == "cancelled"
+
+    def checkpoint(self, stage: str, **fields) -> None:
+        for name, value in fields.items():
+            setattr(self.job, name, value)
+        self.job.checkpoint_stage = stage
+        self.db.commit()
+        self.log(f"checkpoint: {stage}")
+
+
+def _throttled(check, interval: float = CANCEL_POLL_SECONDS):
+    """Wrap a cancel check so per-chunk callers hit the database at most every `interval`."""
+    state = {"at": 0.0, "value": False}
+
+    def wrapped() -> bool:
+        now = time.monotonic()
+        if not state["value"] and now - state["at"] >= interval:
+            state["at"] = now
+            state["value"] = check()
+        return state["value"]
+
+    return wrapped
+
+
+def _cancelled_job_ids(job_ids: list[int]) -> set[int]:
+    db = SessionLocal()
     try:
-        job = db.query(Job).filter(Job.id == job_id).first()
-        if not job:
-            log_line("job not found")
-            return
+        rows = db.query(Job.id).filter(Job.id.in_(job_ids), Job.status == "cancelled").all()
+        return {job_id for (job_id,) in rows}
+    finally:
+        db.close()
 
-        mode = _normalize_mode(requested_mode or job.mode)
-        job.status = "processing"
-        job.mode = mode
-        job.log_text = None
-        db.commit()
-        db.refresh(job)
 
-        log_line(f"processing mode={mode}")
+class _CancelWatch:
+    """
+    Cancel polling for every job one event loop has in flight: a single
+    query over all their ids per tick instead of one query per job.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: dict[int, list[asyncio.Future]] = {}
+        self._task: asyncio.Task | None = None
+
+    async def wait(self, job_id: int) -> None:
+        """Return once `job_id` is cancelled."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._poll())
+        try:
+            await future
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    async def _poll(self) -> None:
+        while self._waiters:
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+            job_ids = list(self._waiters)
+            if not job_ids:
+                return
+            try:
+                cancelled = await asyncio.to_thread(_cancelled_job_ids, job_ids)
+            except Exception as e:
+                print(f"[JOB] cancel poll failed: {e}")
+                continue
+            for job_id in cancelled:
+                for future in self._waiters.get(job_id, []):
+                    if not future.done():
+                        future.set_result(None)
+
 
+_cancel_watches: dict[asyncio.AbstractEventLoop, _CancelWatch] = {}
+_cancel_watches_lock = threading.Lock()
 
-        session = db.query(PhotoSession).filter(PhotoSession.id == job.session_id).first()
-        if not session or not session.theme_id or not session.input_image_path:
-            mark_failed("Session not ready (theme/photo missing)")
-            log_line("failed: session not ready")
-            return
 
-        theme = get_theme_by_id(db, session.theme_id)
-        if not theme:
-            mark_failed("Theme not found")
-            log_line("failed: theme not found")
-            return
+def _cancel_watch() -> _CancelWatch:
+    loop = asyncio.get_running_loop()
+    with _cancel_watches_lock:
+        # Drop watches of loops that are gone (e.g. asyncio.run in tests).
+        for old in [other for other in _cancel_watches if other.is_closed()]:
+            del _cancel_watches[old]
+        if loop not in _cancel_watches:
+            _cancel_watches[loop] = _CancelWatch()
+        return _cancel_watches[loop]
 
-        rel = session.input_image_path.lstrip("/")          # static/uploads/xxx.jpeg
-        input_abs = APP_DIR / rel                           # backend/app/static/uploads/xxx.jpeg
 
-        if not input_abs.exists():
-            mark_failed(f"Input file not found: {input_abs}")
-            log_line("failed: input file missing")
-            return
+async def _unless_cancelled(awaitable, run: _JobRun):
+    """Await `awaitable`, abandoning it (and freeing the slot) once the job is cancelled."""
+    task = asyncio.ensure_future(awaitable)
+    cancelled = asyncio.ensure_future(_cancel_watch().wait(run.job_id))
+    try:
+        await asyncio.wait({task, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        raise JobCancelled()
+    finally:
+        for pending in (task, cancelled):
+            if not pending.done():
+                pending.cancel()
+
+
+def _prepare_generate(run: _JobRun, requested_mode: str | None) -> tuple | bool:
+    """
+    Mark the job processing and load its inputs.
+    Returns False to stop, True when generation is already checkpointed,
+    otherwise `(mode, stage, input_abs, prompt)`.
+    """
+    job = run.job
+    if not job:
+        run.log("job not found")
+        return False
+    if job.status == "cancelled":
+        run.log("cancelled: before start")
+        return False
+
+    mode = _normalize_mode(requested_mode or job.mode)
+    stage = resume_stage(job)
+    job.status = "processing"
+    job.mode = mode
+    # Every run (first try, lease recovery or retry) gets a fresh budget.
+    job.deadline_at = Deadline.expires_after(JOB_DEADLINE_SECONDS) if JOB_DEADLINE_SECONDS else None
+    if stage is None:
+        # The log is kept: a held or retried job shows its earlier runs too.
+        job.checkpoint_stage = None
+        job.phase_timings = None
+    run.db.commit()
+    run.db.refresh(job)
+
+    if stage:
+        run.log(f"processing mode={mode} (resuming after {stage})")
+    else:
+        run.log(f"processing mode={mode}")
 
+    if _stage_index(stage) >= _stage_index("download"):
+        return True
+
+    session = run.db.query(PhotoSession).filter(PhotoSession.id == job.session_id).first()
+    theme_id = job.theme_id or (session.theme_id if session else None)
+    if not session or not theme_id or not session.input_image_path:
+        run.fail("Session not ready (theme/photo missing)")
+        run.log("failed: session not ready")
+        return False
+
+    theme = get_theme_by_id(run.db, theme_id)
+    if not theme:
+        run.fail("Theme not found")
+        run.log("failed: theme not found")
+        return False
+
+    rel = session.input_image_path.lstrip("/")          # static/uploads/xxx.jpeg
+    input_abs = APP_DIR / rel                           # backend/app/static/uploads/xxx.jpeg
+
+    if not input_abs.exists():
+        run.fail(f"Input file not found: {input_abs}")
+        run.log("failed: input file missing")
+        return False
+
+    return mode, stage, input_abs, theme.prompt
+
+
+def run_generate_stage(job_id: int, requested_mode: str | None = None) -> bool:
+    """
+    Network-bound stage: SeedDream request and result download.
+    Returns True when the raw result is on disk and post-processing can start.
+    """
+    run = _JobRun(job_id)
+    try:
+        prepared = _prepare_generate(run, requested_mode)
+        if isinstance(prepared, bool):
+            return prepared
+        mode, stage, input_abs, prompt = prepared
+
+        with track_phases(PhaseTimings(run.job.phase_timings)) as phases:
+            try:
+                if mode == "debugging":
+                    saved = _generate_debug_result(input_abs, logger=run.log)
+                else:
+                    cache_key, saved = _cached_result(input_abs, prompt, logger=run.log)
+                if saved is None:
+                    if _inline_result(stage):
+                        saved = GENERATE_RETRY.call(
+                            lambda: _request_event_inline(
+                                input_abs,
+                                prompt,
+                                logger=run.log,
+                                deadline=run.deadline,
+                            ),
+                            what="generate",
+                            logger=run.log,
+                            deadline=run.deadline,
+                        )
+                    else:
+                        if _stage_index(stage) < _stage_index("generate"):
+                            source_url = GENERATE_RETRY.call(
+                                lambda: _request_event_result(
+                                    input_abs,
+                                    prompt,
+                                    logger=run.log,
+                                    deadline=run.deadline,
+                                ),
+                                what="generate",
+                                logger=run.log,
+                                deadline=run.deadline,
+                            )
+                            run.checkpoint(
+                                "generate", source_url=source_url, phase_timings=phases.as_dict()
+                            )
+                            if run.cancelled():
+                                raise JobCancelled()
+                        saved = _download_event_result(
+                            run.job.source_url,
+                            logger=run.log,
+                            should_cancel=_throttled(run.cancelled),
+                            deadline=run.deadline,
+                        )
+                    _remember_result(cache_key, saved, logger=run.log)
+            except (JobCancelled, DownloadCancelled):
+                run.log("cancelled: generate")
+                return False
+            except CircuitOpen as e:
+                run.hold()
+                run.log(f"held: {e}")
+                return False
+            except DownloadRejected as e:
+                run.drop_result_url()
+                run.fail(str(e))
+                run.log("failed: result URL rejected, a retry generates again")
+                return False
+            except Exception as e:
+                run.fail(str(e))
+                run.log("failed: generate")
+                return False
+
+            if phases.as_dict():
+                run.log(f"timings: {phases.summary()}")
+            run.checkpoint(
+                "download",
+                raw_result_path=f"/static/results/{saved.name}",
+                phase_timings=phases.as_dict() or None,
+            )
+            if run.cancelled():
+                run.log("cancelled: after download")
+                return False
+            return True
+
+    except Exception as e:
+        run.log(f"failed: {e}")
         try:
-            if mode == "debugging":
-                saved = _generate_debug_result(input_abs, logger=log_line)
-            else:
-                saved = _generate_event_result(
-                    input_abs,
-                    theme.prompt,
-                    logger=log_line,
-                    started_at=started_at,
-                )
-        except Exception as e:
-            mark_failed(str(e))
-            log_line("failed: generate")
-            return
+            run.fail(str(e))
+        except Exception:
+            pass
+        return False
+    finally:
+        run.close()
+
+
+async def run_generate_stage_async(job_id: int, requested_mode: str | None = None) -> bool:
+    """
+    Event-loop variant of `run_generate_stage`: the SeedDream call and the
+    download are awaited, so one thread can keep many generations in flight.
+    Database writes go through `asyncio.to_thread`; log lines are buffered
+    and flushed at stage boundaries.
+    """
+    run = await asyncio.to_thread(_JobRun, job_id)
+    pending: list[str] = []
 
-        overlay_abs = _resolve_overlay_abs(job.overlay_image_path)
-        if overlay_abs:
+    def log(message: str) -> None:
+        print(message)
+        pending.append(message)
+
+    async def flush() -> None:
+        if pending:
+            lines = pending[:]
+            pending.clear()
+            await asyncio.to_thread(run.log_many, lines)
+
+    def prepare() -> tuple:
+        # Read the row here, in the worker thread: after a commit the ORM
+        # attributes are expired, and touching them on the loop would block it
+        # on a SELECT.
+        prepared = _prepare_generate(run, requested_mode)
+        if isinstance(prepared, bool):
+            return prepared, None, None, None
+        job = run.job
+        return prepared, job.phase_timings, job.source_url, run.deadline
+
+    try:
+        prepared, phase_timings, source_url, deadline = await asyncio.to_thread(prepare)
+        if isinstance(prepared, bool):
+            return prepared
+        mode, stage, input_abs, prompt = prepared
+
+        with track_phases(PhaseTimings(phase_timings)) as phases:
             try:
-                baked = _bake_overlay(saved, overlay_abs, logger=log_line)
-                if baked != saved and saved.exists():
-                    try:
-                        saved.unlink()
-                    except Exception:
-                        pass
-                saved = baked
+                if mode == "debugging":
+                    saved = await asyncio.to_thread(_generate_debug_result, input_abs, logger=log)
+                else:
+                    cache_key, saved = await asyncio.to_thread(
+                        _cached_result, input_abs, prompt, logger=log
+                    )
+                if saved is None:
+                    if _inline_result(stage):
+                        saved = await _unless_cancelled(
+                            GENERATE_RETRY.call_async(
+                                lambda: _request_event_inline_async(
+                                    input_abs,
+                                    prompt,
+                                    logger=log,
+                                    deadline=deadline,
+                                ),
+                                what="generate",
+                                logger=log,
+                                deadline=deadline,
+                            ),
+                            run,
+                        )
+                    else:
+                        if _stage_index(stage) < _stage_index("generate"):
+                            source_url = await _unless_cancelled(
+                                GENERATE_RETRY.call_async(
+                                    lambda: _request_event_result_async(
+                                        input_abs,
+                                        prompt,
+                                        logger=log,
+                                        deadline=deadline,
+                                    ),
+                                    what="generate",
+                                    logger=log,
+                                    deadline=deadline,
+                                ),
+                                run,
+                            )
+                            await flush()
+                            await asyncio.to_thread(
+                                run.checkpoint,
+                                "generate",
+                                source_url=source_url,
+                                phase_timings=phases.as_dict(),
+                            )
+                        saved = await _unless_cancelled(
+                            _download_event_result_async(
+                                source_url, logger=log, deadline=deadline
+                            ),
+                            run,
+                        )
+                    await asyncio.to_thread(_remember_result, cache_key, saved, logger=log)
+            except JobCancelled:
+                await flush()
+                await asyncio.to_thread(run.log, "cancelled: generate")
+                return False
+            except CircuitOpen as e:
+                await flush()
+                await asyncio.to_thread(run.hold)
+                await asyncio.to_thread(run.log, f"held: {e}")
+                return False
+            except DownloadRejected as e:
+                await flush()
+                await asyncio.to_thread(run.drop_result_url)
+                await asyncio.to_thread(run.fail, str(e))
+                await asyncio.to_thread(run.log, "failed: result URL rejected, a retry generates again")
+                return False
             except Exception as e:
-                mark_failed(str(e))
-                log_line("failed: overlay")
-                return
-        else:
-            log_line("overlay: skipped")
+                await flush()
+                await asyncio.to_thread(run.fail, str(e))
+                await asyncio.to_thread(run.log, "failed: generate")
+                return False
+
+            if phases.as_dict():
+                log(f"timings: {phases.summary()}")
+            await flush()
+            await asyncio.to_thread(
+                run.checkpoint,
+                "download",
+                raw_result_path=f"/static/results/{saved.name}",
+                phase_timings=phases.as_dict() or None,
+            )
+            if await asyncio.to_thread(run.cancelled):
+                await asyncio.to_thread(run.log, "cancelled: after download")
+                return False
+            return True
 
-        compressed_rel_path = None
+    except Exception as e:
         try:
-            compressed_saved = _save_compressed_copy(saved, logger=log_line)
-            compressed_rel_path = f"/static/compressed/{compressed_saved.name}"
-        except Exception as e:
-            log_line(f"compression: failed ({e})")
-
-        job2 = db.query(Job).filter(Job.id == job_id).first()
-        if not job2:
-            log_line("job missing before final commit")
-            return
-
-        job2.status = "done"
-        job2.mode = mode
-        job2.result_image_path = f"/static/results/{saved.name}"
-        job2.compressed_image_path = compressed_rel_path
-        db.commit()
-        db.refresh(job2)
+            await flush()
+            await asyncio.to_thread(run.log, f"failed: {e}")
+            await asyncio.to_thread(run.fail, str(e))
+        except Exception:
+            pass
+        return False
+    finally:
+        await asyncio.to_thread(run.close)
+
+
+def run_postprocess_stage(job_id: int) -> bool:
+    """
+    CPU-bound stage: overlay bake and compressed copy, then mark the job done.
+    Returns True when the Drive upload is still pending.
+    """
+    run = _JobRun(job_id)
+    try:
+        job = run.job
+        if not job:
+            run.log("job not found")
+            return False
+        if job.status == "cancelled":
+            run.log("cancelled: before post-process")
+            return False
+
+        stage = resume_stage(job)
+        if _stage_index(stage) < _stage_index("download"):
+            run.fail("Result not downloaded")
+            run.log("failed: nothing to post-process")
+            return False
+
+        # The result is already generated and paid for: past the deadline the
+        # CPU stages still finish (late), only the overrun is logged.
+        deadline = run.deadline
+        composed = None  # overlay composite, kept for the compressed copy
+        if _stage_index(stage) < _stage_index("overlay"):
+            if deadline.expired():
+                run.log("deadline: overlay started past the job deadline")
+            saved = _resolve_job_static_path(job.raw_result_path)
+            try:
+                overlay_abs = _resolve_overlay_abs(job.overlay_image_path)
+                if overlay_abs:
+                    baked, composed = _bake_overlay(saved, overlay_abs, logger=run.log)
+                else:
+                    baked = saved
+                    run.log("overlay: skipped")
+            except Exception as e:
+                run.fail(str(e))
+                run.log("failed: overlay")
+                return False
+
+            if baked != saved:
+                run.checkpoint(
+                    "overlay",
+                    result_image_path=f"/static/results/{baked.name}",
+                    raw_result_path=None,
+                )
+                try:
+                    saved.unlink()
+                except Exception:
+                    pass
+            else:
+                run.checkpoint("overlay", result_image_path=job.raw_result_path)
+
+        if run.cancelled():
+            run.log("cancelled: after overlay")
+            return False
 
-        log_line("done")
+        if _stage_index(stage) < _stage_index("compress"):
+            if deadline.expired():
+                run.log("deadline: compress started past the job deadline")
+            final_abs = _resolve_job_static_path(job.result_image_path)
+            compressed_rel_path = None
+            try:
+                compressed_saved = _save_compressed_copy(final_abs, logger=run.log, image=composed)
+                compressed_rel_path = f"/static/compressed/{compressed_saved.name}"
+            except Exception as e:
+                run.log(f"compression: failed ({e})")
+
+            run.checkpoint("compress", compressed_image_path=compressed_rel_path)
+
+        if run.cancelled():
+            run.log("cancelled: after compress")
+            return False
 
-        _attach_drive_info(db, job2)
+        job.status = "done"
+        run.db.commit()
+        run.db.refresh(job)
+
+        run.log("done")
+        return _stage_index(stage) < _stage_index("upload")
 
     except Exception as e:
-        log_line(f"failed: {e}")
+        run.log(f"failed: {e}")
         try:
-            mark_failed(str(e))
+            run.fail(str(e))
         except Exception:
             pass
+        return False
     finally:
-        db.close()
+        run.close()
+
+
+def run_upload_stage(job_id: int) -> bool:
+    """Network-bound stage: Drive upload. The job is already `done` here."""
+    run = _JobRun(job_id)
+    try:
+        job = run.job
+        if not job or job.checkpoint_stage == "upload" or job.drive_link:
+            return False
+        # The job is already done, and the guest's QR link needs this upload:
+        # past the deadline it still gets its own minimum budget.
+        deadline = run.deadline
+        if deadline.expired():
+            run.log("deadline: upload started past the job deadline")
+        deadline = deadline.at_least(JOB_UPLOAD_MIN_SECONDS)
+        if _attach_drive_info(run.db, job, deadline=deadline):
+            run.checkpoint("upload")
+        return False
+    except Exception as e:
+        run.log(f"upload: failed ({e})")
+        return False
+    finally:
+        run.close()
+
+
+def process_job_seeddream_safe(job_id: int, requested_mode: str | None = None) -> None:
+    """Run every stage in order on the calling thread."""
+    if run_generate_stage(job_id, requested_mode) and run_postprocess_stage(job_id):
+        run_upload_stage(job_id)
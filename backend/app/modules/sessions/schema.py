@@ -12,7 +12,7 @@ class JobOut(BaseModel):
     session_id: int
     mode: Literal["event", "debugging"] = "event"
     overlay_url: Optional[str] = None
-    status: Literal["queued", "processing", "done", "failed"]
+    status: Literal["queued", "processing", "done", "failed", "cancelled"]
     result_url: Optional[str] = None
     error_message: Optional[str] = None
 
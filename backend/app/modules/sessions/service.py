@@ -5,7 +5,9 @@ from app.modules.sessions.model import PhotoSession
 from app.modules.sessions.schema import SessionStartIn
 from app.modules.themes.service import get_theme_by_id
 
-def start_session(db: Session, payload: SessionStartIn) -> PhotoSession:
+def start_session(
+    db: Session, payload: SessionStartIn, idempotency_key: str | None = None
+) -> PhotoSession:
     # find-or-create user by email
     user = db.query(User).filter(User.email == payload.email).first()
     if user is None:
@@ -19,13 +21,25 @@ def start_session(db: Session, payload: SessionStartIn) -> PhotoSession:
         user.phone = payload.phone
         db.commit()
 
-    s = PhotoSession(user_id=user.id, status="draft")
+    s = PhotoSession(user_id=user.id, status="draft", idempotency_key=idempotency_key)
     db.add(s)
     db.commit()
     db.refresh(s)
     return s
 
 
+def find_session_by_idempotency_key(
+    db: Session, idempotency_key: str, email: str
+) -> PhotoSession | None:
+    s = db.query(PhotoSession).filter(PhotoSession.idempotency_key == idempotency_key).first()
+    if s is None:
+        return None
+    user = db.query(User).filter(User.id == s.user_id).first()
+    if user is None or user.email != email:
+        raise ValueError("IDEMPOTENCY_KEY_REUSED")
+    return s
+
+
 def set_session_theme(db: Session, session_id: int, theme_id: str) -> PhotoSession:
     s = db.query(PhotoSession).filter(PhotoSession.id == session_id).first()
     if s is None:
@@ -0,0 +1,53 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class Deadline:
+    """
+    Wall-clock budget for one job run. Stages read it from `Job.deadline_at`
+    and shrink their own timeouts to whatever is left.
+    """
+
+    def __init__(self, expires_at: float | None) -> None:
+        self.expires_at = expires_at  # time.time() epoch, None = no limit
+
+    @classmethod
+    def from_datetime(cls, value: datetime | None) -> "Deadline":
+        if value is None:
+            return cls(None)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)  # stored as naive UTC
+        return cls(value.timestamp())
+
+    @staticmethod
+    def expires_after(seconds: float) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=seconds)
+
+    def remaining(self) -> float | None:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.time()
+
+    def at_least(self, seconds: float) -> "Deadline":
+        """This budget, or `seconds` from now when less than that is left."""
+        if self.expires_at is None:
+            return self
+        return Deadline(max(self.expires_at, time.time() + seconds))
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self, what: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"JOB_DEADLINE_EXCEEDED: {what}")
+
+    def timeout(self, cap: float, what: str) -> float:
+        """`cap` shrunk to the remaining budget; raises once nothing is left."""
+        self.check(what)
+        remaining = self.remaining()
+        return cap if remaining is None else min(cap, remaining)
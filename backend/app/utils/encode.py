@@ -1,18 +1,153 @@
+from collections import OrderedDict
 from pathlib import Path
 import base64
+import hashlib
+import threading
+
+from app.core.config import SEEDDREAM_ENCODE_CACHE_MB
+
+
+def _mime_for(file_path: Path) -> str:
+    suffix = file_path.suffix.lower()
+    if suffix == ".png":
+        return "image/png"
+    if suffix == ".webp":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def bytes_to_data_url(data: bytes, mime: str) -> str:
+    b64 = base64.b64encode(data).decode("utf-8")
+    return f"data:{mime};base64,{b64}"
+
 
 def file_to_data_url(file_path: Path) -> str:
     """
     Return format:
     data:image/jpeg;base64,AAAA...
     """
-    suffix = file_path.suffix.lower()
-    mime = "image/jpeg"
-    if suffix == ".png":
-        mime = "image/png"
-    elif suffix == ".webp":
-        mime = "image/webp"
+    return bytes_to_data_url(file_path.read_bytes(), _mime_for(file_path))
 
-    data = file_path.read_bytes()
-    b64 = base64.b64encode(data).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+
+class DataUrlCache:
+    """
+    LRU of data URLs keyed by the file's content hash, bounded by `max_bytes`.
+
+    A second map remembers which hash an unchanged file (path, mtime, size)
+    has, so a repeat generation from the same photo (retry, extra theme)
+    costs one `stat` instead of a read, a hash and a base64 encode.
+    Concurrent misses for the same file are encoded once.
+    """
+
+    def __init__(self, max_bytes: int, max_files: int = 256) -> None:
+        self.max_bytes = max_bytes
+        self._max_files = max_files
+        self._lock = threading.Lock()
+        self._urls: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._bytes = 0
+        self._digests: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+        self._loading: dict[tuple[str, int, int], threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _file_key(file_path: Path) -> tuple[str, int, int]:
+        stat = file_path.stat()
+        return str(file_path.resolve()), stat.st_mtime_ns, stat.st_size
+
+    def _remember_digest(self, file_key: tuple[str, int, int], digest: str) -> None:
+        # Caller holds the lock.
+        self._digests[file_key] = digest
+        self._digests.move_to_end(file_key)
+        while len(self._digests) > self._max_files:
+            self._digests.popitem(last=False)
+
+    def _lookup(self, file_key: tuple[str, int, int], mime: str) -> str | None:
+        # Caller holds the lock.
+        digest = self._digests.get(file_key)
+        url = self._urls.get((digest, mime)) if digest else None
+        if url is not None:
+            self._urls.move_to_end((digest, mime))
+            self.hits += 1
+        return url
+
+    def _store(self, key: tuple[str, str], url: str) -> None:
+        # Caller holds the lock.
+        if len(url) > self.max_bytes or key in self._urls:
+            return
+        self._urls[key] = url
+        self._bytes += len(url)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._urls.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def digest(self, file_path: Path) -> str:
+        """sha256 of the file's content, memoized while the file is unchanged."""
+        file_key = self._file_key(file_path)
+        with self._lock:
+            digest = self._digests.get(file_key)
+        if digest is None:
+            digest = hashlib.sha256(file_path.read_bytes()).hexdigest()
+            with self._lock:
+                self._remember_digest(file_key, digest)
+        return digest
+
+    def get(self, file_path: Path) -> str:
+        file_key = self._file_key(file_path)
+        mime = _mime_for(file_path)
+        with self._lock:
+            url = self._lookup(file_key, mime)
+            if url is not None:
+                return url
+            key_lock = self._loading.setdefault(file_key, threading.Lock())
+
+        with key_lock:
+            try:
+                with self._lock:
+                    url = self._lookup(file_key, mime)
+                    if url is not None:
+                        return url
+
+                data = file_path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                with self._lock:
+                    self._remember_digest(file_key, digest)
+                    url = self._urls.get((digest, mime))  # same photo under another name
+                    if url is not None:
+                        self.hits += 1
+                        return url
+                    self.misses += 1
+
+                url = bytes_to_data_url(data, mime)
+                with self._lock:
+                    self._store((digest, mime), url)
+                return url
+            finally:
+                with self._lock:
+                    self._loading.pop(file_key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._urls),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_data_urls = DataUrlCache(SEEDDREAM_ENCODE_CACHE_MB * 1024 * 1024)
+
+
+def file_to_data_url_cached(file_path: Path) -> str:
+    """`file_to_data_url` through the shared content-hash cache."""
+    return _data_urls.get(file_path)
+
+
+def file_content_hash(file_path: Path) -> str:
+    return _data_urls.digest(file_path)
+
+
+def encode_cache_stats() -> dict:
+    return _data_urls.stats()
@@ -1,10 +1,344 @@
 from pathlib import Path
+import asyncio
+import re
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import threading
 import time
 import uuid
 from typing import Callable
+import httpx
 import requests
+import requests.adapters
 from fastapi import UploadFile
 
+from app.core.config import DOWNLOAD_MAX_CONNECTIONS
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.timings import record_phase
+
+
+class DownloadCancelled(RuntimeError):
+    pass
+
+
+class DownloadRejected(RuntimeError):
+    """The server refused the URL itself (e.g. an expired signed URL); retrying it cannot help."""
+
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"DOWNLOAD_REJECTED: HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _rejected_status(err: Exception) -> int | None:
+    # 408/429 are worth another try; 416 means our partial file was stale (removed already).
+    status = getattr(getattr(err, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 416, 429):
+        return status
+    return None
+
+
+_clients_lock = threading.Lock()
+_session: requests.Session | None = None
+_async_clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+class _DownloadProgress:
+    """Progress/log lines shared by the sync and async downloaders."""
+
+    def __init__(
+        self,
+        *,
+        logger: Callable[[str], None] | None,
+        log_prefix: str,
+        label: str,
+        progress_step: int,
+    ) -> None:
+        self.logger = logger
+        self.log_prefix = log_prefix
+        self.label = label
+        self.progress_step = progress_step
+        self.total_bytes: int | None = None
+        self.downloaded = 0
+        self.last_printed = -1
+
+    def emit(self, message: str) -> None:
+        if self.logger:
+            self.logger(message)
+        else:
+            print(message)
+
+    def begin(self, attempt: int, attempts: int, content_length: str | None, resumed: int = 0) -> None:
+        # On a resumed attempt Content-Length only covers the rest of the file.
+        length = int(content_length) if content_length and content_length.isdigit() else None
+        self.total_bytes = length + resumed if length is not None else None
+        self.downloaded = resumed
+        self.last_printed = int(resumed * 100 / self.total_bytes) if resumed and self.total_bytes else -1
+
+        if resumed:
+            if self.logger:
+                self.emit(f"{self.label} resuming at {resumed // 1024} KB")
+            else:
+                self.emit(f"{self.log_prefix} attempt {attempt}/{attempts} resuming at {resumed} bytes")
+            return
+
+        if self.total_bytes:
+            if not self.logger:
+                self.emit(f"{self.log_prefix} attempt {attempt}/{attempts} total={self.total_bytes} bytes")
+        else:
+            if self.logger:
+                self.emit(f"{self.label}")
+            else:
+                self.emit(f"{self.log_prefix} attempt {attempt}/{attempts} total=unknown")
+
+    def advance(self, chunk_len: int) -> None:
+        self.downloaded += chunk_len
+        label, log_prefix = self.label, self.log_prefix
+
+        if self.total_bytes:
+            pct = int(self.downloaded * 100 / self.total_bytes)
+            # print tiap progress_step% (10%, 20%, ...)
+            if pct >= 100:
+                pct = 100
+            if pct // self.progress_step != self.last_printed // self.progress_step:
+                self.last_printed = pct
+                self.emit(f"{label} {pct}%" if self.logger else f"{log_prefix} {pct}%")
+        else:
+            # fallback kalau tidak ada Content-Length
+            # print tiap ~1MB
+            if self.downloaded % (1024 * 1024) < chunk_len:
+                mb = self.downloaded / (1024 * 1024)
+                self.emit(f"{label} {mb:.1f} MB" if self.logger else f"{log_prefix} downloaded {mb:.1f} MB")
+
+    def finish(self, out_path: Path) -> None:
+        # pastikan selalu ada 100% kalau total_bytes ada
+        if self.total_bytes and self.last_printed < 100:
+            self.emit(f"{self.label} 100%" if self.logger else f"{self.log_prefix} 100%")
+
+        if not self.logger:
+            self.emit(f"{self.log_prefix} completed -> {out_path.name}")
+
+    def failed(self, attempt: int, attempts: int, err: Exception, sleep_s: float) -> None:
+        if self.logger:
+            self.emit("download failed, retrying")
+        else:
+            self.emit(f"{self.log_prefix} attempt {attempt}/{attempts} failed: {err} (retry in {sleep_s}s)")
+
+
+def _attempt_timeouts(
+    deadline: Deadline | None, connect_timeout: float, read_timeout: float
+) -> tuple[float, float]:
+    # Shrink per-attempt timeouts to the job's remaining budget.
+    if deadline is None:
+        return connect_timeout, read_timeout
+    return (
+        deadline.timeout(connect_timeout, "download"),
+        deadline.timeout(read_timeout, "download"),
+    )
+
+
+def _backoff_seconds(attempt: int, deadline: Deadline | None) -> float:
+    sleep_s = min(2 ** (attempt - 1), 10)
+    remaining = deadline.remaining() if deadline else None
+    if remaining is not None:
+        sleep_s = max(0, min(sleep_s, remaining))
+    return sleep_s
+
+
+def _resume_request(out_path: Path, validator: str | None) -> tuple[int, dict[str, str]]:
+    """Bytes already on disk from a failed attempt, and the headers asking for the rest."""
+    offset = out_path.stat().st_size if out_path.exists() else 0
+    if not offset:
+        return 0, {}
+    headers = {"Range": f"bytes={offset}-"}
+    if validator:
+        # The server sends the whole file instead if it changed in between.
+        headers["If-Range"] = validator
+    return offset, headers
+
+
+def _validator(headers) -> str | None:
+    # If-Range takes a strong ETag or a date. Without either the URL is
+    # trusted: SeedDream result URLs point at immutable objects.
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _resumed_offset(status_code: int, headers, offset: int) -> int:
+    """Where this response's body goes in the file; 0 when it is the whole file."""
+    if not offset or status_code != 206:
+        return 0
+    content_range = headers.get("Content-Range", "")
+    match = re.match(r"bytes (\d+)-", content_range)
+    if not match or int(match.group(1)) != offset:
+        raise RuntimeError(f"DOWNLOAD_BAD_RANGE: {content_range!r}")
+    return offset
+
+
+def _already_complete(status_code: int, headers, offset: int, out_path: Path) -> bool:
+    # 416 for `bytes=<size>-`: the previous attempt got every byte but failed after.
+    if not offset or status_code != 416:
+        return False
+    total = headers.get("Content-Range", "").rpartition("/")[2]
+    if total.isdigit() and int(total) == offset:
+        return True
+    _remove_partial(out_path)  # not ours to append to; start over
+    return False
+
+
+def _download_session() -> requests.Session:
+    """Keep-alive session shared by every result download in the process."""
+    global _session
+    with _clients_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=DOWNLOAD_MAX_CONNECTIONS,
+                pool_maxsize=DOWNLOAD_MAX_CONNECTIONS,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _async_download_client() -> httpx.AsyncClient:
+    """Keep-alive httpx client for downloads, one per event loop."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        # Drop clients of loops that are gone (e.g. asyncio.run in tests).
+        for old in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[old]
+        if loop not in _async_clients:
+            _async_clients[loop] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=DOWNLOAD_MAX_CONNECTIONS,
+                    max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS,
+                ),
+                follow_redirects=True,
+            )
+        return _async_clients[loop]
+
+
+def _remove_partial(out_path: Path) -> None:
+    # hapus file partial sebelum retry
+    try:
+        if out_path.exists():
+            out_path.unlink()
+    except Exception:
+        pass
+
+
+def _probe_ranges(session: requests.Session, url: str, timeouts, min_bytes: int) -> int | None:
+    """Size of the result when the server serves byte ranges and it is worth splitting."""
+    try:
+        r = session.head(url, timeout=timeouts, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    length = r.headers.get("Content-Length", "")
+    if r.status_code != 200 or r.headers.get("Accept-Ranges", "").lower() != "bytes" or not length.isdigit():
+        return None
+    return int(length) if int(length) >= min_bytes else None
+
+
+def _segment_ranges(total: int, segments: int) -> list[tuple[int, int]]:
+    """`segments` contiguous inclusive byte ranges covering `total` bytes."""
+    size = -(-total // segments)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+class _RangeRefused(RuntimeError):
+    """The server answered a range request with something other than 206: retrying will not help."""
+
+
+def _download_segments(
+    session: requests.Session,
+    url: str,
+    out_path: Path,
+    total: int,
+    segments: int,
+    *,
+    attempts: int,
+    connect_timeout: float,
+    read_timeout: float,
+    progress: _DownloadProgress,
+    should_cancel: Callable[[], bool] | None,
+    deadline: Deadline | None,
+) -> None:
+    """
+    Fetch `segments` byte ranges concurrently into a preallocated file, each
+    range retrying (and resuming) on its own. Progress, cancel checks and
+    logging stay on the calling thread: the job's logger and cancel check use
+    its database session. On cancel or failure the calling thread returns at
+    once; fetch threads still blocked in a read stop at their next chunk.
+    """
+    with out_path.open("wb") as f:
+        f.truncate(total)
+
+    lock = threading.Lock()
+    received = [0]
+    abort = threading.Event()
+
+    def fetch(start: int, end: int) -> None:
+        pos = start
+        last_err = None
+        for attempt in range(1, attempts + 1):
+            timeouts = _attempt_timeouts(deadline, connect_timeout, read_timeout)
+            try:
+                with session.get(
+                    url, stream=True, timeout=timeouts, headers={"Range": f"bytes={pos}-{end}"}
+                ) as r:
+                    if r.status_code != 206:
+                        raise _RangeRefused(f"DOWNLOAD_RANGE_IGNORED: HTTP {r.status_code}")
+                    with out_path.open("r+b") as f:
+                        f.seek(pos)
+                        for chunk in r.iter_content(chunk_size=1024 * 256):
+                            if abort.is_set():
+                                return
+                            chunk = chunk[: end + 1 - pos]
+                            f.write(chunk)
+                            pos += len(chunk)
+                            with lock:
+                                received[0] += len(chunk)
+                            if deadline:
+                                deadline.check("download")
+                if pos > end:
+                    return
+                raise RuntimeError(f"DOWNLOAD_SHORT_SEGMENT: {pos}/{end + 1}")
+            except (DeadlineExceeded, _RangeRefused):
+                raise  # the single-stream fallback takes over at once
+            except Exception as e:
+                if abort.is_set():
+                    return
+                last_err = e
+                if attempt == attempts:
+                    break
+                # Interrupted by an abort, so a cancel does not wait out the backoff.
+                if abort.wait(_backoff_seconds(attempt, deadline)):
+                    return
+        raise RuntimeError(f"DOWNLOAD_FAILED_AFTER_RETRY: {last_err}")
+
+    progress.begin(1, attempts, str(total))
+    reported = 0
+    pool = ThreadPoolExecutor(max_workers=segments, thread_name_prefix="download")
+    pending = {pool.submit(fetch, start, end) for start, end in _segment_ranges(total, segments)}
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_EXCEPTION)
+            with lock:
+                delta, reported = received[0] - reported, received[0]
+            if delta:
+                progress.advance(delta)
+            for future in done:
+                future.result()  # re-raise the first failed segment
+            if should_cancel and should_cancel():
+                raise DownloadCancelled("DOWNLOAD_CANCELLED")
+            if deadline:
+                deadline.check("download")
+    finally:
+        abort.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
 
 def save_image_from_url(
     url: str,
@@ -18,90 +352,208 @@ def save_image_from_url(
     label: str = "downloading",
     logger: Callable[[str], None] | None = None,
     progress_step: int = 10,   # print tiap 10%
+    should_cancel: Callable[[], bool] | None = None,
+    deadline: Deadline | None = None,
+    segments: int = 1,
+    segment_min_bytes: int = 4 * 1024 * 1024,
 ) -> Path:
-    def emit(message: str) -> None:
-        if logger:
-            logger(message)
-        else:
-            print(message)
+    """
+    Stream `url` into `out_dir` over the shared keep-alive session. A failed
+    attempt keeps the bytes it got and the retry asks only for the rest
+    (`Range`); servers that ignore it just send the whole file again.
+
+    With `segments` > 1, a result of at least `segment_min_bytes` on a server
+    that advertises `Accept-Ranges: bytes` (HEAD probe) is fetched as that
+    many concurrent ranges; otherwise, or if that fails, as a single stream.
+    """
+    progress = _DownloadProgress(
+        logger=logger,
+        log_prefix=log_prefix,
+        label=label,
+        progress_step=progress_step,
+    )
 
     out_dir.mkdir(parents=True, exist_ok=True)
     filename = f"{uuid.uuid4().hex}{ext}"
     out_path = out_dir / filename
 
+    session = _download_session()
     last_err = None
+    validator: str | None = None
+    started = time.perf_counter()
+
+    if segments > 1:
+        timeouts = _attempt_timeouts(deadline, connect_timeout, read_timeout)
+        total = _probe_ranges(session, url, timeouts, segment_min_bytes)
+        if total:
+            try:
+                _download_segments(
+                    session,
+                    url,
+                    out_path,
+                    total,
+                    segments,
+                    attempts=attempts,
+                    connect_timeout=connect_timeout,
+                    read_timeout=read_timeout,
+                    progress=progress,
+                    should_cancel=should_cancel,
+                    deadline=deadline,
+                )
+                progress.finish(out_path)
+                record_phase("download", time.perf_counter() - started)
+                return out_path
+            except (DownloadCancelled, DeadlineExceeded):
+                _remove_partial(out_path)
+                raise
+            except Exception as e:
+                progress.emit(
+                    "segmented download failed, single stream"
+                    if logger
+                    else f"{log_prefix} segmented download failed: {e}; falling back to one stream"
+                )
+                _remove_partial(out_path)
+                # A fresh name: a segment thread still finishing a read never touches the stream's file.
+                out_path = out_dir / f"{uuid.uuid4().hex}{ext}"
 
     for attempt in range(1, attempts + 1):
+        if should_cancel and should_cancel():
+            _remove_partial(out_path)
+            raise DownloadCancelled("DOWNLOAD_CANCELLED")
+        timeouts = _attempt_timeouts(deadline, connect_timeout, read_timeout)
+        offset, headers = _resume_request(out_path, validator)
         try:
-            with requests.get(
+            requested = time.perf_counter()
+            with session.get(
                 url,
                 stream=True,
-                timeout=(connect_timeout, read_timeout),
+                timeout=timeouts,
+                headers=headers,
             ) as r:
+                record_phase("download_ttfb", time.perf_counter() - requested)
+                if _already_complete(r.status_code, r.headers, offset, out_path):
+                    progress.finish(out_path)
+                    record_phase("download", time.perf_counter() - started)
+                    return out_path
                 r.raise_for_status()
+                offset = _resumed_offset(r.status_code, r.headers, offset)
+                if not offset:
+                    validator = _validator(r.headers)
+                progress.begin(attempt, attempts, r.headers.get("Content-Length"), resumed=offset)
 
-                total = r.headers.get("Content-Length")
-                total_bytes = int(total) if total and total.isdigit() else None
-
-                downloaded = 0
-                last_printed = -1
-
-                if total_bytes:
-                    if not logger:
-                        emit(f"{log_prefix} attempt {attempt}/{attempts} total={total_bytes} bytes")
-                else:
-                    if logger:
-                        emit(f"{label}")
-                    else:
-                        emit(f"{log_prefix} attempt {attempt}/{attempts} total=unknown")
-
-                with out_path.open("wb") as f:
+                with out_path.open("ab" if offset else "wb") as f:
                     for chunk in r.iter_content(chunk_size=1024 * 256):  # 256KB
                         if not chunk:
                             continue
                         f.write(chunk)
-                        downloaded += len(chunk)
-
-                        if total_bytes:
-                            pct = int(downloaded * 100 / total_bytes)
-                            # print tiap progress_step% (10%, 20%, ...)
-                            if pct >= 100:
-                                pct = 100
-                            if pct // progress_step != last_printed // progress_step:
-                                last_printed = pct
-                                emit(f"{label} {pct}%" if logger else f"{log_prefix} {pct}%")
-                        else:
-                            # fallback kalau tidak ada Content-Length
-                            # print tiap ~1MB
-                            if downloaded % (1024 * 1024) < len(chunk):
-                                mb = downloaded / (1024 * 1024)
-                                emit(f"{label} {mb:.1f} MB" if logger else f"{log_prefix} downloaded {mb:.1f} MB")
-
-                # pastikan selalu ada 100% kalau total_bytes ada
-                if total_bytes and last_printed < 100:
-                    emit(f"{label} 100%" if logger else f"{log_prefix} 100%")
-
-                if not logger:
-                    emit(f"{log_prefix} completed -> {out_path.name}")
+                        progress.advance(len(chunk))
+                        if should_cancel and should_cancel():
+                            raise DownloadCancelled("DOWNLOAD_CANCELLED")
+                        if deadline:
+                            deadline.check("download")
+
+                progress.finish(out_path)
+                record_phase("download", time.perf_counter() - started)
                 return out_path
 
+        except (DownloadCancelled, DeadlineExceeded):
+            _remove_partial(out_path)
+            raise
         except Exception as e:
+            if _rejected_status(e):
+                _remove_partial(out_path)
+                raise DownloadRejected(_rejected_status(e)) from e
             last_err = e
-            # backoff
-            sleep_s = min(2 ** (attempt - 1), 10)
-            if logger:
-                emit("download failed, retrying")
-            else:
-                emit(f"{log_prefix} attempt {attempt}/{attempts} failed: {e} (retry in {sleep_s}s)")
+            if attempt == attempts:
+                break
+            # backoff; the partial file stays for the Range retry
+            sleep_s = _backoff_seconds(attempt, deadline)
+            progress.failed(attempt, attempts, e, sleep_s)
             time.sleep(sleep_s)
 
-            # hapus file partial sebelum retry
-            try:
-                if out_path.exists():
-                    out_path.unlink()
-            except Exception:
-                pass
+    _remove_partial(out_path)
+    raise RuntimeError(f"DOWNLOAD_FAILED_AFTER_RETRY: {last_err}")
+
+
+async def save_image_from_url_async(
+    url: str,
+    out_dir: Path,
+    ext: str = ".jpg",
+    *,
+    attempts: int = 5,
+    connect_timeout: int = 10,
+    read_timeout: int = 180,
+    log_prefix: str = "[DOWNLOAD]",
+    label: str = "downloading",
+    logger: Callable[[str], None] | None = None,
+    progress_step: int = 10,
+    client: httpx.AsyncClient | None = None,
+    deadline: Deadline | None = None,
+) -> Path:
+    """Async twin of `save_image_from_url` (httpx streaming, same retry and resume policy)."""
+    progress = _DownloadProgress(
+        logger=logger,
+        log_prefix=log_prefix,
+        label=label,
+        progress_step=progress_step,
+    )
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    filename = f"{uuid.uuid4().hex}{ext}"
+    out_path = out_dir / filename
+
+    http = client or _async_download_client()
+    last_err = None
+    validator: str | None = None
+    started = time.perf_counter()
+
+    for attempt in range(1, attempts + 1):
+        connect_t, read_t = _attempt_timeouts(deadline, connect_timeout, read_timeout)
+        timeout = httpx.Timeout(read_t, connect=connect_t)
+        offset, headers = _resume_request(out_path, validator)
+        try:
+            requested = time.perf_counter()
+            async with http.stream("GET", url, timeout=timeout, headers=headers) as r:
+                record_phase("download_ttfb", time.perf_counter() - requested)
+                if _already_complete(r.status_code, r.headers, offset, out_path):
+                    progress.finish(out_path)
+                    record_phase("download", time.perf_counter() - started)
+                    return out_path
+                r.raise_for_status()
+                offset = _resumed_offset(r.status_code, r.headers, offset)
+                if not offset:
+                    validator = _validator(r.headers)
+                progress.begin(attempt, attempts, r.headers.get("Content-Length"), resumed=offset)
+
+                # Chunks are small; plain file writes do not stall the loop.
+                with out_path.open("ab" if offset else "wb") as f:
+                    async for chunk in r.aiter_bytes(chunk_size=1024 * 256):
+                        if not chunk:
+                            continue
+                        f.write(chunk)
+                        progress.advance(len(chunk))
+                        if deadline:
+                            deadline.check("download")
+
+                progress.finish(out_path)
+                record_phase("download", time.perf_counter() - started)
+                return out_path
+
+        except (asyncio.CancelledError, DeadlineExceeded):
+            _remove_partial(out_path)
+            raise
+        except Exception as e:
+            if _rejected_status(e):
+                _remove_partial(out_path)
+                raise DownloadRejected(_rejected_status(e)) from e
+            last_err = e
+            if attempt == attempts:
+                break
+            sleep_s = _backoff_seconds(attempt, deadline)
+            progress.failed(attempt, attempts, e, sleep_s)
+            await asyncio.sleep(sleep_s)
 
+    _remove_partial(out_path)
     raise RuntimeError(f"DOWNLOAD_FAILED_AFTER_RETRY: {last_err}")
 
 def save_upload_file(file: UploadFile, out_dir: Path) -> str:
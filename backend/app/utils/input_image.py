@@ -0,0 +1,87 @@
+import os
+import re
+import threading
+import uuid
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from app.core.config import SEEDDREAM_INPUT_MAX_EDGE, SEEDDREAM_INPUT_QUALITY, SEEDDREAM_SIZE
+
+RESAMPLE_LANCZOS = Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.LANCZOS
+
+# Preset sizes accepted by SeedDream ("2K", "4k", ...): long edge in pixels.
+_PRESET_EDGES = {"1k": 1024, "2k": 2048, "4k": 4096}
+_EXIF_ORIENTATION = 0x0112
+
+_prepare_lock = threading.Lock()
+_preparing: dict[Path, threading.Lock] = {}
+
+
+def input_bounds(size: str = SEEDDREAM_SIZE, max_edge: int = SEEDDREAM_INPUT_MAX_EDGE) -> tuple[int, int]:
+    """(long edge, short edge) an input photo needs for `size`; orientation-free."""
+    match = re.fullmatch(r"\s*(\d+)\s*[xX*]\s*(\d+)\s*", size or "")
+    if match:
+        w, h = int(match.group(1)), int(match.group(2))
+        long_edge, short_edge = max(w, h), min(w, h)
+    else:
+        long_edge = short_edge = _PRESET_EDGES.get((size or "").strip().lower(), 4096)
+    if max_edge:
+        scale = min(1.0, max_edge / long_edge)
+        long_edge, short_edge = int(long_edge * scale), int(short_edge * scale)
+    return long_edge, short_edge
+
+
+def _prepared_path(src: Path, bounds: tuple[int, int], quality: int) -> Path:
+    # Settings are part of the name, so changing SEEDDREAM_SIZE never reuses a stale copy.
+    return src.with_name(f"{src.stem}.in{bounds[0]}x{bounds[1]}q{quality}.jpg")
+
+
+def _fits(size: tuple[int, int], bounds: tuple[int, int]) -> bool:
+    return max(size) <= bounds[0] and min(size) <= bounds[1]
+
+
+def prepare_input_image(
+    src: Path,
+    *,
+    size: str = SEEDDREAM_SIZE,
+    max_edge: int = SEEDDREAM_INPUT_MAX_EDGE,
+    quality: int = SEEDDREAM_INPUT_QUALITY,
+) -> Path:
+    """
+    Return the photo to send to SeedDream: EXIF orientation applied, scaled
+    down to fit `size` and re-encoded as JPEG, cached next to `src`.
+    Returns `src` itself when it is already an upright JPEG that fits.
+    """
+    bounds = input_bounds(size, max_edge)
+    out = _prepared_path(src, bounds, quality)
+    if out.exists() and out.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+        return out
+
+    with _prepare_lock:
+        key_lock = _preparing.setdefault(out, threading.Lock())
+    with key_lock:
+        try:
+            if out.exists() and out.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+                return out
+
+            with Image.open(src) as img:
+                orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+                if img.format == "JPEG" and orientation == 1 and _fits(img.size, bounds):
+                    return src
+                img = ImageOps.exif_transpose(img)
+                if img.mode != "RGB":
+                    img = img.convert("RGB")
+                if not _fits(img.size, bounds):
+                    landscape = img.width >= img.height
+                    box = bounds if landscape else (bounds[1], bounds[0])
+                    img = ImageOps.contain(img, box, method=RESAMPLE_LANCZOS)
+
+                # Write then rename, so a concurrent reader never sees half a file.
+                tmp = out.with_name(f".{out.name}.{uuid.uuid4().hex}.tmp")
+                img.save(tmp, format="JPEG", quality=quality, optimize=True)
+            os.replace(tmp, out)
+            return out
+        finally:
+            with _prepare_lock:
+                _preparing.pop(out, None)
@@ -0,0 +1,29 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class KeyedLock:
+    """One lock per key, created on demand and dropped once nobody holds or waits on it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._locks: dict[str, tuple[threading.Lock, list[int]]] = {}
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        with self._lock:
+            lock, users = self._locks.setdefault(key, (threading.Lock(), [0]))
+            users[0] += 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                users[0] -= 1
+                if not users[0]:
+                    self._locks.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._locks)
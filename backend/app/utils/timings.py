@@ -0,0 +1,137 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Reported in this order; a phase that happened more than once (retries) is summed.
+PHASES = ("encode", "connect", "upload", "ttfb", "generate", "download_ttfb", "download")
+
+
+class PhaseTimings:
+    """Seconds spent per phase of one job's SeedDream round trip. Thread-safe."""
+
+    def __init__(self, initial: dict | None = None) -> None:
+        self._lock = threading.Lock()
+        self._seconds: dict[str, float] = dict(initial or {})
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self._seconds[phase] = self._seconds.get(phase, 0.0) + max(0.0, seconds)
+
+    def as_dict(self) -> dict[str, float]:
+        with self._lock:
+            return {phase: round(seconds, 3) for phase, seconds in self._seconds.items()}
+
+    def summary(self) -> str:
+        seconds = self.as_dict()
+        ordered = [p for p in PHASES if p in seconds] + sorted(set(seconds) - set(PHASES))
+        return " ".join(f"{phase}={seconds[phase]:.2f}s" for phase in ordered)
+
+
+# Set for the duration of a job's generate stage; copied into threads
+# (asyncio.to_thread) and tasks, so deep callers can record without plumbing.
+_current: contextvars.ContextVar[PhaseTimings | None] = contextvars.ContextVar(
+    "phase_timings", default=None
+)
+
+
+@contextmanager
+def track_phases(timings: PhaseTimings) -> Iterator[PhaseTimings]:
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+@contextmanager
+def timed_phase(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+class _HttpTrace:
+    """
+    httpcore trace callback splitting one request into connect, upload and
+    time to first byte. Event names look like `connection.connect_tcp.started`
+    or `http11.send_request_body.complete` (`http2.` with HTTP/2).
+    """
+
+    def __init__(self, timings: PhaseTimings) -> None:
+        self.timings = timings
+        self.started: dict[str, float] = {}
+        self.sent_at: float | None = None
+
+    def __call__(self, name: str, info: dict) -> None:
+        now = time.perf_counter()
+        prefix, _, step = name.rpartition(".")
+        event = prefix.rpartition(".")[2]
+        if step == "started":
+            self.started[event] = now
+            return
+        if step != "complete":
+            return
+
+        if event in ("connect_tcp", "start_tls") and event in self.started:
+            self.timings.add("connect", now - self.started[event])
+        elif event == "send_request_body" and "send_request_headers" in self.started:
+            self.timings.add("upload", now - self.started["send_request_headers"])
+            self.sent_at = now
+        elif event == "receive_response_headers" and self.sent_at is not None:
+            self.timings.add("ttfb", now - self.sent_at)
+
+
+def trace_request(request) -> None:
+    """httpx `request` event hook: trace the request into the current job's timings."""
+    timings = _current.get()
+    if timings is not None:
+        request.extensions["trace"] = _HttpTrace(timings)
+
+
+async def trace_request_async(request) -> None:
+    timings = _current.get()
+    if timings is not None:
+        trace = _HttpTrace(timings)
+
+        async def atrace(name: str, info: dict) -> None:
+            trace(name, info)
+
+        request.extensions["trace"] = atrace
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (non-empty)."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize_phases(samples: list[dict]) -> dict[str, dict]:
+    """p50/p90/p95/p99 and mean per phase across per-job timing dicts."""
+    by_phase: dict[str, list[float]] = {}
+    for sample in samples:
+        for phase, seconds in (sample or {}).items():
+            by_phase.setdefault(phase, []).append(float(seconds))
+
+    ordered = [p for p in PHASES if p in by_phase] + sorted(set(by_phase) - set(PHASES))
+    return {
+        phase: {
+            "count": len(by_phase[phase]),
+            "p50": round(percentile(by_phase[phase], 50), 3),
+            "p90": round(percentile(by_phase[phase], 90), 3),
+            "p95": round(percentile(by_phase[phase], 95), 3),
+            "p99": round(percentile(by_phase[phase], 99), 3),
+            "mean": round(sum(by_phase[phase]) / len(by_phase[phase]), 3),
+        }
+        for phase in ordered
+    }
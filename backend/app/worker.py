@@ -0,0 +1,107 @@
+# Standalone job worker: python -m app.worker [--workers N ...]
+import argparse
+import signal
+import threading
+
+from app.core.config import (
+    COMPRESSED_DIR,
+    DATA_DIR,
+    JOB_ASYNC_CONCURRENCY,
+    JOB_ASYNC_GENERATE,
+    JOB_POSTPROCESS_WORKERS,
+    JOB_UPLOAD_WORKERS,
+    JOB_WORKERS,
+    RESULTS_DIR,
+)
+from app.db.base import Base
+from app.db.ensure import ensure_schema
+from app.db.session import engine
+from app.modules.jobs.executor import build_job_executor
+
+from app.modules.users.model import User  # noqa: F401
+from app.modules.sessions.model import PhotoSession  # noqa: F401
+from app.modules.jobs.model import Job  # noqa: F401
+from app.modules.themes.model import Theme  # noqa: F401
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Process queued generation jobs from the database.",
+    )
+    parser.add_argument("--name", default="worker", help="worker name used in lease owner ids")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help=(
+            f"generation threads (default {JOB_WORKERS}), or concurrent "
+            f"generations with --async (default {JOB_ASYNC_CONCURRENCY})"
+        ),
+    )
+    parser.add_argument(
+        "--async",
+        dest="async_generate",
+        action=argparse.BooleanOptionalAction,
+        default=JOB_ASYNC_GENERATE,
+        help="run the generate stage on an asyncio event loop",
+    )
+    parser.add_argument(
+        "--postprocess-workers",
+        type=int,
+        default=JOB_POSTPROCESS_WORKERS,
+        help="overlay/compression threads",
+    )
+    parser.add_argument(
+        "--upload-workers",
+        type=int,
+        default=JOB_UPLOAD_WORKERS,
+        help="Drive upload threads",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+
+    for folder in (RESULTS_DIR, COMPRESSED_DIR, DATA_DIR):
+        folder.mkdir(parents=True, exist_ok=True)
+    Base.metadata.create_all(bind=engine)
+    ensure_schema(engine)
+
+    executor = build_job_executor(
+        name=args.name,
+        workers=args.workers,
+        postprocess_workers=args.postprocess_workers,
+        upload_workers=args.upload_workers,
+        async_generate=args.async_generate,
+    )
+    recovered = executor.recover()
+    print(
+        f"[WORKER] {executor.worker_id} starting: generate={executor.stats()['workers']} "
+        f"async={args.async_generate} "
+        f"postprocess={args.postprocess_workers} upload={args.upload_workers} "
+        f"(requeued={recovered['requeued']} failed={recovered['failed']})"
+    )
+
+    stop = threading.Event()
+
+    def _handle_signal(signum, _frame):
+        print(f"[WORKER] signal {signum}, stopping")
+        stop.set()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+
+    executor.start()
+    try:
+        while not stop.wait(1.0):
+            pass
+    finally:
+        # In-flight jobs keep their checkpoints; their leases expire and
+        # another worker resumes them.
+        executor.stop()
+        print("[WORKER] stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.endpoints import jobs as jobs_endpoint
+from app.api.v1.endpoints.jobs import router as jobs_router
+from app.api.v1.endpoints.sessions import router as sessions_router
+from app.db.base import Base
+from app.db.session import get_db
+from app.modules.sessions.model import PhotoSession
+from app.modules.themes.model import Theme
+from app.modules.users.model import User
+
+
+@pytest.fixture()
+def db_session_factory(tmp_path):
+    # File-backed so concurrent requests get their own connections, like production.
+    engine = create_engine(
+        f"sqlite+pysqlite:///{(tmp_path / 'app.db').as_posix()}",
+        connect_args={"check_same_thread": False},
+    )
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        yield SessionLocal
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture()
+def client(monkeypatch, db_session_factory):
+    """Jobs and sessions API on the test database; dispatched job ids land in `client.dispatched`."""
+    dispatched: list[int] = []
+    monkeypatch.setattr(jobs_endpoint, "job_queue_is_full", lambda db: False)
+    monkeypatch.setattr(jobs_endpoint, "dispatch_job", lambda job_id, mode=None: dispatched.append(job_id))
+
+    app = FastAPI()
+    app.include_router(jobs_router, prefix="/api/v1")
+    app.include_router(sessions_router, prefix="/api/v1")
+
+    def override_get_db():
+        db = db_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as c:
+        c.dispatched = dispatched
+        yield c
+
+
+@pytest.fixture()
+def seed_session(db_session_factory):
+    """Creates a guest session with an uploaded photo and the given themes (the first one picked)."""
+
+    def seed(theme_ids: tuple[str, ...] = ("retro",)) -> int:
+        db = db_session_factory()
+        try:
+            user = User(name="Guest", email=f"guest-{uuid.uuid4().hex[:8]}@example.com", phone="085")
+            db.add(user)
+            for theme_id in theme_ids:
+                if db.get(Theme, theme_id) is None:
+                    db.add(
+                        Theme(
+                            id=theme_id,
+                            title=theme_id.title(),
+                            thumbnail_url=f"/static/thumbs/{theme_id}.jpeg",
+                            prompt=f"make it {theme_id}",
+                            params={},
+                        )
+                    )
+            db.commit()
+            db.refresh(user)
+
+            session = PhotoSession(
+                user_id=user.id,
+                theme_id=theme_ids[0],
+                input_image_path="/static/uploads/input.jpg",
+                status="photo_uploaded",
+            )
+            db.add(session)
+            db.commit()
+            return session.id
+        finally:
+            db.close()
+
+    return seed
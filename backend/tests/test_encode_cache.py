@@ -0,0 +1,65 @@
+import shutil
+from pathlib import Path
+
+from PIL import Image
+
+from app.utils import encode
+from app.utils.encode import DataUrlCache
+
+
+def _photo(path: Path, color) -> Path:
+    Image.new("RGB", (40, 60), color).save(path, format="JPEG")
+    return path
+
+
+def test_repeat_generations_skip_read_and_encode(monkeypatch, tmp_path):
+    photo = _photo(tmp_path / "input.jpg", (1, 2, 3))
+    cache = DataUrlCache(1024 * 1024)
+
+    first = cache.get(photo)
+    assert first == encode.file_to_data_url(photo)
+
+    def no_read(self):
+        raise AssertionError("cached photo must not be read again")
+
+    monkeypatch.setattr(Path, "read_bytes", no_read)
+    assert cache.get(photo) is first
+    assert cache.digest(photo)  # memoized with the payload
+    monkeypatch.undo()
+
+    # Same content under another name (e.g. a copied upload) is a hit too.
+    copy = tmp_path / "copy.jpg"
+    shutil.copyfile(photo, copy)
+    assert cache.get(copy) is first
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_changed_file_is_encoded_again(tmp_path):
+    photo = _photo(tmp_path / "input.jpg", (1, 2, 3))
+    cache = DataUrlCache(1024 * 1024)
+    before = cache.get(photo)
+
+    _photo(photo, (200, 100, 50))
+    assert cache.get(photo) != before
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_evicts_least_recently_used_within_budget(tmp_path):
+    photos = [_photo(tmp_path / f"p{i}.jpg", (i * 60, 0, 0)) for i in range(3)]
+    size = len(encode.file_to_data_url(photos[0]))
+    cache = DataUrlCache(int(size * 2.5))
+
+    cache.get(photos[0])
+    cache.get(photos[1])
+    cache.get(photos[0])  # touch: p1 is now the oldest
+    cache.get(photos[2])
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+
+    cache.get(photos[0])
+    assert cache.stats()["misses"] == 3
+    cache.get(photos[1])
+    assert cache.stats()["misses"] == 4
@@ -0,0 +1,309 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.bench_download import serve_payload
+from app.utils import files
+from app.utils.deadline import Deadline, DeadlineExceeded
+from app.utils.files import (
+    DownloadCancelled,
+    DownloadRejected,
+    save_image_from_url,
+    save_image_from_url_async,
+)
+
+
+class _FakeSession:
+    def __init__(self, get):
+        self.get = get
+
+
+def test_async_download_retries_and_streams_to_disk(tmp_path, monkeypatch):
+    payload = b"x" * (600 * 1024)
+    calls = {"count": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["count"] += 1
+        if calls["count"] == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, content=payload, headers={"Content-Length": str(len(payload))})
+
+    async def no_sleep(_seconds):
+        return None
+
+    monkeypatch.setattr("app.utils.files.asyncio.sleep", no_sleep)
+    lines: list[str] = []
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await save_image_from_url_async(
+                "https://example.invalid/result.jpg",
+                tmp_path,
+                logger=lines.append,
+                client=client,
+            )
+
+    out = asyncio.run(run())
+
+    assert out.read_bytes() == payload
+    assert calls["count"] == 2
+    assert "download failed, retrying" in lines
+    assert lines[-1] == "downloading 100%"
+
+
+def test_download_stops_between_chunks_when_cancelled(tmp_path, monkeypatch):
+    chunks_sent = {"count": 0}
+
+    class FakeResponse:
+        status_code = 200
+        headers = {"Content-Length": str(4 * 1024)}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            return None
+
+        def iter_content(self, chunk_size):
+            for _ in range(4):
+                chunks_sent["count"] += 1
+                yield b"x" * 1024
+
+    monkeypatch.setattr(files, "_download_session", lambda: _FakeSession(lambda *args, **kwargs: FakeResponse()))
+    cancel_after = iter([False, False, True])
+
+    with pytest.raises(DownloadCancelled):
+        save_image_from_url(
+            "https://example.invalid/result.jpg",
+            tmp_path,
+            logger=lambda _line: None,
+            should_cancel=lambda: next(cancel_after),
+        )
+
+    assert chunks_sent["count"] == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_timeouts_shrink_to_job_deadline(tmp_path, monkeypatch):
+    timeouts: list[tuple[float, float]] = []
+
+    def flaky_get(url, *, stream, timeout, headers):
+        timeouts.append(timeout)
+        raise files.requests.ConnectionError("reset")
+
+    monkeypatch.setattr(files, "_download_session", lambda: _FakeSession(flaky_get))
+    started = time.time()
+
+    with pytest.raises(DeadlineExceeded):
+        save_image_from_url(
+            "https://example.invalid/result.jpg",
+            tmp_path,
+            attempts=5,
+            logger=lambda _line: None,
+            deadline=Deadline(time.time() + 0.3),
+        )
+
+    # One attempt, then the backoff is cut to the budget instead of 5 x 180 s.
+    assert len(timeouts) == 1
+    assert all(0 < t <= 0.3 for t in timeouts[0])
+    assert time.time() - started < 2
+
+
+class _FlakyRangeHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD; the first response drops the connection at 90%."""
+
+    payload = bytes(range(256)) * 4096  # 1 MB
+    requests: list[str | None] = []
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        type(self).requests.append(range_header)
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            body = self.payload[start:]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(self.payload) - 1}/{len(self.payload)}")
+        else:
+            body = self.payload
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        if len(type(self).requests) == 1:
+            self.wfile.write(body[: len(body) * 9 // 10])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def flaky_server():
+    _FlakyRangeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyRangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/result.jpg"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_retry_resumes_from_bytes_already_on_disk(tmp_path, monkeypatch, flaky_server):
+    monkeypatch.setattr(files, "_backoff_seconds", lambda attempt, deadline: 0)
+    lines: list[str] = []
+
+    out = save_image_from_url(flaky_server, tmp_path, logger=lines.append)
+
+    # Resumes at the last whole 256 KB chunk written before the drop.
+    assert out.read_bytes() == _FlakyRangeHandler.payload
+    assert _FlakyRangeHandler.requests == [None, "bytes=786432-"]
+    assert "downloading resuming at 768 KB" in lines
+    assert lines[-1] == "downloading 100%"
+
+
+def test_async_retry_resumes_from_bytes_already_on_disk(tmp_path, monkeypatch, flaky_server):
+    monkeypatch.setattr(files, "_backoff_seconds", lambda attempt, deadline: 0)
+
+    out = asyncio.run(save_image_from_url_async(flaky_server, tmp_path, logger=lambda _line: None))
+
+    assert out.read_bytes() == _FlakyRangeHandler.payload
+    assert _FlakyRangeHandler.requests == [None, "bytes=786432-"]
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_segmented_download_matches_single_stream(tmp_path, ranges):
+    payload = bytes(range(256)) * 4000  # 1,024,000 bytes, not a multiple of the segment size
+    server = serve_payload(payload, ranges=ranges)
+    url = f"http://127.0.0.1:{server.server_address[1]}/result.jpg"
+    lines: list[str] = []
+    try:
+        out = save_image_from_url(
+            url, tmp_path, logger=lines.append, segments=3, segment_min_bytes=1
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert out.read_bytes() == payload
+    assert lines[-1] == "downloading 100%"
+    assert "segmented download failed, single stream" not in lines
+
+
+
+class _RangeTroubleHandler(BaseHTTPRequestHandler):
+    """Advertises byte ranges, then either ignores them (200) or stalls on them."""
+
+    protocol_version = "HTTP/1.1"
+    payload = bytes(range(256)) * 2000
+    stall_ranges = False
+    range_requests = 0
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+
+    def do_GET(self):
+        if self.headers.get("Range"):
+            type(self).range_requests += 1
+            if self.stall_ranges:
+                time.sleep(3)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def range_trouble_server():
+    _RangeTroubleHandler.range_requests = 0
+    _RangeTroubleHandler.stall_ranges = False
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeTroubleHandler)
+    server.daemon_threads = True
+    server.handle_error = lambda request, client_address: None  # clients hang up on ignored ranges
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/result.jpg"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_ignored_ranges_fall_back_to_one_stream_without_retrying(tmp_path, range_trouble_server):
+    lines: list[str] = []
+    started = time.monotonic()
+
+    out = save_image_from_url(
+        range_trouble_server, tmp_path, logger=lines.append, segments=3, segment_min_bytes=1
+    )
+
+    assert out.read_bytes() == _RangeTroubleHandler.payload
+    assert "segmented download failed, single stream" in lines
+    assert _RangeTroubleHandler.range_requests == 3  # one per segment, no retries
+    assert time.monotonic() - started < 1.0  # no backoff sleeps
+
+
+def test_segmented_download_cancel_does_not_wait_for_stalled_reads(tmp_path, range_trouble_server):
+    _RangeTroubleHandler.stall_ranges = True
+    started = time.monotonic()
+
+    with pytest.raises(DownloadCancelled):
+        save_image_from_url(
+            range_trouble_server,
+            tmp_path,
+            logger=lambda _line: None,
+            should_cancel=lambda: True,
+            segments=3,
+            segment_min_bytes=1,
+        )
+
+    assert time.monotonic() - started < 1.5
+    assert list(tmp_path.iterdir()) == []
+
+def test_segment_ranges_cover_the_file_once():
+    assert files._segment_ranges(10, 3) == [(0, 3), (4, 7), (8, 9)]
+    assert files._segment_ranges(2, 4) == [(0, 0), (1, 1)]
+
+
+def test_expired_url_is_rejected_without_retrying(tmp_path, monkeypatch):
+    calls = {"count": 0}
+
+    class Forbidden:
+        status_code = 403
+        headers = {}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            raise files.requests.HTTPError("403 Forbidden", response=self)
+
+    def get(*args, **kwargs):
+        calls["count"] += 1
+        return Forbidden()
+
+    monkeypatch.setattr(files, "_download_session", lambda: _FakeSession(get))
+
+    with pytest.raises(DownloadRejected):
+        save_image_from_url("https://example.invalid/result.jpg", tmp_path, logger=lambda _line: None)
+
+    assert calls["count"] == 1
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,113 @@
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+from app.api.v1.endpoints import jobs as jobs_endpoint
+from app.db.ensure import ensure_schema
+from app.modules.jobs.model import Job
+from app.modules.sessions.model import PhotoSession
+
+
+def test_concurrent_job_requests_with_one_key_create_one_job(monkeypatch, client, db_session_factory, seed_session):
+    session_id = seed_session()
+    real_create = jobs_endpoint.create_job
+
+    def slow_create(*args, **kwargs):
+        time.sleep(0.1)  # keep the first request in flight while the others arrive
+        return real_create(*args, **kwargs)
+
+    monkeypatch.setattr(jobs_endpoint, "create_job", slow_create)
+    responses = []
+
+    def post():
+        responses.append(
+            client.post(
+                "/api/v1/jobs",
+                json={"session_id": session_id},
+                headers={"Idempotency-Key": "tap-1"},
+            )
+        )
+
+    threads = [threading.Thread(target=post) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.json()["job_id"] for r in responses}) == 1
+    assert len(client.dispatched) == 1
+
+    # A later retry replays the same job; another key makes a new one.
+    again = client.post("/api/v1/jobs", json={"session_id": session_id}, headers={"Idempotency-Key": "tap-1"})
+    assert again.json()["job_id"] == responses[0].json()["job_id"]
+    other = client.post("/api/v1/jobs", json={"session_id": session_id}, headers={"Idempotency-Key": "tap-2"})
+    assert other.json()["job_id"] != responses[0].json()["job_id"]
+    assert len(client.dispatched) == 2
+    assert len(jobs_endpoint._creating) == 0
+
+    db = db_session_factory()
+    try:
+        assert db.query(Job).count() == 2
+    finally:
+        db.close()
+
+
+def test_job_key_reused_for_another_session_is_rejected(client, db_session_factory, seed_session):
+    session_id = seed_session()
+    db = db_session_factory()
+    try:
+        other = PhotoSession(user_id=1, theme_id="retro", input_image_path="/static/uploads/x.jpg")
+        db.add(other)
+        db.commit()
+        other_id = other.id
+    finally:
+        db.close()
+
+    headers = {"Idempotency-Key": "shared"}
+    assert client.post("/api/v1/jobs", json={"session_id": session_id}, headers=headers).status_code == 200
+    response = client.post("/api/v1/jobs", json={"session_id": other_id}, headers=headers)
+    assert response.status_code == 409
+
+
+def test_session_start_with_key_is_replayed(client, db_session_factory):
+    payload = {"name": "Guest", "email": "guest@example.com", "phone": "081"}
+    headers = {"Idempotency-Key": "start-1"}
+
+    first = client.post("/api/v1/sessions/start", json=payload, headers=headers)
+    second = client.post("/api/v1/sessions/start", json=payload, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert first.json()["session_id"] == second.json()["session_id"]
+
+    without_key = client.post("/api/v1/sessions/start", json=payload)
+    assert without_key.json()["session_id"] != first.json()["session_id"]
+
+    conflict = client.post(
+        "/api/v1/sessions/start",
+        json={**payload, "email": "someone-else@example.com"},
+        headers=headers,
+    )
+    assert conflict.status_code == 409
+
+    db = db_session_factory()
+    try:
+        assert db.query(PhotoSession).count() == 2
+    finally:
+        db.close()
+
+
+def test_ensure_schema_upgrades_an_old_sessions_table(tmp_path):
+    # What `python -m app.worker` sees when it starts before the API on an old database.
+    engine = create_engine(f"sqlite+pysqlite:///{(tmp_path / 'old.db').as_posix()}")
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE photo_sessions (id INTEGER PRIMARY KEY, theme_id VARCHAR(64))"
+            )
+        ensure_schema(engine)
+        with engine.begin() as conn:
+            columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(photo_sessions)")}
+        assert "idempotency_key" in columns
+    finally:
+        engine.dispose()
@@ -0,0 +1,50 @@
+from PIL import Image
+
+from app.utils.input_image import input_bounds, prepare_input_image
+
+
+def _exif_rotated_jpeg(path, size):
+    img = Image.new("RGB", size, (200, 10, 10))
+    exif = img.getexif()
+    exif[0x0112] = 6  # camera held upright: rotate 90° clockwise to view
+    img.save(path, format="JPEG", quality=98, exif=exif)
+
+
+def test_input_bounds():
+    assert input_bounds("2400x3600", 0) == (3600, 2400)
+    assert input_bounds("4K", 0) == (4096, 4096)
+    assert input_bounds("2400x3600", 1800) == (1800, 1200)
+
+
+def test_large_photo_is_rotated_downscaled_and_cached(tmp_path):
+    src = tmp_path / "dslr.jpg"
+    _exif_rotated_jpeg(src, (1200, 800))
+
+    out = prepare_input_image(src, size="300x450", max_edge=0, quality=80)
+
+    assert out.parent == src.parent
+    assert out != src
+    with Image.open(out) as img:
+        assert img.format == "JPEG"
+        assert img.size == (300, 450)  # upright portrait, within the bounds
+        assert img.getexif().get(0x0112) is None
+    assert out.stat().st_size < src.stat().st_size
+
+    first_write = out.stat().st_mtime_ns
+    assert prepare_input_image(src, size="300x450", max_edge=0, quality=80) == out
+    assert out.stat().st_mtime_ns == first_write
+
+    # Different settings never reuse the cached copy.
+    assert prepare_input_image(src, size="300x450", max_edge=0, quality=70) != out
+
+
+def test_small_upright_jpeg_is_sent_as_is(tmp_path):
+    src = tmp_path / "small.jpg"
+    Image.new("RGB", (200, 300)).save(src, format="JPEG")
+    assert prepare_input_image(src, size="2400x3600", max_edge=0) == src
+
+    png = tmp_path / "small.png"
+    Image.new("RGBA", (200, 300)).save(png)
+    out = prepare_input_image(png, size="2400x3600", max_edge=0)
+    with Image.open(out) as img:
+        assert (img.format, img.mode, img.size) == ("JPEG", "RGB", (200, 300))
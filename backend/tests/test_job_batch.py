@@ -0,0 +1,74 @@
+import threading
+import time
+
+from PIL import Image
+
+from app.modules.jobs.model import Job
+from app.modules.sessions.model import PhotoSession
+from app.utils import encode
+
+
+def test_batch_creates_one_job_per_theme(client, db_session_factory, seed_session):
+    session_id = seed_session(("retro", "anime"))
+
+    response = client.post(
+        "/api/v1/jobs/batch",
+        json={"session_id": session_id, "theme_ids": ["retro", "anime", "retro"]},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [job["theme_id"] for job in body["jobs"]] == ["retro", "anime"]
+    assert all(job["status"] == "queued" for job in body["jobs"])
+    assert client.dispatched == [job["job_id"] for job in body["jobs"]]
+
+    db = db_session_factory()
+    try:
+        assert db.query(Job).filter(Job.session_id == session_id).count() == 2
+        assert db.get(PhotoSession, session_id).theme_id == "retro"
+    finally:
+        db.close()
+
+
+def test_batch_rejects_unknown_theme_without_creating_jobs(client, db_session_factory, seed_session):
+    session_id = seed_session(("retro", "anime"))
+
+    response = client.post(
+        "/api/v1/jobs/batch",
+        json={"session_id": session_id, "theme_ids": ["retro", "missing"]},
+    )
+    assert response.status_code == 404
+    assert client.dispatched == []
+
+    db = db_session_factory()
+    try:
+        assert db.query(Job).count() == 0
+    finally:
+        db.close()
+
+
+def test_concurrent_jobs_encode_a_shared_input_once(monkeypatch, tmp_path):
+    photo = tmp_path / "input.jpg"
+    Image.new("RGB", (20, 30), (5, 6, 7)).save(photo)
+    calls = {"count": 0}
+    real_encode = encode.bytes_to_data_url
+
+    def slow_encode(data, mime):
+        calls["count"] += 1
+        time.sleep(0.05)
+        return real_encode(data, mime)
+
+    monkeypatch.setattr(encode, "bytes_to_data_url", slow_encode)
+    monkeypatch.setattr(encode, "_data_urls", encode.DataUrlCache(1024 * 1024))
+    results: list[str] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(encode.file_to_data_url_cached(photo)))
+        for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls["count"] == 1
+    assert len(set(results)) == 1
+    assert results[0].startswith("data:image/jpeg;base64,")
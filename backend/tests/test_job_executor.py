@@ -0,0 +1,519 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.endpoints import jobs as jobs_endpoint
+from app.api.v1.endpoints.jobs import router as jobs_router
+from app.db.base import Base
+from app.db.session import get_db
+from app.modules.jobs import executor as executor_module
+from app.modules.jobs.executor import JobExecutor
+from app.modules.jobs.model import Job
+from app.modules.jobs.queue_store import (
+    claim_job,
+    claim_next_job,
+    release_job,
+    requeue_expired_jobs,
+)
+from app.modules.jobs.service import retry_job
+from app.modules.sessions.model import PhotoSession
+from app.modules.users.model import User
+
+
+@pytest.fixture()
+def db_session_factory(tmp_path):
+    # File-backed so each worker thread gets its own connection, like production.
+    engine = create_engine(
+        f"sqlite+pysqlite:///{(tmp_path / 'queue.db').as_posix()}",
+        connect_args={"check_same_thread": False},
+    )
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        yield SessionLocal
+    finally:
+        engine.dispose()
+
+
+def _seed_jobs(db_session_factory, count: int, **job_fields) -> list[int]:
+    db = db_session_factory()
+    try:
+        user = User(name="Queue", email=f"queue-{uuid.uuid4().hex[:8]}@example.com", phone="083")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
+        session = PhotoSession(user_id=user.id, status="photo_uploaded")
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+
+        jobs = [Job(session_id=session.id, mode="event", **job_fields) for _ in range(count)]
+        db.add_all(jobs)
+        db.commit()
+        return [job.id for job in jobs]
+    finally:
+        db.close()
+
+
+def _finishing_handler(db_session_factory, release: threading.Event | None = None):
+    seen: list[tuple[int, str | None, str]] = []
+
+    def handler(job_id: int, mode: str | None) -> None:
+        seen.append((job_id, mode, threading.current_thread().name))
+        if release is not None:
+            release.wait(5)
+        db = db_session_factory()
+        try:
+            job = db.get(Job, job_id)
+            job.status = "done"
+            db.commit()
+        finally:
+            db.close()
+
+    return handler, seen
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition not met in time")
+
+
+def _executor(handler, db_session_factory, **kwargs) -> JobExecutor:
+    kwargs.setdefault("poll_seconds", 0.05)
+    return JobExecutor(handler, session_factory=db_session_factory, **kwargs)
+
+
+def test_executor_claims_and_runs_jobs_on_dedicated_threads(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 2, status="queued")
+    handler, seen = _finishing_handler(db_session_factory)
+    executor = _executor(handler, db_session_factory, workers=2, queue_max=4, name="test-worker")
+    try:
+        executor.submit(job_ids[0], "event")
+        executor.submit(job_ids[1], None)
+        _wait_for(lambda: executor.stats()["completed"] == 2)
+    finally:
+        executor.stop()
+
+    assert sorted(job_id for job_id, _, _ in seen) == job_ids
+    assert all(name.startswith("test-worker-") for _, _, name in seen)
+
+    db = db_session_factory()
+    try:
+        for job in db.query(Job).all():
+            assert job.status == "done"
+            assert job.attempts == 1
+            assert job.lease_owner is None
+    finally:
+        db.close()
+
+
+def test_wake_up_tokens_are_best_effort(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 3, status="queued")
+    release = threading.Event()
+    handler, _ = _finishing_handler(db_session_factory, release)
+    executor = _executor(handler, db_session_factory, workers=1, queue_max=1)
+    try:
+        executor.submit(job_ids[0])
+        _wait_for(lambda: executor.stats()["in_flight"] == 1)
+        executor.submit(job_ids[1])
+        executor.submit(job_ids[2])  # no room for the token: the row is still claimed
+
+        stats = executor.stats()
+        assert stats["in_flight"] == 1
+        assert stats["queue_depth"] == 2  # queued rows, not tokens
+        assert stats["queue_max"] == 1
+
+        release.set()
+        _wait_for(lambda: executor.stats()["completed"] == 3)
+    finally:
+        release.set()
+        executor.stop()
+
+
+def test_executor_picks_up_durable_jobs_without_submit(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 3, status="queued")
+    handler, seen = _finishing_handler(db_session_factory)
+    executor = _executor(handler, db_session_factory, workers=1)
+    try:
+        executor.start()
+        _wait_for(lambda: executor.stats()["completed"] == 3)
+    finally:
+        executor.stop()
+
+    assert [job_id for job_id, _, _ in seen] == job_ids
+
+
+def test_slow_upload_stage_does_not_block_generation(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 3, status="queued")
+    upload_release = threading.Event()
+    generated: list[int] = []
+    uploaded: list[tuple[int, str]] = []
+
+    def generate(job_id: int, mode: str | None) -> bool:
+        generated.append(job_id)
+        return True
+
+    def postprocess(job_id: int) -> bool:
+        db = db_session_factory()
+        try:
+            db.get(Job, job_id).status = "done"
+            db.commit()
+        finally:
+            db.close()
+        return True
+
+    def upload(job_id: int) -> bool:
+        upload_release.wait(5)
+        uploaded.append((job_id, threading.current_thread().name))
+        return False
+
+    executor = _executor(
+        generate,
+        db_session_factory,
+        workers=1,
+        stages=(("postprocess", postprocess, 1), ("upload", upload, 1)),
+    )
+    try:
+        for job_id in job_ids:
+            executor.submit(job_id)
+        # All generations finish while the single upload worker is stuck.
+        _wait_for(lambda: len(generated) == 3)
+        _wait_for(lambda: executor.stats()["stages"]["upload"]["busy"] == 1)
+        stats = executor.stats()
+        assert stats["stages"]["generate"]["busy"] == 0
+        assert stats["in_flight"] == 3
+
+        upload_release.set()
+        _wait_for(lambda: executor.stats()["completed"] == 3)
+    finally:
+        upload_release.set()
+        executor.stop()
+
+    assert sorted(job_id for job_id, _ in uploaded) == job_ids
+    assert all("-upload-" in name for _, name in uploaded)
+
+
+def test_async_handler_keeps_many_jobs_in_flight_on_one_thread(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 6, status="queued")
+    threads: set[str] = set()
+    active = {"now": 0, "peak": 0}
+
+    async def generate(job_id: int, mode: str | None) -> bool:
+        threads.add(threading.current_thread().name)
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.2)
+        active["now"] -= 1
+        return False
+
+    executor = _executor(generate, db_session_factory, workers=6)
+    try:
+        for job_id in job_ids:
+            executor.submit(job_id)
+        _wait_for(lambda: executor.stats()["completed"] == 6)
+    finally:
+        executor.stop()
+
+    assert len(threads) == 1
+    assert active["peak"] > 1
+
+
+def test_claim_job_is_exclusive(db_session_factory):
+    [job_id] = _seed_jobs(db_session_factory, 1, status="queued")
+    db = db_session_factory()
+    try:
+        assert claim_job(db, job_id, "worker-a") is True
+        assert claim_job(db, job_id, "worker-b") is False
+
+        job = db.get(Job, job_id)
+        db.refresh(job)
+        assert job.status == "processing"
+        assert job.lease_owner == "worker-a"
+        assert job.lease_expires_at is not None
+    finally:
+        db.close()
+
+
+def test_claim_next_job_serves_guest_lane_first_with_aging(db_session_factory):
+    now = datetime.utcnow()
+    [old_debug] = _seed_jobs(
+        db_session_factory, 1, status="queued", priority=90, queued_at=now - timedelta(minutes=10)
+    )
+    [fresh_debug] = _seed_jobs(db_session_factory, 1, status="queued", priority=90, queued_at=now)
+    [bulk] = _seed_jobs(db_session_factory, 1, status="queued", priority=50, queued_at=now)
+    [guest] = _seed_jobs(db_session_factory, 1, status="queued", priority=0, queued_at=now)
+
+    db = db_session_factory()
+    try:
+        order = [claim_next_job(db, "worker-a", aging_seconds=6) for _ in range(5)]
+    finally:
+        db.close()
+
+    # 90 * 6s = 9 minutes of delay: the 10-minute-old debug job has aged past it.
+    assert order == [(old_debug, 90), (guest, 0), (bulk, 50), (fresh_debug, 90), None]
+
+
+
+def test_retried_old_job_ages_from_its_retry_not_its_creation(db_session_factory):
+    now = datetime.utcnow()
+    [old_job] = _seed_jobs(
+        db_session_factory,
+        1,
+        status="failed",
+        created_at=now - timedelta(hours=1),
+        queued_at=now - timedelta(hours=1),
+    )
+    db = db_session_factory()
+    try:
+        retry_job(db, old_job, priority=50)  # admin re-render into the bulk lane
+    finally:
+        db.close()
+    [guest] = _seed_jobs(db_session_factory, 1, status="queued", priority=0)
+
+    db = db_session_factory()
+    try:
+        order = [claim_next_job(db, "worker-a", aging_seconds=6) for _ in range(2)]
+    finally:
+        db.close()
+
+    assert order == [(guest, 0), (old_job, 50)]
+
+
+def test_cancelled_job_is_not_retried_while_its_run_holds_the_lease(db_session_factory):
+    [job_id] = _seed_jobs(db_session_factory, 1, status="queued")
+    db = db_session_factory()
+    try:
+        assert claim_job(db, job_id, "worker-a") is True
+        db.get(Job, job_id).status = "cancelled"  # the run is still in its SeedDream call
+        db.commit()
+
+        with pytest.raises(ValueError, match="JOB_NOT_RETRYABLE"):
+            retry_job(db, job_id)
+
+        release_job(db, job_id, "worker-a")
+        assert retry_job(db, job_id).status == "queued"
+    finally:
+        db.close()
+
+def test_stage_pool_runs_higher_priority_first(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 3, status="queued")
+    release = threading.Event()
+    order: list[int] = []
+
+    def upload(job_id: int) -> bool:
+        release.wait(5)
+        order.append(job_id)
+        return False
+
+    executor = _executor(
+        lambda job_id, mode: None,
+        db_session_factory,
+        workers=1,
+        stages=(("upload", upload, 1),),
+    )
+    try:
+        executor.enqueue_stage("upload", job_ids[0], 0)
+        _wait_for(lambda: executor.stats()["stages"]["upload"]["busy"] == 1)
+        executor.enqueue_stage("upload", job_ids[1], 50)
+        executor.enqueue_stage("upload", job_ids[2], 0)
+        assert executor.enqueue_stage("upload", job_ids[2], 0) is False  # already queued
+        release.set()
+        _wait_for(lambda: executor.stats()["completed"] == 3)
+    finally:
+        release.set()
+        executor.stop()
+
+    assert order == [job_ids[0], job_ids[2], job_ids[1]]
+
+
+
+def test_feed_stage_returns_while_the_stage_queue_is_full(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 4, status="done")
+    release = threading.Event()
+    uploaded: list[int] = []
+
+    def upload(job_id: int) -> bool:
+        release.wait(5)
+        uploaded.append(job_id)
+        return False
+
+    executor = _executor(
+        lambda job_id, mode: None,
+        db_session_factory,
+        workers=1,
+        stages=(("upload", upload, 1),),
+        stage_queue_max=1,
+    )
+    try:
+        started = time.monotonic()
+        feeder = executor.feed_stage("upload", job_ids, 50)
+        assert time.monotonic() - started < 0.5  # one busy, one queued, two waiting in the feeder
+        with pytest.raises(ValueError, match="STAGE_NOT_FOUND"):
+            executor.feed_stage("missing", job_ids)
+
+        release.set()
+        feeder.join(5)
+        _wait_for(lambda: executor.stats()["completed"] == 4)
+    finally:
+        release.set()
+        executor.stop()
+
+    assert uploaded == job_ids
+
+def test_requeue_expired_jobs(db_session_factory):
+    now = datetime.utcnow()
+    expired_id, live_id, legacy_id = _seed_jobs(db_session_factory, 3, status="processing")
+    [exhausted_id] = _seed_jobs(db_session_factory, 1, status="processing", attempts=3)
+
+    db = db_session_factory()
+    try:
+        db.get(Job, expired_id).lease_expires_at = now - timedelta(seconds=5)
+        db.get(Job, live_id).lease_expires_at = now + timedelta(seconds=60)
+        db.get(Job, exhausted_id).lease_expires_at = now - timedelta(seconds=5)
+        db.commit()
+
+        result = requeue_expired_jobs(db, now=now, max_attempts=3)
+        assert result == {"requeued": 2, "failed": 1}
+
+        db.expire_all()
+        assert db.get(Job, expired_id).status == "queued"
+        assert db.get(Job, legacy_id).status == "queued"
+        assert db.get(Job, live_id).status == "processing"
+        assert db.get(Job, exhausted_id).status == "failed"
+    finally:
+        db.close()
+
+
+def test_queue_stats_endpoint(monkeypatch, db_session_factory):
+    _seed_jobs(db_session_factory, 2, status="queued")
+    executor = _executor(lambda job_id, mode: None, db_session_factory, workers=3, queue_max=7)
+    monkeypatch.setattr(jobs_endpoint, "get_job_executor", lambda: executor)
+
+    app = FastAPI()
+    app.include_router(jobs_router, prefix="/api/v1")
+
+    def override_get_db():
+        db = db_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+
+    response = client.get("/api/v1/jobs/queue")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["workers"] == 3
+    assert body["queue_max"] == 7
+    assert body["queue_depth"] == 2
+    assert body["queued_in_db"] == 2
+    assert body["in_flight"] == 0
+
+
+def test_cancelled_queued_job_is_never_claimed(monkeypatch, db_session_factory):
+    [job_id] = _seed_jobs(db_session_factory, 1, status="queued")
+
+    app = FastAPI()
+    app.include_router(jobs_router, prefix="/api/v1")
+
+    def override_get_db():
+        db = db_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+
+    response = client.delete(f"/api/v1/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert client.post(f"/api/v1/jobs/{job_id}/cancel").status_code == 200
+    assert client.delete("/api/v1/jobs/999999").status_code == 404
+
+    db = db_session_factory()
+    try:
+        assert claim_next_job(db, "worker-a") is None
+    finally:
+        db.close()
+
+
+def test_external_worker_mode_leaves_jobs_in_database(monkeypatch, db_session_factory):
+    monkeypatch.setattr(executor_module, "JOB_INPROCESS_WORKERS", False)
+    monkeypatch.setattr(executor_module, "JOB_QUEUE_MAX", 2)
+
+    def fail_if_called():
+        raise AssertionError("in-process executor must not be used")
+
+    monkeypatch.setattr(executor_module, "get_job_executor", fail_if_called)
+
+    [job_id] = _seed_jobs(db_session_factory, 1, status="queued")
+    executor_module.dispatch_job(job_id, "event")
+
+    db = db_session_factory()
+    try:
+        assert executor_module.job_queue_is_full(db) is False
+    finally:
+        db.close()
+
+    _seed_jobs(db_session_factory, 1, status="queued")
+    db = db_session_factory()
+    try:
+        assert executor_module.job_queue_is_full(db) is True
+    finally:
+        db.close()
+
+
+
+def test_queue_bound_counts_queued_rows_with_inprocess_workers(monkeypatch, db_session_factory):
+    monkeypatch.setattr(executor_module, "JOB_INPROCESS_WORKERS", True)
+    monkeypatch.setattr(executor_module, "JOB_QUEUE_MAX", 2)
+    _seed_jobs(db_session_factory, 2, status="queued")
+
+    db = db_session_factory()
+    try:
+        assert executor_module.job_queue_is_full(db) is True
+    finally:
+        db.close()
+
+def test_executor_holds_queued_jobs_while_upstream_is_down(db_session_factory):
+    job_ids = _seed_jobs(db_session_factory, 2, status="queued")
+    handler, seen = _finishing_handler(db_session_factory)
+    hold = {"seconds": 30.0}
+    executor = _executor(handler, db_session_factory, workers=2, hold=lambda: hold["seconds"])
+    try:
+        executor.submit(job_ids[0])
+        executor.submit(job_ids[1])
+        time.sleep(0.3)
+        assert seen == []
+        assert executor.stats()["queue_depth"] == 2  # held rows still count against the bound
+
+        db = db_session_factory()
+        try:
+            assert [job.status for job in db.query(Job).all()] == ["queued", "queued"]
+        finally:
+            db.close()
+
+        hold["seconds"] = 0.0  # circuit closed again
+        _wait_for(lambda: executor.stats()["completed"] == 2)
+    finally:
+        executor.stop()
+
+    assert sorted(job_id for job_id, _, _ in seen) == job_ids
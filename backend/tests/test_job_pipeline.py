@@ -0,0 +1,575 @@
+import asyncio
+import io
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.integrations.seeddream_breaker import CircuitOpen
+from app.modules.jobs import service as job_service
+from app.modules.jobs.model import Job
+from app.modules.jobs.result_cache import ResultCache
+from app.modules.jobs.retry import RetryPolicy
+from app.modules.sessions.model import PhotoSession
+from app.modules.themes.model import Theme
+from app.modules.users.model import User
+from app.utils.files import DownloadRejected
+from app.utils.timings import record_phase
+
+
+@pytest.fixture()
+def db_session_factory():
+    engine = create_engine(
+        "sqlite+pysqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        yield SessionLocal
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture()
+def pipeline_env(monkeypatch, tmp_path, db_session_factory):
+    app_dir = tmp_path / "app"
+    results_dir = app_dir / "static" / "results"
+    compressed_dir = app_dir / "static" / "compressed"
+    uploads_dir = app_dir / "static" / "uploads"
+    for folder in (results_dir, compressed_dir, uploads_dir):
+        folder.mkdir(parents=True)
+
+    monkeypatch.setattr(job_service, "SessionLocal", db_session_factory)
+    monkeypatch.setattr(job_service, "APP_DIR", app_dir)
+    monkeypatch.setattr(job_service, "RESULTS_DIR", results_dir)
+    monkeypatch.setattr(job_service, "COMPRESSED_DIR", compressed_dir)
+    monkeypatch.setattr(job_service, "_attach_drive_info", lambda db, job, **kwargs: True)
+
+    Image.new("RGB", (60, 90), (10, 20, 30)).save(uploads_dir / "input.jpg")
+
+    db = db_session_factory()
+    try:
+        user = User(name="Pipe", email=f"pipe-{uuid.uuid4().hex[:8]}@example.com", phone="084")
+        db.add(user)
+        db.add(
+            Theme(
+                id="retro",
+                title="Retro",
+                thumbnail_url="/static/thumbs/retro.jpeg",
+                prompt="make it retro",
+                params={},
+            )
+        )
+        db.commit()
+        db.refresh(user)
+
+        session = PhotoSession(
+            user_id=user.id,
+            theme_id="retro",
+            input_image_path="/static/uploads/input.jpg",
+            status="photo_uploaded",
+        )
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+
+        job = Job(session_id=session.id, mode="event", status="processing")
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+
+    return {"job_id": job_id, "results_dir": results_dir}
+
+
+def _load_job(db_session_factory, job_id: int) -> Job:
+    db = db_session_factory()
+    try:
+        return db.get(Job, job_id)
+    finally:
+        db.close()
+
+
+def test_failed_download_resumes_without_calling_generation_again(
+    monkeypatch, db_session_factory, pipeline_env
+):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    calls = {"generate": 0, "download": 0}
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        calls["generate"] += 1
+        return "https://example.invalid/result.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        calls["download"] += 1
+        if calls["download"] == 1:
+            raise RuntimeError("DOWNLOAD_FAILED_AFTER_RETRY: boom")
+        out = results_dir / f"{uuid.uuid4().hex}.jpg"
+        Image.new("RGB", (60, 90), (200, 100, 50)).save(out)
+        return out
+
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+    monkeypatch.setattr(job_service, "COMPRESSED_TARGET_SIZE", (30, 45))
+
+    job_service.process_job_seeddream_safe(job_id)
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "failed"
+    assert job.checkpoint_stage == "generate"
+    assert job.source_url == "https://example.invalid/result.jpg"
+
+    job_service.process_job_seeddream_safe(job_id)
+
+    job = _load_job(db_session_factory, job_id)
+    assert calls == {"generate": 1, "download": 2}
+    assert job.status == "done"
+    assert job.checkpoint_stage == "upload"
+    assert job.result_image_path.startswith("/static/results/")
+    assert job.compressed_image_path.startswith("/static/compressed/")
+    assert "resuming after generate" in job.log_text
+
+
+def test_cancel_during_generation_skips_download_and_frees_worker(
+    monkeypatch, db_session_factory, pipeline_env
+):
+    job_id = pipeline_env["job_id"]
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        # Guest walks away while SeedDream is still working.
+        db = db_session_factory()
+        try:
+            job_service.cancel_job(db, job_id)
+        finally:
+            db.close()
+        return "https://example.invalid/result.jpg"
+
+    def fail_download(*args, **kwargs):
+        raise AssertionError("cancelled job must not be downloaded")
+
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fail_download)
+
+    assert job_service.run_generate_stage(job_id) is False
+    assert job_service.run_postprocess_stage(job_id) is False
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "cancelled"
+    assert job.checkpoint_stage == "generate"
+    assert "cancelled: generate" in job.log_text
+
+    db = db_session_factory()
+    try:
+        # Cancelling twice is a no-op; finished jobs cannot be cancelled.
+        assert job_service.cancel_job(db, job_id).status == "cancelled"
+        db.get(Job, job_id).status = "done"
+        db.commit()
+        with pytest.raises(ValueError, match="JOB_NOT_CANCELLABLE"):
+            job_service.cancel_job(db, job_id)
+    finally:
+        db.close()
+
+
+def test_job_deadline_is_shared_by_every_stage(monkeypatch, db_session_factory, pipeline_env):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    budgets: list[float] = []
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        budgets.append(deadline.remaining())
+        return "https://example.invalid/result.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        budgets.append(deadline.remaining())
+        out = results_dir / "deadline.jpg"
+        Image.new("RGB", (60, 90), (1, 2, 3)).save(out)
+        return out
+
+    monkeypatch.setattr(job_service, "JOB_DEADLINE_SECONDS", 30)
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+
+    assert job_service.run_generate_stage(job_id) is True
+    assert all(0 < budget <= 30 for budget in budgets)
+
+    # Budget runs out while the job waits for a post-processing worker.
+    db = db_session_factory()
+    try:
+        db.get(Job, job_id).deadline_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+    finally:
+        db.close()
+
+    # The result is already paid for: overlay, compress and the Drive upload
+    # finish late.
+    assert job_service.run_postprocess_stage(job_id) is True
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "done"
+    assert job.checkpoint_stage == "compress"
+    assert "deadline: overlay started past the job deadline" in job.log_text
+    assert "deadline: compress started past the job deadline" in job.log_text
+
+    upload_budgets: list[float] = []
+
+    def fake_attach(db, job, deadline=None):
+        upload_budgets.append(deadline.timeout(120, "upload"))
+        return True
+
+    monkeypatch.setattr(job_service, "_attach_drive_info", fake_attach)
+    monkeypatch.setattr(job_service, "JOB_UPLOAD_MIN_SECONDS", 60)
+    assert job_service.run_upload_stage(job_id) is False
+    job = _load_job(db_session_factory, job_id)
+    assert 55 < upload_budgets[0] <= 60
+    assert job.checkpoint_stage == "upload"
+    assert "deadline: upload started past the job deadline" in job.log_text
+
+
+def test_generate_stage_retries_transient_upstream_errors(
+    monkeypatch, db_session_factory, pipeline_env
+):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    calls = {"generate": 0}
+
+    def flaky_request(input_abs, prompt, *, logger, deadline):
+        calls["generate"] += 1
+        if calls["generate"] == 1:
+            raise TimeoutError("upstream timed out")
+        return "https://example.invalid/result.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        out = results_dir / "retried.jpg"
+        Image.new("RGB", (60, 90), (1, 2, 3)).save(out)
+        return out
+
+    monkeypatch.setattr(job_service, "_request_event_result", flaky_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+    monkeypatch.setattr(
+        job_service, "GENERATE_RETRY", RetryPolicy(attempts=3, base_seconds=0, max_seconds=0)
+    )
+
+    assert job_service.run_generate_stage(job_id) is True
+
+    job = _load_job(db_session_factory, job_id)
+    assert calls["generate"] == 2
+    assert job.status == "processing"
+    assert job.checkpoint_stage == "download"
+    assert "generate: attempt 1/3 failed (transient: upstream timed out)" in job.log_text
+
+
+def test_resume_stage_falls_back_when_artifact_is_missing(pipeline_env):
+    job = Job(
+        checkpoint_stage="compress",
+        source_url="https://example.invalid/result.jpg",
+        result_image_path="/static/results/missing.png",
+        raw_result_path="/static/results/missing.jpg",
+    )
+    assert job_service.resume_stage(job) == "generate"
+
+    job.source_url = None
+    assert job_service.resume_stage(job) is None
+
+
+def test_async_generate_stage_checkpoints_like_sync_stage(
+    monkeypatch, db_session_factory, pipeline_env
+):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+
+    async def fake_request(input_abs, prompt, *, logger, deadline):
+        logger("calling api")
+        return "https://example.invalid/async.jpg"
+
+    async def fake_download(result_url, *, logger, deadline=None):
+        out = results_dir / "async.jpg"
+        Image.new("RGB", (60, 90), (1, 2, 3)).save(out)
+        logger("downloading 100%")
+        return out
+
+    monkeypatch.setattr(job_service, "_request_event_result_async", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result_async", fake_download)
+
+    assert asyncio.run(job_service.run_generate_stage_async(job_id)) is True
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "processing"
+    assert job.checkpoint_stage == "download"
+    assert job.source_url == "https://example.invalid/async.jpg"
+    assert job.raw_result_path == "/static/results/async.jpg"
+    assert "calling api\ncheckpoint: generate" in job.log_text
+    assert "downloading 100%\ncheckpoint: download" in job.log_text
+
+
+def test_generate_stage_holds_job_while_circuit_is_open(
+    monkeypatch, db_session_factory, pipeline_env
+):
+    job_id = pipeline_env["job_id"]
+
+    def down(input_abs, prompt, *, logger, deadline):
+        raise CircuitOpen(12)
+
+    monkeypatch.setattr(job_service, "_request_event_result", down)
+
+    db = db_session_factory()
+    try:
+        db.get(Job, job_id).attempts = 1  # as claimed by a worker
+        db.commit()
+    finally:
+        db.close()
+
+    assert job_service.run_generate_stage(job_id) is False
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "queued"
+    assert job.error_message is None
+    assert job.attempts == 0  # a hold is not an attempt
+    assert "held: SEEDDREAM_UNAVAILABLE" in job.log_text
+
+
+def test_repeat_generation_reuses_cached_result(monkeypatch, tmp_path, db_session_factory, pipeline_env):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    calls = {"generate": 0}
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        calls["generate"] += 1
+        return "https://example.invalid/result.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        out = results_dir / f"{uuid.uuid4().hex}.jpg"
+        Image.new("RGB", (60, 90), (9, 9, 9)).save(out)
+        return out
+
+    cache = ResultCache(tmp_path / "cache", enabled=True, ttl_seconds=60, max_bytes=1 << 20)
+    monkeypatch.setattr(job_service, "RESULT_CACHE", cache)
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+
+    assert job_service.run_generate_stage(job_id) is True
+    first_raw = _load_job(db_session_factory, job_id).raw_result_path
+
+    db = db_session_factory()
+    try:
+        job = db.get(Job, job_id)
+        job.checkpoint_stage = None  # staff re-run from scratch
+        job.source_url = None
+        db.commit()
+    finally:
+        db.close()
+
+    assert job_service.run_generate_stage(job_id) is True
+
+    job = _load_job(db_session_factory, job_id)
+    assert calls["generate"] == 1
+    assert job.raw_result_path != first_raw
+    assert "result cache: hit" in job.log_text
+    assert cache.stats()["hits"] == 1
+
+
+def test_inline_response_format_skips_download(monkeypatch, db_session_factory, pipeline_env):
+    job_id = pipeline_env["job_id"]
+    buf = io.BytesIO()
+    Image.new("RGB", (60, 90), (4, 5, 6)).save(buf, format="JPEG")
+
+    def fake_inline(input_abs, prompt, *, logger, deadline):
+        return job_service._save_result_bytes(buf.getvalue())
+
+    def no_download(result_url, *, logger, should_cancel=None, deadline=None):
+        raise AssertionError("inline mode must not download")
+
+    monkeypatch.setattr(job_service, "SEEDDREAM_RESPONSE_FORMAT", "b64_json")
+    monkeypatch.setattr(job_service, "_request_event_inline", fake_inline)
+    monkeypatch.setattr(job_service, "_download_event_result", no_download)
+
+    assert job_service.run_generate_stage(job_id) is True
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.checkpoint_stage == "download"
+    assert job.source_url is None
+    assert (pipeline_env["results_dir"] / job.raw_result_path.rsplit("/", 1)[-1]).read_bytes() == buf.getvalue()
+
+
+def test_generate_stage_stores_phase_timings(monkeypatch, db_session_factory, pipeline_env):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        record_phase("upload", 0.5)
+        record_phase("generate", 4.0)
+        return "https://example.invalid/result.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        record_phase("download", 1.25)
+        out = results_dir / f"{uuid.uuid4().hex}.jpg"
+        Image.new("RGB", (60, 90), (7, 7, 7)).save(out)
+        return out
+
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+
+    assert job_service.run_generate_stage(job_id) is True
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.phase_timings == {"upload": 0.5, "generate": 4.0, "download": 1.25}
+    assert "timings: upload=0.50s generate=4.00s download=1.25s" in job.log_text
+
+    db = db_session_factory()
+    try:
+        stats = job_service.job_phase_stats(db)
+    finally:
+        db.close()
+    assert stats["jobs"] == 1
+    assert stats["phases"]["generate"]["p95"] == 4.0
+
+
+def test_postprocess_compresses_overlay_composite_without_reopening_master(
+    monkeypatch, tmp_path, db_session_factory, pipeline_env
+):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    overlays_dir = tmp_path / "app" / "static" / "overlays"
+    overlays_dir.mkdir(parents=True)
+    frame = Image.new("RGBA", (60, 90), (0, 0, 0, 0))
+    frame.paste((255, 0, 0, 255), (0, 0, 60, 10))  # red top bar
+    frame.save(overlays_dir / "frame.png")
+
+    raw = results_dir / "raw.jpg"
+    Image.new("RGB", (60, 90), (0, 0, 255)).save(raw)
+    db = db_session_factory()
+    try:
+        job = db.get(Job, job_id)
+        job.checkpoint_stage = "download"
+        job.raw_result_path = "/static/results/raw.jpg"
+        job.overlay_image_path = "/static/overlays/frame.png"
+        db.commit()
+    finally:
+        db.close()
+
+    opened: list[str] = []
+    real_open = Image.open
+
+    def spy_open(fp, *args, **kwargs):
+        opened.append(Path(fp).name)
+        return real_open(fp, *args, **kwargs)
+
+    monkeypatch.setattr(job_service, "OVERLAYS_DIR", overlays_dir)
+    monkeypatch.setattr(job_service.Image, "open", spy_open)
+    monkeypatch.setattr(job_service, "COMPRESSED_TARGET_SIZE", (30, 45))
+
+    job_service.run_postprocess_stage(job_id)
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "done"
+    assert job.result_image_path.endswith(".png")
+    assert sorted(opened) == ["frame.png", "raw.jpg"]  # the PNG master is written, never re-read
+
+    compressed = results_dir.parent / "compressed" / job.compressed_image_path.rsplit("/", 1)[-1]
+    with real_open(compressed) as small:
+        assert small.size == (30, 45)
+        r, g, b = small.convert("RGB").getpixel((15, 1))
+        assert r > 200 and b < 60
+        r, g, b = small.convert("RGB").getpixel((15, 30))
+        assert b > 200 and r < 60
+
+
+def test_rejected_result_url_drops_generate_checkpoint(monkeypatch, db_session_factory, pipeline_env):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    calls = {"generate": 0, "download": 0}
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        calls["generate"] += 1
+        return f"https://example.invalid/result-{calls['generate']}.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        calls["download"] += 1
+        if result_url.endswith("result-1.jpg"):
+            raise DownloadRejected(403)  # signed URL expired
+        out = results_dir / f"{uuid.uuid4().hex}.jpg"
+        Image.new("RGB", (60, 90), (5, 5, 5)).save(out)
+        return out
+
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+
+    assert job_service.run_generate_stage(job_id) is False
+
+    job = _load_job(db_session_factory, job_id)
+    assert job.status == "failed"
+    assert job.error_message == "DOWNLOAD_REJECTED: HTTP 403"
+    assert job.source_url is None
+    assert job.checkpoint_stage is None
+
+    assert job_service.run_generate_stage(job_id) is True
+    assert calls == {"generate": 2, "download": 2}
+
+
+def test_in_flight_cancel_checks_share_one_query_per_tick(monkeypatch):
+    queries: list[list[int]] = []
+
+    def cancelled_job_ids(job_ids):
+        queries.append(sorted(job_ids))
+        return {2}
+
+    monkeypatch.setattr(job_service, "_cancelled_job_ids", cancelled_job_ids)
+    monkeypatch.setattr(job_service, "CANCEL_POLL_SECONDS", 0.01)
+
+    class Run:
+        def __init__(self, job_id):
+            self.job_id = job_id
+
+    async def generation():
+        await asyncio.sleep(0.2)
+        return "saved"
+
+    async def main():
+        return await asyncio.gather(
+            *(job_service._unless_cancelled(generation(), Run(job_id)) for job_id in (1, 2, 3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert results[0] == results[2] == "saved"
+    assert isinstance(results[1], job_service.JobCancelled)
+    assert queries[0] == [1, 2, 3]
+    assert set(map(tuple, queries)) <= {(1, 2, 3), (1, 3)}
+
+
+def test_held_job_keeps_its_log_when_claimed_again(monkeypatch, db_session_factory, pipeline_env):
+    job_id = pipeline_env["job_id"]
+    results_dir = pipeline_env["results_dir"]
+    calls = {"generate": 0}
+
+    def fake_request(input_abs, prompt, *, logger, deadline):
+        calls["generate"] += 1
+        if calls["generate"] == 1:
+            raise CircuitOpen(30)
+        return "https://example.invalid/result.jpg"
+
+    def fake_download(result_url, *, logger, should_cancel=None, deadline=None):
+        out = results_dir / "held.jpg"
+        Image.new("RGB", (60, 90), (4, 5, 6)).save(out)
+        return out
+
+    monkeypatch.setattr(job_service, "_request_event_result", fake_request)
+    monkeypatch.setattr(job_service, "_download_event_result", fake_download)
+
+    assert job_service.run_generate_stage(job_id) is False
+    assert _load_job(db_session_factory, job_id).status == "queued"
+    assert job_service.run_generate_stage(job_id) is True
+
+    log_text = _load_job(db_session_factory, job_id).log_text
+    assert "held: SEEDDREAM_UNAVAILABLE: circuit open, retry in 30s" in log_text
+    assert log_text.index("held:") < log_text.index("checkpoint: download")
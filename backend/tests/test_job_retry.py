@@ -0,0 +1,83 @@
+import time
+
+import httpx
+import pytest
+from byteplussdkarkruntime._exceptions import ArkAPIStatusError, ArkAPITimeoutError
+
+from app.modules.jobs.retry import PERMANENT, TRANSIENT, RetryPolicy, classify_error
+from app.utils.deadline import Deadline, DeadlineExceeded
+
+REQUEST = httpx.Request("POST", "https://ark.example.invalid/images/generations")
+
+
+def _status_error(status: int, headers: dict | None = None) -> ArkAPIStatusError:
+    response = httpx.Response(status, request=REQUEST, headers=headers)
+    return ArkAPIStatusError(f"status {status}", response=response, body=None, request_id="req")
+
+
+def test_classify_error():
+    assert classify_error(_status_error(503)) == TRANSIENT
+    assert classify_error(_status_error(429)) == TRANSIENT
+    assert classify_error(ArkAPITimeoutError(request=REQUEST, request_id="req")) == TRANSIENT
+    assert classify_error(httpx.ReadTimeout("slow", request=REQUEST)) == TRANSIENT
+    assert classify_error(_status_error(400)) == PERMANENT
+    assert classify_error(DeadlineExceeded("JOB_DEADLINE_EXCEEDED: generate")) == PERMANENT
+    assert classify_error(ValueError("bad prompt")) == PERMANENT
+
+
+def test_backoff_is_exponential_with_full_jitter():
+    policy = RetryPolicy(attempts=5, base_seconds=2, max_seconds=5, rng=lambda: 1.0)
+    assert [policy.backoff(n, RuntimeError()) for n in (1, 2, 3)] == [2, 4, 5]
+
+    policy = RetryPolicy(attempts=5, base_seconds=2, max_seconds=5, rng=lambda: 0.0)
+    assert policy.backoff(3, RuntimeError()) == 0
+    # Retry-After from a 429 is honoured up to the cap.
+    assert policy.backoff(1, _status_error(429, {"Retry-After": "3"})) == 3
+
+
+def test_transient_errors_are_retried_and_logged():
+    calls = {"count": 0}
+    lines: list[str] = []
+    sleeps: list[float] = []
+
+    def flaky():
+        calls["count"] += 1
+        if calls["count"] < 3:
+            raise _status_error(503)
+        return "https://example.invalid/result.jpg"
+
+    policy = RetryPolicy(attempts=3, base_seconds=1, max_seconds=4, rng=lambda: 0.5)
+    result = policy.call(flaky, what="generate", logger=lines.append, sleep=sleeps.append)
+
+    assert result == "https://example.invalid/result.jpg"
+    assert sleeps == [0.5, 1.0]
+    assert lines == [
+        "generate: attempt 1/3 failed (transient: status 503, request_id: req), retrying in 0.5s",
+        "generate: attempt 2/3 failed (transient: status 503, request_id: req), retrying in 1.0s",
+    ]
+
+
+def test_permanent_error_and_exhausted_deadline_fail_immediately():
+    lines: list[str] = []
+    policy = RetryPolicy(attempts=3, base_seconds=1, max_seconds=4, rng=lambda: 1.0)
+
+    def rejected():
+        raise _status_error(400)
+
+    with pytest.raises(ArkAPIStatusError):
+        policy.call(rejected, what="generate", logger=lines.append, sleep=pytest.fail)
+    assert lines == ["generate: attempt 1/3 failed (permanent: status 400, request_id: req)"]
+
+    def overloaded():
+        raise _status_error(503)
+
+    lines.clear()
+    with pytest.raises(ArkAPIStatusError):
+        policy.call(
+            overloaded,
+            what="generate",
+            logger=lines.append,
+            deadline=Deadline(time.time() + 0.5),
+            sleep=pytest.fail,
+        )
+    assert lines[-1].endswith("no time left to retry")
@@ -0,0 +1,97 @@
+import os
+
+from PIL import Image, ImageChops
+
+from app.modules.jobs.overlay_cache import FittedOverlay, OverlayCache, overlay_regions
+
+
+def _frame(path, size=(40, 60), color=(255, 0, 0, 255)):
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    img.paste(color, (0, 0, size[0], 4))
+    img.save(path)
+    return path
+
+
+def test_repeat_overlay_is_fitted_once(tmp_path):
+    overlay = _frame(tmp_path / "frame.png")
+    cache = OverlayCache(max_bytes=1 << 20)
+    lines: list[str] = []
+
+    first = cache.get(overlay, (80, 120), logger=lines.append)
+    second = cache.get(overlay, (80, 120), logger=lines.append)
+
+    assert first is second
+    assert first.image.size == (80, 120) and first.image.mode == "RGBA"
+    assert "overlay: resized to 80x120" in lines
+    assert lines[-1] == "overlay: cached"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_replaced_overlay_file_is_reloaded(tmp_path):
+    overlay = _frame(tmp_path / "frame.png")
+    cache = OverlayCache(max_bytes=1 << 20)
+    first = cache.get(overlay, (40, 60), logger=lambda _line: None)
+
+    _frame(overlay, color=(0, 255, 0, 255))
+    stat = overlay.stat()
+    os.utime(overlay, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    second = cache.get(overlay, (40, 60), logger=lambda _line: None)
+
+    assert first.image.getpixel((0, 0)) == (255, 0, 0, 255)
+    assert second.image.getpixel((0, 0)) == (0, 255, 0, 255)
+
+
+def test_least_recently_used_size_is_evicted_over_budget(tmp_path):
+    overlay = _frame(tmp_path / "frame.png")
+    cache = OverlayCache(max_bytes=2 * 40 * 60 * 4)  # room for two 40x60 RGBA layers
+
+    cache.get(overlay, (40, 60), logger=lambda _line: None)
+    cache.get(overlay, (20, 30), logger=lambda _line: None)
+    cache.get(overlay, (40, 60), logger=lambda _line: None)  # touch
+    cache.get(overlay, (41, 60), logger=lambda _line: None)  # evicts 20x30 and then 40x60
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_ratio_mismatch_is_letterboxed_not_stretched(tmp_path):
+    overlay = _frame(tmp_path / "frame.png", size=(40, 40))
+    cache = OverlayCache(max_bytes=1 << 20)
+
+    fitted = cache.get(overlay, (40, 60), logger=lambda _line: None).image
+
+    assert fitted.size == (40, 60)
+    assert fitted.getpixel((20, 5))[3] == 0  # band above the centred square
+    assert fitted.getpixel((20, 11)) == (255, 0, 0, 255)
+
+
+def _frame_with_logo(size=(600, 900)):
+    # Opaque 20 px bars on every edge plus a half-transparent logo in the middle.
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    w, h = size
+    for box in ((0, 0, w, 20), (0, h - 20, w, h), (0, 0, 20, h), (w - 20, 0, w, h)):
+        img.paste((200, 30, 30, 255), box)
+    img.paste((255, 255, 255, 128), (280, 300, 380, 400))
+    return img
+
+
+def test_regions_skip_transparent_cells_and_flag_opaque_ones():
+    regions = overlay_regions(_frame_with_logo(), tile=64)
+
+    covered = sum((r - l) * (b - t) for (l, t, r, b), _ in regions)
+    assert covered < 600 * 900 * 0.2
+    assert any(opaque for _, opaque in regions)
+    assert ((280, 300, 320, 320), False) in regions  # part of the logo: blended, not pasted
+
+
+def test_region_composite_matches_full_alpha_composite():
+    base = Image.effect_noise((600, 900), 60).convert("RGB")
+    overlay = _frame_with_logo()
+
+    expected = Image.alpha_composite(base.convert("RGBA"), overlay).convert("RGB")
+    actual = FittedOverlay(overlay).composite_onto(base.copy())
+
+    assert actual.mode == "RGB"
+    assert max(high for _, high in ImageChops.difference(actual, expected).getextrema()) <= 1
@@ -0,0 +1,69 @@
+import os
+import time
+
+from app.modules.jobs.result_cache import ResultCache, result_cache_key
+
+
+def _cache(tmp_path, **kwargs) -> ResultCache:
+    kwargs.setdefault("enabled", True)
+    kwargs.setdefault("ttl_seconds", 3600)
+    kwargs.setdefault("max_bytes", 1024 * 1024)
+    return ResultCache(tmp_path / "cache", **kwargs)
+
+
+def test_key_covers_every_input():
+    base = result_cache_key("abc", "make it retro", "2400x3600", True)
+    assert base == result_cache_key("abc", "make it retro", "2400x3600", True)
+    assert base != result_cache_key("abd", "make it retro", "2400x3600", True)
+    assert base != result_cache_key("abc", "make it retro!", "2400x3600", True)
+    assert base != result_cache_key("abc", "make it retro", "4k", True)
+    assert base != result_cache_key("abc", "make it retro", "2400x3600", False)
+
+
+def test_hit_returns_a_private_copy(tmp_path):
+    cache = _cache(tmp_path)
+    out_dir = tmp_path / "results"
+    raw = tmp_path / "raw.jpg"
+    raw.write_bytes(b"jpeg-bytes")
+
+    assert cache.get("k1", out_dir) is None
+    cache.put("k1", raw)
+    raw.unlink()  # the job's own file may be cleaned up later
+
+    first = cache.get("k1", out_dir)
+    second = cache.get("k1", out_dir)
+    assert first != second
+    assert first.parent == out_dir and first.suffix == ".jpg"
+    assert first.read_bytes() == second.read_bytes() == b"jpeg-bytes"
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stored"], stats["entries"]) == (2, 1, 1, 1)
+
+
+def test_expired_and_oversized_entries_are_evicted(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=60, max_bytes=25)
+    out_dir = tmp_path / "results"
+    for name in ("old", "a", "b", "c"):
+        raw = tmp_path / f"{name}.jpg"
+        raw.write_bytes(b"x" * 10)
+        cache.put(name, raw)
+        if name == "old":
+            stale = time.time() - 120
+            os.utime(cache.folder / "old.jpg", (stale, stale))
+        else:
+            time.sleep(0.01)  # distinct mtimes: oldest first
+
+    assert cache.get("old", out_dir) is None
+    assert cache.get("a", out_dir) is None  # over 25 bytes: oldest dropped
+    assert cache.get("b", out_dir) is not None
+    assert cache.get("c", out_dir) is not None
+    assert cache.stats()["bytes"] <= 25
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = _cache(tmp_path, enabled=False)
+    raw = tmp_path / "raw.jpg"
+    raw.write_bytes(b"jpeg")
+    cache.put("k", raw)
+    assert cache.get("k", tmp_path) is None
+    assert not cache.folder.exists()
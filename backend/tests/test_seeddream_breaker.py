@@ -0,0 +1,202 @@
+import httpx
+import pytest
+
+from app.integrations.seeddream_breaker import CircuitBreaker, CircuitOpen, SharedBreakerState
+from app.integrations.seeddream_pool import SeedDreamClient
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_to_close():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=clock)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()  # a success resets the streak
+    assert breaker.state == "closed"
+
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == 30
+    assert "SEEDDREAM_UNAVAILABLE" in str(exc.value)
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.retry_after() == 0
+    breaker.before_call()  # the probe
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_after() == 30
+
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+    stats = breaker.stats()
+    assert stats["opened"] == 2
+    assert stats["rejected"] == 2
+    assert stats["consecutive_failures"] == 0
+
+
+def test_abandoned_probe_lets_the_next_one_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=5, clock=clock)
+    breaker.record_failure()
+    clock.now += 5
+
+    breaker.before_call()
+    breaker.record_abandoned()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_client_fails_fast_while_upstream_is_down():
+    clock = FakeClock()
+    calls = {"count": 0, "status": 500}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["count"] += 1
+        if calls["status"] != 200:
+            return httpx.Response(calls["status"], json={"error": {"message": "down"}})
+        return httpx.Response(
+            200, json={"model": "m", "created": 1, "data": [{"url": "https://example.invalid/a.jpg"}]}
+        )
+
+    client = SeedDreamClient(
+        base_url="https://ark.example.invalid/api/v3",
+        api_key="test-key",
+        http2=False,
+        transport=httpx.MockTransport(handler),
+        breaker=CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=clock),
+    )
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            client.generate(model="m", prompt="p")
+    with pytest.raises(CircuitOpen):
+        client.generate(model="m", prompt="p")
+    assert calls["count"] == 2  # the third call never reached the upstream
+    assert client.pool_stats()["breaker"]["state"] == "open"
+
+    # A 4xx means SeedDream is up: it does not count towards opening.
+    clock.now += 10
+    calls["status"] = 400
+    with pytest.raises(Exception):
+        client.generate(model="m", prompt="p")
+    assert client.breaker.state == "closed"
+
+    calls["status"] = 200
+    assert client.generate(model="m", prompt="p").data[0].url == "https://example.invalid/a.jpg"
+    client.close()
+
+
+def test_circuit_opened_by_one_worker_is_seen_by_another_process(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "seeddream_breaker.json"
+    # Two worker processes and the API, each with its own view of the file.
+    worker_a = CircuitBreaker(
+        failure_threshold=2,
+        reset_seconds=30,
+        clock=clock,
+        shared=SharedBreakerState(path, clock=clock),
+    )
+    worker_b = CircuitBreaker(
+        failure_threshold=2,
+        reset_seconds=30,
+        clock=clock,
+        shared=SharedBreakerState(path, clock=clock),
+    )
+    api = SharedBreakerState(path, clock=clock)
+    assert api.snapshot() == {"state": "closed", "retry_after_seconds": 0.0, "consecutive_failures": 0}
+
+    worker_a.record_failure()
+    worker_a.record_failure()
+    assert api.snapshot() == {"state": "open", "retry_after_seconds": 30.0, "consecutive_failures": 2}
+
+    # A lone failure elsewhere does not close what worker A opened.
+    worker_b.record_failure()
+    clock.now += 10
+    assert api.snapshot()["state"] == "open"
+    assert api.retry_after() == 20
+
+    clock.now += 20
+    assert api.snapshot()["state"] == "half_open"
+    assert api.retry_after() == 0
+
+    worker_b.record_success()  # B's probe got through
+    assert api.snapshot() == {"state": "closed", "retry_after_seconds": 0.0, "consecutive_failures": 0}
+
+
+def test_only_one_process_probes_a_shared_open_circuit(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "seeddream_breaker.json"
+
+    def worker():
+        return CircuitBreaker(
+            failure_threshold=2,
+            reset_seconds=30,
+            clock=clock,
+            shared=SharedBreakerState(path, clock=clock),
+        )
+
+    worker_a, worker_b, worker_c = worker(), worker(), worker()
+    api = SharedBreakerState(path, clock=clock)
+    worker_a.record_failure()
+    worker_a.record_failure()
+
+    with pytest.raises(CircuitOpen):
+        worker_b.before_call()  # B never saw a failure, but A's circuit is open
+
+    clock.now += 30
+    worker_b.before_call()  # B is the probe
+    with pytest.raises(CircuitOpen):
+        worker_c.before_call()
+    assert api.snapshot()["state"] == "half_open"
+    assert api.retry_after() == 1.0  # probe out: check back shortly
+
+    worker_b.record_failure()  # the probe failed: open for another window
+    assert api.snapshot()["state"] == "open"
+    assert api.retry_after() == 30
+    with pytest.raises(CircuitOpen):
+        worker_c.before_call()
+
+    clock.now += 30
+    worker_c.before_call()
+    worker_c.record_success()
+    assert api.snapshot()["state"] == "closed"
+    worker_a.before_call()
+    worker_b.before_call()
+
+
+def test_probe_of_a_dead_process_is_taken_over(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "seeddream_breaker.json"
+    opener = SharedBreakerState(path, clock=clock)
+    opener.publish("open", 5, retry_after=30)
+    clock.now += 30
+
+    dead = SharedBreakerState(path, clock=clock, probe_timeout=120)
+    other = SharedBreakerState(path, clock=clock, probe_timeout=120)
+    assert dead.allow_call() is True
+    assert other.allow_call() is False
+
+    clock.now += 120  # the probing process never reported back
+    assert other.allow_call() is True
+    other.release_probe()  # e.g. cancelled: the next caller may probe
+    assert SharedBreakerState(path, clock=clock).allow_call() is True
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.integrations.seeddream_limiter import AdaptiveLimiter, LimiterTimeout, TokenBucket
+from app.integrations.seeddream_pool import SeedDreamClient
+
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0
+    wait = bucket.try_take()
+    assert 0 < wait <= 0.1
+
+
+def test_throttling_halves_limit_once_per_cooldown_and_recovers():
+    limiter = AdaptiveLimiter(rate=100, burst=100, max_concurrency=8, cooldown=60)
+
+    for _ in range(3):
+        limiter.acquire()
+    for _ in range(3):
+        limiter.release(latency=None, throttled=True)  # one burst of 429s
+
+    stats = limiter.stats()
+    assert stats["concurrency_limit"] == 4
+    assert stats["rate_per_second"] == 50
+    assert stats["throttled"] == 3
+    assert stats["decreases"] == 1
+
+    for _ in range(40):
+        limiter.acquire()
+        limiter.release(latency=0.2, throttled=False)
+
+    stats = limiter.stats()
+    assert stats["concurrency_limit"] == 8
+    assert stats["rate_per_second"] == 54
+
+
+def test_slow_responses_do_not_grow_the_limit():
+    limiter = AdaptiveLimiter(rate=100, burst=100, max_concurrency=8, cooldown=0)
+    limiter.acquire()
+    limiter.release(latency=None, throttled=True)
+    limiter.acquire()
+    limiter.release(latency=1.0, throttled=False)  # baseline
+    before = limiter.stats()["concurrency_limit"]
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(latency=5.0, throttled=False)
+
+    assert limiter.stats()["concurrency_limit"] == before
+
+
+def test_concurrency_limit_blocks_until_a_slot_frees():
+    limiter = AdaptiveLimiter(rate=100, burst=100, max_concurrency=1)
+    limiter.acquire()
+
+    with pytest.raises(LimiterTimeout):
+        limiter.acquire(max_wait=0.05)
+
+    threading.Timer(0.05, lambda: limiter.release(latency=0.1, throttled=False)).start()
+    started = time.monotonic()
+    limiter.acquire(max_wait=2)
+    assert time.monotonic() - started < 1
+
+    async def wait_async():
+        await limiter.acquire_async(max_wait=0.05)
+
+    with pytest.raises(LimiterTimeout):
+        asyncio.run(wait_async())
+
+
+def test_client_shrinks_on_429_from_upstream():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, json={"error": {"message": "slow down"}})
+
+    client = SeedDreamClient(
+        base_url="https://ark.example.invalid/api/v3",
+        api_key="test-key",
+        http2=False,
+        transport=httpx.MockTransport(handler),
+        limiter=AdaptiveLimiter(rate=100, burst=100, max_concurrency=8),
+    )
+
+    with pytest.raises(Exception):
+        client.generate(model="seedream", prompt="p")
+
+    limiter = client.pool_stats()["limiter"]
+    assert limiter["concurrency_limit"] == 4
+    assert limiter["in_flight"] == 0
+    assert limiter["throttled"] == 1
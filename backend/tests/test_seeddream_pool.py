@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+
+from app.integrations.seeddream_pool import SeedDreamClient
+
+RESULT = {"model": "seedream", "created": 1, "data": [{"url": "https://example.invalid/out.jpg"}]}
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    assert request.url.path.endswith("/images/generations")
+    assert request.headers["authorization"] == "Bearer test-key"
+    return httpx.Response(200, json=RESULT)
+
+
+def _client(**kwargs) -> SeedDreamClient:
+    return SeedDreamClient(
+        base_url="https://ark.example.invalid/api/v3",
+        api_key="test-key",
+        http2=False,
+        max_connections=4,
+        max_keepalive=8,
+        **kwargs,
+    )
+
+
+def test_sync_and_async_calls_share_one_client_and_report_usage():
+    client = _client(
+        transport=httpx.MockTransport(_handler),
+        async_transport=httpx.MockTransport(_handler),
+    )
+
+    resp = client.generate(model="seedream", prompt="p", image="data:image/jpeg;base64,AA")
+    assert resp.data[0].url == "https://example.invalid/out.jpg"
+    assert client.ark() is client.ark()
+
+    async def run_many():
+        calls = [
+            client.generate_async(model="seedream", prompt="p", image="data:image/jpeg;base64,AA")
+            for _ in range(3)
+        ]
+        return await asyncio.gather(*calls)
+
+    results = asyncio.run(run_many())
+    assert [r.data[0].url for r in results] == ["https://example.invalid/out.jpg"] * 3
+
+    stats = client.pool_stats()
+    assert stats["requests"] == 4
+    assert stats["errors"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["peak_in_flight"] >= 1
+    assert stats["max_connections"] == 4
+    assert stats["max_keepalive"] == 4  # never above max_connections
+    assert stats["clients"] == 2
+    client.close()
+
+
+def test_failed_calls_are_counted():
+    client = _client(transport=httpx.MockTransport(lambda request: httpx.Response(400, json={})))
+
+    try:
+        client.generate(model="seedream", prompt="p")
+    except Exception:
+        pass
+
+    stats = client.pool_stats()
+    assert stats["requests"] == 1
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0
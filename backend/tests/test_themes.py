@@ -383,8 +383,11 @@ def test_job_flow_fetches_prompt_from_database_theme(db_session_factory, tmp_pat
 
     seen = {"prompt": None}
 
-    def fake_generate_event_result(input_abs, prompt, *, logger, started_at):
+    def fake_request_event_result(input_abs, prompt, *, logger, deadline):
         seen["prompt"] = prompt
+        return "https://example.invalid/generated.jpg"
+
+    def fake_download_event_result(result_url, *, logger, should_cancel=None, deadline=None):
         output = results_dir / "generated.jpg"
         Image.new("RGB", (2400, 3600), (120, 130, 140)).save(output, format="JPEG")
         return output
@@ -393,7 +396,8 @@ def test_job_flow_fetches_prompt_from_database_theme(db_session_factory, tmp_pat
     monkeypatch.setattr(jobs_service, "APP_DIR", tmp_path / "app")
     monkeypatch.setattr(jobs_service, "RESULTS_DIR", results_dir)
     monkeypatch.setattr(jobs_service, "COMPRESSED_DIR", compressed_dir)
-    monkeypatch.setattr(jobs_service, "_generate_event_result", fake_generate_event_result)
+    monkeypatch.setattr(jobs_service, "_request_event_result", fake_request_event_result)
+    monkeypatch.setattr(jobs_service, "_download_event_result", fake_download_event_result)
     monkeypatch.setattr(jobs_service, "_attach_drive_info", lambda *args, **kwargs: None)
 
     jobs_service.process_job_seeddream_safe(job_id, requested_mode="event")
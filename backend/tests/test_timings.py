@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.utils.files import save_image_from_url
+from app.utils.timings import (
+    PhaseTimings,
+    record_phase,
+    summarize_phases,
+    trace_request,
+    trace_request_async,
+    track_phases,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"x" * 4096
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_request_hook_splits_connect_upload_and_ttfb(server_url):
+    timings = PhaseTimings()
+    with httpx.Client(event_hooks={"request": [trace_request]}) as client:
+        with track_phases(timings):
+            client.post(f"{server_url}/generate", content=b"y" * 100_000)
+        client.post(f"{server_url}/generate", content=b"y")  # untracked: ignored
+
+    assert set(timings.as_dict()) == {"connect", "upload", "ttfb"}
+
+
+def test_async_request_hook_records_into_current_timings(server_url):
+    timings = PhaseTimings()
+
+    async def run():
+        async with httpx.AsyncClient(event_hooks={"request": [trace_request_async]}) as client:
+            with track_phases(timings):
+                await client.post(f"{server_url}/generate", content=b"y" * 1000)
+                await client.post(f"{server_url}/generate", content=b"y" * 1000)
+
+    asyncio.run(run())
+
+    seconds = timings.as_dict()
+    assert {"upload", "ttfb"} <= set(seconds)
+    assert "connect" in seconds  # first request only; the second reuses the connection
+
+
+def test_download_records_ttfb_and_total(server_url, tmp_path):
+    timings = PhaseTimings()
+    with track_phases(timings):
+        save_image_from_url(f"{server_url}/result.jpg", tmp_path, progress_step=100)
+
+    assert set(timings.as_dict()) == {"download_ttfb", "download"}
+
+
+def test_record_phase_outside_a_job_is_a_no_op():
+    record_phase("encode", 1.0)
+
+    timings = PhaseTimings({"encode": 0.5})
+    with track_phases(timings):
+        record_phase("encode", 0.25)
+    assert timings.as_dict() == {"encode": 0.75}
+    assert timings.summary() == "encode=0.75s"
+
+
+def test_summarize_phases_reports_percentiles_in_pipeline_order():
+    samples = [{"generate": float(i), "encode": 0.1} for i in range(1, 101)]
+
+    stats = summarize_phases(samples)
+
+    assert list(stats) == ["encode", "generate"]
+    assert stats["generate"]["count"] == 100
+    assert stats["generate"]["p50"] == 51.0
+    assert stats["generate"]["p95"] == 95.0
+    assert stats["generate"]["p99"] == 99.0
+    assert stats["encode"]["mean"] == 0.1
@@ -1,5 +1,24 @@
 import { api } from "./client";
 
+export function newIdempotencyKey() {
+  if (globalThis.crypto?.randomUUID) return globalThis.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// POST that is safe to resend: the server replays the first result for the
+// same Idempotency-Key, so a request lost on flaky Wi-Fi is simply retried.
+async function postIdempotent(url, body, idempotencyKey, { retries = 2 } = {}) {
+  const headers = { "Idempotency-Key": idempotencyKey || newIdempotencyKey() };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await api.post(url, body, { headers });
+    } catch (e) {
+      if (e?.response || attempt >= retries) throw e;
+      await new Promise((r) => setTimeout(r, 500 * (attempt + 1)));
+    }
+  }
+}
+
 export async function getThemes() {
   const res = await api.get("/themes");
   console.log(res.data)
@@ -80,8 +99,8 @@ export async function executeEventDelete(startDate, endDate, password) {
   return res.data;
 }
 
-export async function startSession({ name, email, phone }) {
-  const res = await api.post("/sessions/start", { name, email, phone });
+export async function startSession({ name, email, phone }, { idempotencyKey } = {}) {
+  const res = await postIdempotent("/sessions/start", { name, email, phone }, idempotencyKey);
   return res.data; // SessionOut
 }
 
@@ -120,12 +139,32 @@ export async function getPrinters() {
   return res.data; // { printers: [{ name, is_default }], detected_on, error_message }
 }
 
-export async function createJob(sessionId, mode = "event", overlayUrl = null) {
-  const res = await api.post("/jobs", {
+export async function createJob(
+  sessionId,
+  mode = "event",
+  overlayUrl = null,
+  { idempotencyKey } = {},
+) {
+  const res = await postIdempotent(
+    "/jobs",
+    { session_id: sessionId, mode, overlay_url: overlayUrl },
+    idempotencyKey,
+  );
+  return res.data; // JobOut
+}
+
+export async function createJobBatch(sessionId, themeIds, mode = "event", overlayUrl = null) {
+  const res = await api.post("/jobs/batch", {
     session_id: sessionId,
+    theme_ids: themeIds,
     mode,
     overlay_url: overlayUrl,
   });
+  return res.data; // { session_id, jobs: JobOut[] }
+}
+
+export async function cancelJob(jobId) {
+  const res = await api.post(`/jobs/${jobId}/cancel`);
   return res.data; // JobOut
 }
 
@@ -134,6 +173,11 @@ export async function getJob(jobId) {
   return res.data; // JobOut
 }
 
+export async function getSeeddreamHealth() {
+  const res = await api.get("/seeddream/health");
+  return res.data; // { available, state, retry_after_seconds, consecutive_failures, queued_jobs }
+}
+
 export async function getGallery({ limit = 100 } = {}) {
   const res = await api.get("/gallery", { params: { limit } });
   return res.data; // [{ id, url }]
@@ -146,7 +190,7 @@ export async function pollJob(jobId, { intervalMs = 1000, timeoutMs = 180000 } =
   while (true) {
     const job = await getJob(jobId);
 
-    if (job.status === "done" || job.status === "failed") return job;
+    if (job.status === "done" || job.status === "failed" || job.status === "cancelled") return job;
 
     if (Date.now() - started > timeoutMs) {
       const err = new Error("POLL_TIMEOUT");
@@ -11,7 +11,9 @@ import {
   uploadOverlay as uploadOverlayApi,
   createJob,
   getJob,
+  getSeeddreamHealth,
   getSession,
+  newIdempotencyKey,
   updateTheme as updateThemeApi,
 } from "../api/seeddream";
 
@@ -46,6 +48,8 @@ export const useSeedDreamStore = defineStore("seeddream", {
     loadingThemes: false,
     loadingSession: false,
     loadingJob: false,
+    jobRequestKey: null, // reused by double taps until the job is created
+    upstreamDown: false, // SeedDream circuit open: job is held in the queue
 
     cameraStream: null,   // MediaStream
     cameraReady: false,
@@ -213,7 +217,7 @@ export const useSeedDreamStore = defineStore("seeddream", {
       this.loadingSession = true;
       this.error = null;
       try {
-        this.session = await startSession(payload);
+        this.session = await startSession(payload, { idempotencyKey: newIdempotencyKey() });
         this.persist();
         return this.session;
       } catch (e) {
@@ -313,22 +317,42 @@ export const useSeedDreamStore = defineStore("seeddream", {
       this.loadingJob = true;
       this.error = null;
 
+      // A second tap while the first request is in flight shares its key,
+      // so the server returns the same job instead of generating twice.
+      this.jobRequestKey = this.jobRequestKey || newIdempotencyKey();
+      const idempotencyKey = this.jobRequestKey;
+
       try {
         const created = await createJob(
           this.session.session_id,
           this.runMode,
           this.overlayUrl,
+          { idempotencyKey },
         );
+        if (this.jobRequestKey === idempotencyKey) this.jobRequestKey = null;
         this.job = created;
         this.persist();
 
-        const started = Date.now();
+        let started = Date.now();
         while (true) {
           const j = await getJob(created.job_id);
           this.job = j;
           this.persist();
 
-          if (j.status === "done" || j.status === "failed") {
+          if (j.status === "queued") {
+            try {
+              const health = await getSeeddreamHealth();
+              this.upstreamDown = !health.available;
+            } catch {
+              this.upstreamDown = false;
+            }
+            // Held jobs resume on their own; waiting on them does not count.
+            if (this.upstreamDown) started = Date.now();
+          } else {
+            this.upstreamDown = false;
+          }
+
+          if (j.status === "done" || j.status === "failed" || j.status === "cancelled") {
             if (this.session) this.session.latest_job = j;
             this.persist();
             return j;
@@ -347,6 +371,7 @@ export const useSeedDreamStore = defineStore("seeddream", {
         throw e;
       } finally {
         this.loadingJob = false;
+        this.upstreamDown = false;
       }
     },
 